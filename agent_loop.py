@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class StepEvent:
+    """
+    Timing record for one step of the agent loop: a model call ('model') or
+    a round of tool executions ('tools').
+    """
+
+    __slots__ = ("step", "kind", "seconds", "elapsed", "tokens", "detail")
+
+    def __init__(self, step: int, kind: str, seconds: float, elapsed: float,
+                 tokens: int = 0, detail: Optional[Dict[str, Any]] = None):
+        self.step = step
+        self.kind = kind
+        self.seconds = seconds
+        self.elapsed = elapsed
+        self.tokens = tokens
+        self.detail = detail or {}
+
+    def __repr__(self) -> str:
+        return (f"StepEvent(step={self.step}, kind={self.kind!r}, seconds={self.seconds:.3f}, "
+                f"elapsed={self.elapsed:.3f}, tokens={self.tokens})")
+
+
+class AgentLoop:
+    """
+    Budget for one user turn of the agent loop. The assistant drives the loop
+    iteratively and asks stop_reason() before every model call, so a long tool
+    chain runs in constant stack depth and is cut off once it exceeds the step
+    count, wall-clock deadline or token budget, or once cancel_event is set.
+    """
+
+    def __init__(self, max_steps: Optional[int] = None, deadline_seconds: Optional[float] = None,
+                 token_budget: Optional[int] = None,
+                 listeners: Optional[List[Callable[[StepEvent], None]]] = None,
+                 cancel_event: Optional[threading.Event] = None):
+        self.max_steps = max_steps
+        self.deadline_seconds = deadline_seconds
+        self.token_budget = token_budget
+        self.listeners = listeners if listeners is not None else []
+        self.cancel_event = cancel_event
+        self.steps = 0
+        self.tokens = 0
+        self.started_at = time.perf_counter()
+
+    @classmethod
+    def from_config(cls, config, listeners=None, cancel_event=None) -> "AgentLoop":
+        return cls(
+            max_steps=getattr(config, 'MAX_AGENT_STEPS', None),
+            deadline_seconds=getattr(config, 'AGENT_DEADLINE_SECONDS', None),
+            token_budget=getattr(config, 'AGENT_TOKEN_BUDGET', None),
+            listeners=listeners,
+            cancel_event=cancel_event
+        )
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def stop_reason(self) -> Optional[str]:
+        """Return why the loop must stop before the next model call, or None to continue."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return "cancelled"
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            return f"step limit of {self.max_steps} reached"
+        if self.deadline_seconds is not None and self.elapsed >= self.deadline_seconds:
+            return f"deadline of {self.deadline_seconds:g}s reached"
+        if self.token_budget is not None and self.tokens >= self.token_budget:
+            return f"token budget of {self.token_budget:,} reached"
+        return None
+
+    def record(self, kind: str, seconds: float, tokens: int = 0, **detail) -> StepEvent:
+        """
+        Record a finished model call or tool round and emit its StepEvent.
+        Each model call counts as a step.
+        """
+        if kind == 'model':
+            self.steps += 1
+        self.tokens += tokens
+        event = StepEvent(self.steps, kind, seconds, self.elapsed, tokens, detail)
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as listener_err:
+                logging.error(f"Step listener failed: {str(listener_err)}")
+        return event
@@ -0,0 +1,388 @@
+import asyncio
+import collections
+import email.utils
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import anthropic
+
+# Status codes worth retrying: timeout, conflict, rate limited, server errors and 529 overloaded
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+# Error types the API reports inside a stream, where the HTTP status was already 200
+RETRYABLE_ERROR_TYPES = {'overloaded_error', 'rate_limit_error', 'api_error'}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for transient API errors: connection problems, 429, 5xx and 529 overloaded."""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code in RETRYABLE_STATUS:
+            return True
+        return error_type(error) in RETRYABLE_ERROR_TYPES
+    return False
+
+
+def error_type(error: BaseException) -> Optional[str]:
+    """The API error type (e.g. 'overloaded_error') from an error's body, if present."""
+    body = getattr(error, 'body', None)
+    if isinstance(body, dict):
+        inner = body.get('error', body)
+        if isinstance(inner, dict):
+            return inner.get('type')
+    return None
+
+
+def error_reason(error: BaseException) -> str:
+    """Short label for metrics: the status code, or 'connection'."""
+    if isinstance(error, anthropic.APIStatusError):
+        return str(error.status_code)
+    if isinstance(error, anthropic.APIConnectionError):
+        return 'connection'
+    return type(error).__name__
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms or retry-after."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Neither seconds nor an HTTP-date; fall back to our own backoff
+        return None
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that never waits less than retry-after."""
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        server_delay = retry_after(error) if error is not None else None
+        if server_delay is not None:
+            return min(self.max_delay, max(server_delay, backoff))
+        return backoff
+
+
+class RateLimiter:
+    """
+    Client-side token bucket shared by every session in the process. A 429
+    from the server pauses all callers for its retry-after period.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        self.rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self.capacity = max(1.0, self.rate * 10) if self.rate else 0.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a slot and return how many seconds the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            wait_for = max(0.0, self.paused_until - now)
+            if self.rate is None:
+                return wait_for
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait_for = max(wait_for, -self.tokens / self.rate)
+            return wait_for
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for the given number of seconds."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies, used to decide when to hedge."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = collections.deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        """95th percentile latency, or None until enough samples are collected."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class ResilienceMetrics:
+    """Process-wide counters for API calls, retries and hedged requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.retries: Dict[str, int] = collections.Counter()
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.throttled_seconds = 0.0
+
+    def count(self, name: str, amount=1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def count_retry(self, reason: str) -> None:
+        with self._lock:
+            self.retries[reason] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': dict(self.retries),
+                'hedges_fired': self.hedges_fired,
+                'hedge_wins': self.hedge_wins,
+                'throttled_seconds': round(self.throttled_seconds, 3)
+            }
+
+
+# Shared by every ResilientAPI built from the config so all sessions honour one limit
+_shared_limiter: Optional[RateLimiter] = None
+_shared_latency = LatencyTracker()
+_shared_metrics = ResilienceMetrics()
+_shared_lock = threading.Lock()
+# Hedged calls from every session run on one pool; threads only start once a call is hedged
+HEDGE_WORKERS = 8
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+
+
+def shared_rate_limiter(requests_per_minute: Optional[float]) -> RateLimiter:
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(requests_per_minute)
+        return _shared_limiter
+
+
+def hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _shared_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='api-hedge')
+        return _hedge_executor
+
+
+class ResilientAPI:
+    """
+    Wraps model API calls with rate limiting, retries and optional hedging.
+
+    Transient errors (connection failures, 429, 5xx, 529 overloaded) are retried
+    with jittered exponential backoff that respects retry-after. With hedging
+    enabled, a call still running after the observed p95 latency gets a
+    duplicate request, and whichever finishes first wins. Hedging trades extra
+    billed tokens for lower tail latency, so it's off by default and never used
+    for streamed calls. The losing request is cancelled where possible; if it
+    completes anyway, its response is passed to on_discarded so its tokens can
+    still be billed.
+    """
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, limiter: Optional[RateLimiter] = None,
+                 hedging: bool = False, latency: Optional[LatencyTracker] = None,
+                 metrics: Optional[ResilienceMetrics] = None):
+        self.policy = policy or RetryPolicy()
+        self.limiter = limiter or RateLimiter(None)
+        self.hedging = hedging
+        self.latency = latency or LatencyTracker()
+        self.metrics = metrics or ResilienceMetrics()
+
+    @classmethod
+    def from_config(cls, config) -> "ResilientAPI":
+        latency = _shared_latency
+        latency.min_samples = getattr(config, 'HEDGE_MIN_SAMPLES', 20)
+        return cls(
+            policy=RetryPolicy(
+                max_retries=getattr(config, 'API_MAX_RETRIES', 5),
+                base_delay=getattr(config, 'API_RETRY_BASE_DELAY', 1.0),
+                max_delay=getattr(config, 'API_RETRY_MAX_DELAY', 60.0)
+            ),
+            limiter=shared_rate_limiter(getattr(config, 'API_REQUESTS_PER_MINUTE', None)),
+            hedging=getattr(config, 'ENABLE_HEDGED_REQUESTS', False),
+            latency=latency,
+            metrics=_shared_metrics
+        )
+
+    def call(self, func: Callable[[], Any], can_retry: Optional[Callable[[], bool]] = None,
+             hedge: bool = True, on_discarded: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        Run a blocking API call with retries. can_retry, if given, is checked
+        before each retry; streaming callers use it to stop retrying once output
+        has been shown. on_discarded receives the response of a hedged duplicate
+        that lost the race but still completed.
+        """
+        attempt = 0
+        while True:
+            self._throttle(time.sleep)
+            try:
+                return self._attempt(func, hedge, on_discarded)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def acall(self, factory: Callable[[], Awaitable[Any]],
+                    can_retry: Optional[Callable[[], bool]] = None, hedge: bool = True,
+                    on_discarded: Optional[Callable[[Any], None]] = None) -> Any:
+        """Async counterpart of call; factory returns a new awaitable for each attempt."""
+        attempt = 0
+        while True:
+            wait_for = self.limiter.reserve()
+            if wait_for:
+                self.metrics.count('throttled_seconds', wait_for)
+                await asyncio.sleep(wait_for)
+            try:
+                return await self._attempt_async(factory, hedge, on_discarded)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _throttle(self, sleep) -> None:
+        wait_for = self.limiter.reserve()
+        if wait_for:
+            self.metrics.count('throttled_seconds', wait_for)
+            sleep(wait_for)
+
+    def _should_retry(self, error: Exception, attempt: int, can_retry) -> Optional[float]:
+        """Return the delay before the next attempt, or None if the error should be raised."""
+        if (not is_retryable(error) or attempt >= self.policy.max_retries
+                or (can_retry is not None and not can_retry())):
+            self.metrics.count('failures')
+            return None
+        delay = self.policy.delay(attempt, error)
+        if isinstance(error, anthropic.APIStatusError) and error.status_code == 429:
+            self.limiter.pause(delay)
+        self.metrics.count_retry(error_reason(error))
+        logging.warning(f"API call failed ({error_reason(error)}), retrying in {delay:.1f}s: {str(error)}")
+        return delay
+
+    def _attempt(self, func: Callable[[], Any], hedge: bool, on_discarded=None) -> Any:
+        self.metrics.count('requests')
+        start_time = time.perf_counter()
+        threshold = self.latency.p95() if (self.hedging and hedge) else None
+        if threshold is None:
+            result = func()
+        else:
+            result = self._hedged(func, threshold, on_discarded)
+        self.latency.add(time.perf_counter() - start_time)
+        return result
+
+    def _hedged(self, func: Callable[[], Any], threshold: float, on_discarded=None) -> Any:
+        executor = hedge_executor()
+        primary = executor.submit(func)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        self.metrics.count('hedges_fired')
+        self.metrics.count('requests')
+        hedge = executor.submit(func)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.metrics.count('hedge_wins')
+                    loser = primary if future is hedge else hedge
+                    # A blocking request can't be interrupted; bill it once it finishes
+                    if not loser.cancel():
+                        loser.add_done_callback(lambda f: self._discard(f, on_discarded))
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _discard(future, on_discarded) -> None:
+        if on_discarded is None or future.cancelled() or future.exception() is not None:
+            return
+        try:
+            on_discarded(future.result())
+        except Exception as discard_err:
+            logging.error(f"Recording a discarded hedged response failed: {str(discard_err)}")
+
+    async def _attempt_async(self, factory: Callable[[], Awaitable[Any]], hedge: bool, on_discarded=None) -> Any:
+        self.metrics.count('requests')
+        start_time = time.perf_counter()
+        threshold = self.latency.p95() if (self.hedging and hedge) else None
+        if threshold is None:
+            result = await factory()
+        else:
+            result = await self._hedged_async(factory, threshold, on_discarded)
+        self.latency.add(time.perf_counter() - start_time)
+        return result
+
+    async def _hedged_async(self, factory: Callable[[], Awaitable[Any]], threshold: float,
+                            on_discarded=None) -> Any:
+        primary = asyncio.ensure_future(factory())
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result()
+
+        self.metrics.count('hedges_fired')
+        self.metrics.count('requests')
+        hedge = asyncio.ensure_future(factory())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics.count('hedge_wins')
+                        loser = primary if task is hedge else hedge
+                        if loser in done:
+                            # Both finished together; the loser was billed in full
+                            self._discard(loser, on_discarded)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancelling the task closes the losing request's connection
+            for task in pending:
+                task.cancel()
@@ -1,95 +1,248 @@
-from flask import Flask, render_template, request, jsonify, url_for
+from flask import Flask, Request, render_template, request, jsonify, url_for, Response, stream_with_context, g
 from ce3 import Assistant
-import os
-from werkzeug.utils import secure_filename
+from session_manager import SessionManager
+from job_queue import JobQueue, QueueFull, FINISHED
+from image_store import sniff_media_type
+import metrics
+import io
+import json
 import base64
 from config import Config
 
+class InMemoryUploadRequest(Request):
+    """Keep uploaded files in memory (bounded by MAX_CONTENT_LENGTH) instead of spooling them to disk."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 app = Flask(__name__, static_folder='static')
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.request_class = InMemoryUploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# Initialize the assistant
+# Initialize the assistant; every browser session gets its own conversation
+# that shares this assistant's API client and tools
 assistant = Assistant()
+sessions = SessionManager.from_config(Config, assistant.new_session)
+SESSION_COOKIE = getattr(Config, 'SESSION_COOKIE_NAME', 'ce3_session')
+# Chat messages run as background jobs on a bounded pool instead of on request threads
+jobs = JobQueue.from_config(Config)
+
+# Web layer state read at scrape time; the assistant records model, tool and turn metrics itself
+metrics.REGISTRY.gauge('ce3_jobs_queued', 'Chat jobs waiting for a worker.', callback=lambda: jobs.stats()['queued'])
+metrics.REGISTRY.gauge('ce3_jobs_running', 'Chat jobs being processed.', callback=lambda: jobs.stats()['running'])
+metrics.REGISTRY.gauge('ce3_job_wait_p95_seconds', '95th percentile queue wait of recent chat jobs.',
+                       callback=lambda: jobs.stats()['wait_p95'])
+metrics.REGISTRY.gauge('ce3_sessions', 'Open web sessions.', callback=lambda: len(sessions))
+metrics.REGISTRY.counter('ce3_api_retries_total', 'Messages API retries by reason.', ('reason',),
+                         callback=lambda: assistant.api.metrics.as_dict()['retries'])
+metrics.REGISTRY.counter('ce3_api_failures_total', 'Messages API calls that failed after all retries.',
+                         callback=lambda: assistant.api.metrics.as_dict()['failures'])
+
+def get_session():
+    """
+    Return the caller's session. A missing, expired or unknown cookie starts a
+    new session, and the response sets the cookie to its fresh id.
+    """
+    session_id = request.cookies.get(SESSION_COOKIE)
+    session = sessions.get(session_id)
+    if session.session_id != session_id:
+        g.new_session_id = session.session_id
+    return session
+
+@app.after_request
+def set_session_cookie(response):
+    new_session_id = g.pop('new_session_id', None)
+    if new_session_id:
+        response.set_cookie(SESSION_COOKIE, new_session_id, httponly=True, samesite='Lax')
+    return response
 
 @app.route('/')
 def home():
+    get_session()
     return render_template('index.html')
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    data = request.json
+def build_message_content(data):
+    """
+    Turn a /chat request body into message content: a string for text-only
+    messages or a list of image and text blocks. Images are referenced by the
+    image_id /upload returned; inline base64 in 'image' is still accepted.
+    """
     message = data.get('message', '')
-    image_data = data.get('image')  # Get the base64 image data
-    
-    # Prepare the message content
-    if image_data:
-        # Create a message with both text and image in correct order
-        message_content = [
-            {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/jpeg",  # We should detect this from the image
-                    "data": image_data.split(',')[1] if ',' in image_data else image_data  # Remove data URL prefix if present
-                }
+    image_block = None
+    if data.get('image_id'):
+        image_block = assistant.image_store.reference(data['image_id'])
+        if image_block is None:
+            raise ValueError("Unknown image id; upload the image again")
+        if not getattr(Config, 'ENABLE_IMAGE_STORE', False):
+            image_block = assistant.image_store.inline(image_block)
+    elif data.get('image'):
+        image_data = data['image']
+        image_data = image_data.split(',')[1] if ',' in image_data else image_data  # Remove data URL prefix if present
+        image_block = {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": sniff_media_type(base64.b64decode(image_data[:24])) or "image/jpeg",
+                "data": image_data
             }
-        ]
-        
-        # Only add text message if there is actual text
-        if message.strip():
-            message_content.append({
-                "type": "text",
-                "text": message
-            })
-    else:
-        # Text-only message
-        message_content = message
-    
-    try:
-        # Handle the chat message with the appropriate content
-        response = assistant.chat(message_content)
-        
-        # Get token usage from assistant
-        token_usage = {
-            'total_tokens': assistant.total_tokens_used,
-            'max_tokens': Config.MAX_CONVERSATION_TOKENS
         }
-        
-        # Get the last used tool from the conversation history
-        tool_name = None
-        if assistant.conversation_history:
-            for msg in reversed(assistant.conversation_history):
-                if msg.get('role') == 'assistant' and msg.get('content'):
-                    content = msg['content']
-                    if isinstance(content, list):
-                        for block in content:
-                            if isinstance(block, dict) and block.get('type') == 'tool_use':
-                                tool_name = block.get('name')
-                                break
-                    if tool_name:
-                        break
-        
-        return jsonify({
-            'response': response,
-            'thinking': False,
-            'tool_name': tool_name,
-            'token_usage': token_usage
+
+    if image_block is None:
+        # Text-only message
+        return message
+
+    # Image first, then the text if there is any
+    message_content = [image_block]
+    if message.strip():
+        message_content.append({
+            "type": "text",
+            "text": message
         })
-        
-    except Exception as e:
-        return jsonify({
-            'response': f"Error: {str(e)}",
-            'thinking': False,
-            'tool_name': None,
-            'token_usage': None
-        }), 200  # Return 200 even for errors to handle them gracefully in frontend
+    return message_content
+
+def get_token_usage(assistant):
+    return {
+        'total_tokens': assistant.total_tokens_used,
+        'max_tokens': Config.MAX_CONVERSATION_TOKENS,
+        **assistant.token_accounting.as_dict()
+    }
+
+def get_last_turn(assistant):
+    """Timing, tool and token summary of the latest message."""
+    turn = assistant.last_turn
+    return turn.as_dict() if turn else None
+
+def get_last_tool_name(assistant):
+    """Get the last tool used while answering the latest message."""
+    turn = assistant.last_turn
+    return turn.last_tool if turn else None
+
+def run_chat_job(session, message_content):
+    """
+    Build the job function that answers one message in the given session.
+    submit_chat_job admits one active job per session, so the job has the
+    session's assistant to itself without holding a lock on a pool worker.
+    """
+    def run(job):
+        try:
+            response = session.assistant.chat(message_content, on_event=job.on_event,
+                                              cancel_event=job.cancel_event)
+            result = {
+                'response': response,
+                'tool_name': get_last_tool_name(session.assistant),
+                'token_usage': get_token_usage(session.assistant),
+                'turn': get_last_turn(session.assistant)
+            }
+        except Exception as e:
+            result = {'response': f"Error: {str(e)}", 'tool_name': None, 'token_usage': None}
+        job.on_event({'type': 'done', **result})
+        return result
+    return run
+
+def submit_chat_job():
+    """
+    Queue the posted message; returns (job, None) or (None, error response).
+    A session with a message still queued or running gets 409 and the id of
+    that job, which it can wait for or cancel.
+    """
+    try:
+        message_content = build_message_content(request.json)
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    session = get_session()
+    with session.lock:
+        active = session.active_job
+        if active is not None:
+            return None, (jsonify({'error': 'A message is already being processed in this session',
+                                   'job_id': active.job_id}), 409)
+        try:
+            session.job = jobs.submit(run_chat_job(session, message_content), owner=session.session_id)
+        except QueueFull as e:
+            return None, (jsonify({'error': f"Server is busy: {str(e)}"}), 503)
+    return session.job, None
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    """
+    Queue a chat message and return its job id right away (202). Poll
+    /jobs/<job_id> for progress and the result fields /chat/stream sends in 'done'.
+    """
+    job, error = submit_chat_job()
+    if error:
+        return error
+    return jsonify({'job_id': job.job_id, 'status': job.status}), 202
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Server-Sent Events version of /chat. Emits 'text' events with response deltas,
+    'tool_start'/'tool_end' events around tool calls and a final 'done' event with
+    the same fields /jobs/<job_id> returns as 'result'. The message runs as a job,
+    whose id is sent first in a 'job' event so the client can cancel it.
+    """
+    job, error = submit_chat_job()
+    if error:
+        return error
+
+    def generate():
+        yield f"data: {json.dumps({'type': 'job', 'job_id': job.job_id})}\n\n"
+        sent = 0
+        while True:
+            events = job.wait_events(sent, timeout=15)
+            for event in events:
+                yield f"data: {json.dumps(event)}\n\n"
+            sent += len(events)
+            if job.status in FINISHED and sent == len(job.events):
+                if not job.events or job.events[-1]['type'] != 'done':
+                    # Cancelled before it started
+                    done = {'type': 'done', 'response': 'Cancelled.', 'tool_name': None, 'token_usage': None}
+                    yield f"data: {json.dumps(done)}\n\n"
+                break
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters, gauges and latency histograms in the Prometheus text format."""
+    if not getattr(Config, 'ENABLE_METRICS', True):
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Queue depth, running jobs and queue wait times, for sizing JOB_WORKERS."""
+    return jsonify({**jobs.stats(), 'sessions': sessions.stats()})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    Status, progress and (once finished) result of a job. Pass ?after=N to
+    also receive the job's events from index N on.
+    """
+    job = jobs.get(job_id, owner=request.cookies.get(SESSION_COOKIE))
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    after = request.args.get('after', type=int)
+    return jsonify(job.as_dict(events_after=after))
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id, owner=request.cookies.get(SESSION_COOKIE))
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify({'job_id': job.job_id, 'status': job.status})
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """
+    Store an uploaded image in the image store, scaled to the model's preferred
+    size, and return its image_id for /chat. The upload never touches disk
+    outside the store and isn't sent back to the browser.
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -97,33 +250,38 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Get the actual media type
-        media_type = file.content_type or 'image/jpeg'  # Default to jpeg if not detected
-        
-        # Convert image to base64
-        with open(filepath, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        # Clean up the file
-        os.remove(filepath)
-        
-        return jsonify({
-            'success': True,
-            'image_data': encoded_string,
-            'media_type': media_type
-        })
+    try:
+        # The real type comes from the file's magic bytes, not its name or headers
+        ref = assistant.image_store.put_upload(
+            file.stream.read(),
+            max_side=getattr(Config, 'UPLOAD_IMAGE_MAX_SIDE', 1568),
+            max_pixels=getattr(Config, 'UPLOAD_IMAGE_MAX_PIXELS', None)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({'error': 'Invalid file type'}), 400
+    return jsonify({
+        'success': True,
+        'image_id': ref['image_id'],
+        'media_type': ref['media_type']
+    })
 
 @app.route('/reset', methods=['POST'])
 def reset():
-    # Reset the assistant's conversation history
-    assistant.reset()
+    """
+    Reset this session's conversation history. A queued message is cancelled
+    first; a running one is cancelled and answered with 409, since it still
+    uses the conversation until its agent loop stops.
+    """
+    session = get_session()
+    with session.lock:
+        active = session.active_job
+        if active is not None:
+            jobs.cancel(active.job_id, owner=session.session_id)
+        if session.active_job is not None:
+            return jsonify({'error': 'A message is still being processed; it was cancelled, retry the reset',
+                            'job_id': active.job_id}), 409
+        session.assistant.reset()
     return jsonify({'status': 'success'})
 
 if __name__ == '__main__':
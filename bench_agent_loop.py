@@ -0,0 +1,173 @@
+# Agent loop benchmark against the local fake model server (no network needed)
+#
+# Usage: python bench_agent_loop.py [scenarios/tool_chain.json] [--turns N]
+#                                   [--mode cli|stream|web|ollama] [--concurrency N]
+#
+# The scenario's scripted latency is the time a real model would take; whatever
+# a turn takes beyond model calls and tool execution is framework overhead
+# (request building, accounting, display, dispatch). Web mode sends the turns
+# through the Flask app's job queue from --concurrency browser sessions.
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+from fake_model_server import FakeModelServer, Scenario
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_SCENARIO = BASE_DIR / 'scenarios' / 'tool_chain.json'
+
+
+def configure(config, server: FakeModelServer) -> None:
+    """Point a Config class at the fake server and keep the run quiet and offline."""
+    config.ANTHROPIC_API_KEY = config.ANTHROPIC_API_KEY or 'bench-placeholder-key'
+    config.ANTHROPIC_BASE_URL = server.base_url
+    config.OLLAMA_BASE_URL = server.base_url
+    config.SHOW_TOOL_USAGE = False
+    config.ENABLE_THINKING = False
+    config.SHOW_STEP_TIMINGS = False
+    config.DEPENDENCY_INSTALL_POLICY = 'never'
+
+
+def bench_cli(server: FakeModelServer, turns: int, stream: bool):
+    """Run turns through ce3.Assistant; returns one (wall, model, tools) tuple per turn."""
+    from config import Config
+    configure(Config, server)
+    import ce3
+
+    assistant = ce3.Assistant()
+    assistant.console.quiet = True
+    results = []
+    for turn in range(turns):
+        assistant.reset()
+        start = time.perf_counter()
+        assistant.chat(f"Benchmark turn {turn}", on_event=(lambda event: None) if stream else None)
+        wall = time.perf_counter() - start
+        record = assistant.last_turn
+        results.append((wall, record.model_seconds, record.tool_seconds))
+    return results
+
+
+def bench_ollama(server: FakeModelServer, turns: int):
+    """Run turns through ce3_ollama.Assistant; returns one (wall, model, tools) tuple per turn."""
+    from config_ollama import Config
+    configure(Config, server)
+    Config.MODEL = server.scenario.model
+    import ce3_ollama
+
+    assistant = ce3_ollama.Assistant()
+    assistant.console.quiet = True
+    timings = {'model': 0.0, 'tools': 0.0}
+
+    def collect(event):
+        timings[event.kind] += event.seconds
+
+    assistant.step_listeners.append(collect)
+    results = []
+    for turn in range(turns):
+        assistant.reset()
+        timings.update(model=0.0, tools=0.0)
+        start = time.perf_counter()
+        assistant.chat(f"Benchmark turn {turn}")
+        results.append((time.perf_counter() - start, timings['model'], timings['tools']))
+    return results
+
+
+def bench_web(server: FakeModelServer, turns: int, concurrency: int):
+    """Send turns through /chat and job polling from concurrent sessions; returns (latencies, wall, job stats)."""
+    from config import Config
+    configure(Config, server)
+    import app as webapp
+
+    webapp.assistant.console.quiet = True
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = webapp.app.test_client()
+        for turn in range(count):
+            start = time.perf_counter()
+            job = client.post('/chat', json={'message': f"Benchmark turn {turn}"}).json
+            while client.get(f"/jobs/{job['job_id']}").json['status'] not in ('done', 'failed', 'cancelled'):
+                time.sleep(0.01)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    per_worker = [turns // concurrency + (1 if i < turns % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(count,)) for count in per_worker if count]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start, webapp.jobs.stats()
+
+
+def ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}"
+
+
+def print_turn_table(console: Console, title: str, results) -> None:
+    table = Table(title=title)
+    table.add_column("Metric")
+    for column in ("mean (ms)", "p50 (ms)", "max (ms)"):
+        table.add_column(column, justify="right")
+    rows = {
+        'turn wall time': [r[0] for r in results],
+        'model calls': [r[1] for r in results],
+        'tool execution': [r[2] for r in results],
+        'framework overhead': [r[0] - r[1] - r[2] for r in results],
+    }
+    for name, values in rows.items():
+        table.add_row(name, ms(statistics.mean(values)), ms(statistics.median(values)), ms(max(values)))
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop offline against fake_model_server.py")
+    parser.add_argument('scenario', nargs='?', default=str(DEFAULT_SCENARIO), help="Scenario JSON file")
+    parser.add_argument('--turns', type=int, default=10, help="User turns to run (default: 10)")
+    parser.add_argument('--mode', choices=('cli', 'stream', 'web', 'ollama'), default='cli')
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent sessions in web mode (default: 4)")
+    args = parser.parse_args()
+
+    os.chdir(BASE_DIR)  # Scenario tool inputs use paths relative to the repository
+    sys.path.insert(0, str(BASE_DIR))
+    console = Console()
+    scenario = Scenario.load(args.scenario)
+    server = FakeModelServer(scenario).start()
+    console.print(f"[cyan]Scenario '{scenario.name}' served on {server.base_url}, {args.turns} turns, "
+                  f"mode {args.mode}[/cyan]")
+    try:
+        if args.mode == 'web':
+            latencies, wall, stats = bench_web(server, args.turns, args.concurrency)
+            table = Table(title=f"Web app, {args.concurrency} sessions, {stats['workers']} job workers")
+            table.add_column("Metric")
+            table.add_column("Value", justify="right")
+            ordered = sorted(latencies)
+            table.add_row("throughput (turns/s)", f"{len(latencies) / wall:.2f}")
+            table.add_row("turn latency p50 (ms)", ms(statistics.median(ordered)))
+            table.add_row("turn latency p95 (ms)", ms(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]))
+            table.add_row("queue wait mean (ms)", ms(stats['wait_mean']))
+            table.add_row("queue wait p95 (ms)", ms(stats['wait_p95']))
+            table.add_row("peak queue depth", str(stats['peak_depth']))
+            console.print(table)
+        elif args.mode == 'ollama':
+            print_turn_table(console, f"ce3_ollama.py, {args.turns} turns", bench_ollama(server, args.turns))
+        else:
+            results = bench_cli(server, args.turns, stream=args.mode == 'stream')
+            print_turn_table(console, f"ce3.py ({args.mode}), {args.turns} turns", results)
+        console.print(f"[dim]{server.requests} requests served[/dim]")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Startup benchmark: eager tool import vs. cold and warm schema manifest
+#
+# Usage: python bench_startup.py [--runs N]
+#
+# Each run starts a fresh interpreter so module import costs are not hidden
+# by sys.modules caching. Missing-dependency prompts are answered with 'n'.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+BASE_DIR = Path(__file__).parent
+
+RUN_SNIPPET = """
+import time
+start = time.perf_counter()
+from pathlib import Path
+from config import Config
+Config.LAZY_TOOL_LOADING = {lazy}
+Config.TOOL_MANIFEST_FILE = Path({manifest!r})
+Config.SHOW_TOOL_USAGE = False
+import ce3
+imported = time.perf_counter()
+assistant = ce3.Assistant()
+done = time.perf_counter()
+print(f"BENCH {{imported - start:.6f}} {{done - imported:.6f}} {{len(assistant.tools)}}")
+"""
+
+
+def run_once(lazy: bool, manifest_path: Path):
+    """Start a fresh interpreter, construct an Assistant and return its timings."""
+    env = dict(os.environ)
+    env.setdefault('ANTHROPIC_API_KEY', 'bench-placeholder-key')
+    result = subprocess.run(
+        [sys.executable, '-c', RUN_SNIPPET.format(lazy=lazy, manifest=str(manifest_path))],
+        input='n\n' * 50,
+        capture_output=True,
+        text=True,
+        cwd=BASE_DIR,
+        env=env
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith('BENCH '):
+            _, import_time, load_time, tool_count = line.split()
+            return float(import_time), float(load_time), int(tool_count)
+    raise RuntimeError(f"Benchmark run failed:\n{result.stdout}\n{result.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark assistant startup time")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per mode (default: 5)")
+    args = parser.parse_args()
+
+    console = Console()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manifest_path = Path(tmp_dir) / 'tool_manifest.json'
+
+        # (mode, lazy loading, delete manifest before each run)
+        modes = [
+            ('eager import', False, False),
+            ('cold manifest', True, True),
+            ('warm manifest', True, False),
+        ]
+
+        for mode, lazy, cold in modes:
+            console.print(f"[cyan]Running {mode}...[/cyan]")
+            if lazy and not cold:
+                run_once(True, manifest_path)  # Prime the manifest
+            runs = []
+            for _ in range(args.runs):
+                if cold and manifest_path.exists():
+                    manifest_path.unlink()
+                runs.append(run_once(lazy, manifest_path))
+            results[mode] = runs
+
+    table = Table(title=f"Assistant startup ({args.runs} runs per mode)")
+    table.add_column("Mode")
+    table.add_column("Tools", justify="right")
+    table.add_column("ce3 import (ms)", justify="right")
+    table.add_column("Tool load mean (ms)", justify="right")
+    table.add_column("Tool load min (ms)", justify="right")
+    table.add_column("Total mean (ms)", justify="right")
+
+    for mode, runs in results.items():
+        import_times = [r[0] * 1000 for r in runs]
+        load_times = [r[1] * 1000 for r in runs]
+        table.add_row(
+            mode,
+            str(runs[-1][2]),
+            f"{statistics.mean(import_times):.1f}",
+            f"{statistics.mean(load_times):.1f}",
+            f"{min(load_times):.1f}",
+            f"{statistics.mean(import_times) + statistics.mean(load_times):.1f}"
+        )
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+# Record/replay cassettes of assistant sessions
+#
+# Record: type 'record <name>' in the CLI ('record off' stops);
+# the session is written to CASSETTE_DIR/<name>.cassette.jsonl.gz.
+#
+# Replay: python cassette.py cassettes/<name>.cassette.jsonl.gz [--runs N]
+#
+# A cassette holds every user message, model request and response and tool
+# call with its output and timing. Replay answers model calls and tools from
+# the cassette, so it needs no network or tool side effects, checks that the
+# assistant dispatches the same tool calls with the same inputs, and reports
+# where the remaining (framework) time went.
+
+import argparse
+import collections
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Request fields that rarely change; written only when they differ from the previous request
+STICKY_FIELDS = ('tools', 'system')
+
+
+class CassetteMismatch(Exception):
+    """Replay dispatched a tool call the cassette doesn't have."""
+
+
+def describe_call(call: Dict[str, Any]) -> str:
+    return f"{call['name']}({json.dumps(call['input'])})"
+
+
+def to_jsonable(value: Any) -> Any:
+    """Plain JSON data for SDK objects, tool results and request kwargs."""
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def request_hash(request: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(to_jsonable(request), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def strip_blobs(value: Any) -> Any:
+    """Replace base64 image data with its hash; the hash is enough to tell requests apart."""
+    if isinstance(value, dict):
+        source = value.get('source')
+        if value.get('type') == 'image' and isinstance(source, dict) and source.get('type') == 'base64':
+            digest = hashlib.sha256(source.get('data', '').encode('utf-8')).hexdigest()
+            return {**value, 'source': {**source, 'data': f"sha256:{digest}"}}
+        return {key: strip_blobs(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [strip_blobs(item) for item in value]
+    return value
+
+
+def without_cache_control(message: Any) -> Any:
+    """A message without prompt caching breakpoints, which move from request to request."""
+    if not isinstance(message, dict) or not isinstance(message.get('content'), list):
+        return message
+    return {**message, 'content': [
+        {key: value for key, value in block.items() if key != 'cache_control'} if isinstance(block, dict) else block
+        for block in message['content']
+    ]}
+
+
+def prefix_key(message: Any) -> Any:
+    """
+    A message as compared between requests: without caching breakpoints, and
+    with text the breakpoint turned into a single text block back as a string.
+    """
+    message = without_cache_control(message)
+    content = message.get('content') if isinstance(message, dict) else None
+    if isinstance(content, list) and len(content) == 1 and content[0].get('type') == 'text' \
+            and set(content[0]) == {'type', 'text'}:
+        return {**message, 'content': content[0]['text']}
+    return message
+
+
+def common_prefix(first: List[Any], second: List[Any]) -> int:
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+class CassetteRecorder:
+    """
+    Appends session events to a gzipped JSON-lines cassette. Model requests
+    are stored as the messages added since the previous request plus any
+    changed fields, so a long session doesn't store its history again for
+    every call; the hash of the full request is kept for replay checks.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._last_messages: List[Any] = []
+        self._last_sticky: Dict[str, str] = {}
+        self._write({'type': 'meta', 'version': 1, 'created': time.time()})
+
+    def record_user(self, user_input: Any) -> None:
+        self._write({'type': 'user', 'input': to_jsonable(user_input)})
+
+    def record_model(self, request: Dict[str, Any], response: Any, seconds: float, stream: bool) -> None:
+        request = to_jsonable(request)
+        full_hash = request_hash(request)
+        messages = request.pop('messages', [])
+        messages = [prefix_key(message) for message in messages]
+        with self._lock:
+            # Within a session messages are mostly appended; store only what follows the shared prefix
+            start = common_prefix(self._last_messages, messages)
+            self._last_messages = messages
+            compact = {key: value for key, value in request.items() if key not in STICKY_FIELDS}
+            for key in STICKY_FIELDS:
+                if key in request:
+                    digest = request_hash(request[key])
+                    if self._last_sticky.get(key) != digest:
+                        compact[key] = request[key]
+                        self._last_sticky[key] = digest
+        self._write({
+            'type': 'model',
+            'hash': full_hash,
+            'messages_from': start,
+            'messages': strip_blobs(messages[start:]),
+            'request': compact,
+            'response': to_jsonable(response),
+            'seconds': round(seconds, 6),
+            'stream': stream
+        })
+
+    def record_tool(self, tool_use_id: str, name: str, tool_input: Any, output: Any, seconds: float) -> None:
+        self._write({
+            'type': 'tool',
+            'id': tool_use_id,
+            'name': name,
+            'input': to_jsonable(tool_input),
+            'output': to_jsonable(output),
+            'seconds': round(seconds, 6)
+        })
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, separators=(',', ':'), default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+
+class RecordingClient:
+    """Wraps an Anthropic client so every messages.create/stream call is written to a recorder."""
+
+    def __init__(self, client, recorder: CassetteRecorder):
+        self._client = client
+        self.messages = _RecordingMessages(client.messages, recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _RecordingMessages:
+    def __init__(self, messages, recorder: CassetteRecorder):
+        self._messages = messages
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+    def create(self, **request):
+        start_time = time.perf_counter()
+        response = self._messages.create(**request)
+        self._recorder.record_model(request, response, time.perf_counter() - start_time, stream=False)
+        return response
+
+    def stream(self, **request):
+        return _RecordingStream(self._messages.stream(**request), request, self._recorder)
+
+
+class _RecordingStream:
+    def __init__(self, manager, request, recorder: CassetteRecorder):
+        self._manager = manager
+        self._request = request
+        self._recorder = recorder
+        self._stream = None
+        self._start_time = None
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._manager.__exit__(*exc_info)
+
+    @property
+    def text_stream(self):
+        return self._stream.text_stream
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        self._recorder.record_model(self._request, message, time.perf_counter() - self._start_time, stream=True)
+        return message
+
+
+class AsyncRecordingClient(RecordingClient):
+    """RecordingClient for AsyncAnthropic: messages.create is awaited and streams are async."""
+
+    def __init__(self, client, recorder: CassetteRecorder):
+        self._client = client
+        self.messages = _AsyncRecordingMessages(client.messages, recorder)
+
+
+class _AsyncRecordingMessages(_RecordingMessages):
+    async def create(self, **request):
+        start_time = time.perf_counter()
+        response = await self._messages.create(**request)
+        self._recorder.record_model(request, response, time.perf_counter() - start_time, stream=False)
+        return response
+
+    def stream(self, **request):
+        return _AsyncRecordingStream(self._messages.stream(**request), request, self._recorder)
+
+
+class _AsyncRecordingStream(_RecordingStream):
+    async def __aenter__(self):
+        self._start_time = time.perf_counter()
+        self._stream = await self._manager.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._manager.__aexit__(*exc_info)
+
+    async def get_final_message(self):
+        message = await self._stream.get_final_message()
+        self._recorder.record_model(self._request, message, time.perf_counter() - self._start_time, stream=True)
+        return message
+
+
+class Cassette:
+    """The events of a recorded session, read back from a cassette file."""
+
+    def __init__(self, events: List[Dict[str, Any]]):
+        self.events = events
+
+    @classmethod
+    def load(cls, path) -> "Cassette":
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def of_type(self, event_type: str) -> List[Dict[str, Any]]:
+        return [event for event in self.events if event['type'] == event_type]
+
+    @property
+    def user_inputs(self) -> List[Any]:
+        return [event['input'] for event in self.of_type('user')]
+
+    @property
+    def model_seconds(self) -> float:
+        return sum(event['seconds'] for event in self.of_type('model'))
+
+    @property
+    def tool_seconds(self) -> float:
+        return sum(event['seconds'] for event in self.of_type('tool'))
+
+
+class CassettePlayer:
+    """
+    Serves a cassette back to an Assistant. Install it with
+    Assistant.start_replay(player): model calls are answered in recorded order
+    by player.client (player.async_client for AsyncAssistant), and tool calls are answered by tool_use id after their
+    name and input are checked against the recording. Once the next model
+    call is made (or finish is called), every tool call dispatched for a
+    model response is compared with the recorded sequence, so missing and
+    extra calls are caught too. Differences are collected in mismatches;
+    requests that differ from the recorded ones (e.g. after a prompt change)
+    are counted in request_drift.
+    """
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._responses = list(cassette.of_type('model'))
+        # Recorded calls per tool_use id, in order, in case an id was reused
+        self._tools: Dict[str, collections.deque] = collections.defaultdict(collections.deque)
+        for event in cassette.of_type('tool'):
+            self._tools[event['id']].append(event)
+        # Recorded and dispatched tool calls, grouped by the model response that requested them
+        self._exchanges: List[List[Dict[str, Any]]] = []
+        for event in cassette.events:
+            if event['type'] == 'model':
+                self._exchanges.append([])
+            elif event['type'] == 'tool' and self._exchanges:
+                self._exchanges[-1].append(event)
+        self._dispatched: List[List[Dict[str, Any]]] = [[] for _ in self._exchanges]
+        self._checked = 0
+        self._next_response = 0
+        self._lock = threading.Lock()
+        self.mismatches: List[str] = []
+        self.request_drift = 0
+        self.client = _ReplayClient(self)
+        self.async_client = _AsyncReplayClient(self)
+
+    def next_response(self, request: Dict[str, Any]):
+        from anthropic.types import Message
+
+        with self._lock:
+            if self._next_response >= len(self._responses):
+                raise CassetteMismatch(f"Model call {self._next_response + 1} is not in the cassette")
+            event = self._responses[self._next_response]
+            self._check_exchanges(self._next_response)
+            self._next_response += 1
+            if request_hash(request) != event['hash']:
+                self.request_drift += 1
+        return Message.model_validate(event['response'])
+
+    def tool_result(self, tool_use_id: str, name: str, tool_input: Any) -> Any:
+        with self._lock:
+            if self._next_response:
+                self._dispatched[self._next_response - 1].append(
+                    {'id': tool_use_id, 'name': name, 'input': to_jsonable(tool_input)})
+            recorded = self._tools.get(tool_use_id)
+            event = recorded.popleft() if recorded else None
+        if event is None or event['name'] != name or event['input'] != to_jsonable(tool_input):
+            expected = describe_call(event) if event else "no call"
+            mismatch = (f"Tool call {tool_use_id}: dispatched "
+                        f"{describe_call({'name': name, 'input': to_jsonable(tool_input)})}, recorded {expected}")
+            with self._lock:
+                self.mismatches.append(mismatch)
+            raise CassetteMismatch(mismatch)
+        return event['output']
+
+    def finish(self) -> List[str]:
+        """Check the tool calls of the last model response served and return all mismatches."""
+        with self._lock:
+            self._check_exchanges(self._next_response)
+            return list(self.mismatches)
+
+    @property
+    def finished(self) -> bool:
+        return self._next_response == len(self._responses)
+
+    def _check_exchanges(self, upto: int) -> None:
+        """Compare dispatched and recorded tool calls of the responses before upto; needs _lock."""
+        for index in range(self._checked, upto):
+            # Parallel tools finish in any order; compare in the order the response requested them
+            order = {block.get('id'): position for position, block
+                     in enumerate(self._responses[index]['response'].get('content') or [])}
+            recorded = sorted(({key: event[key] for key in ('id', 'name', 'input')}
+                               for event in self._exchanges[index]), key=lambda call: order.get(call['id'], len(order)))
+            dispatched = sorted(self._dispatched[index], key=lambda call: order.get(call['id'], len(order)))
+            if dispatched == recorded:
+                continue
+            missing = [call for call in recorded if call not in dispatched]
+            extra = [call for call in dispatched if call not in recorded]
+            details = [f"dispatched {len(dispatched)} tool calls, recorded {len(recorded)}"]
+            if missing:
+                details.append("missing " + ", ".join(describe_call(call) for call in missing))
+            if extra:
+                details.append("extra " + ", ".join(describe_call(call) for call in extra))
+            if not (missing or extra):
+                details.append("in a different order")
+            self.mismatches.append(f"Model response {index + 1}: {'; '.join(details)}")
+        self._checked = max(self._checked, upto)
+
+
+class _ReplayClient:
+    def __init__(self, player: CassettePlayer):
+        self.messages = _ReplayMessages(player)
+
+
+class _ReplayMessages:
+    def __init__(self, player: CassettePlayer):
+        self._player = player
+
+    def create(self, **request):
+        return self._player.next_response(request)
+
+    def stream(self, **request):
+        return _ReplayStream(self._player.next_response(request))
+
+
+class _ReplayStream:
+    def __init__(self, message):
+        self._message = message
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        for block in self._message.content:
+            if block.type == 'text':
+                yield block.text
+
+    def get_final_message(self):
+        return self._message
+
+
+class _AsyncReplayClient:
+    def __init__(self, player: CassettePlayer):
+        self.messages = _AsyncReplayMessages(player)
+
+
+class _AsyncReplayMessages:
+    def __init__(self, player: CassettePlayer):
+        self._player = player
+
+    async def create(self, **request):
+        return self._player.next_response(request)
+
+    def stream(self, **request):
+        return _AsyncReplayStream(self._player.next_response(request))
+
+
+class _AsyncReplayStream(_ReplayStream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for block in self._message.content:
+            if block.type == 'text':
+                yield block.text
+
+    async def get_final_message(self):
+        return self._message
+
+
+def replay(path, runs: int = 1, stream: bool = False):
+    """Replay a cassette runs times; returns the cassette and (player, wall seconds, phase seconds) per run."""
+    import io
+    from rich.console import Console
+    from config import Config
+    Config.DEPENDENCY_INSTALL_POLICY = 'never'
+    Config.ANTHROPIC_API_KEY = Config.ANTHROPIC_API_KEY or 'replay-placeholder-key'
+    from ce3 import Assistant
+
+    cassette = Cassette.load(path)
+    prototype = None
+    results = []
+    for _ in range(runs):
+        player = CassettePlayer(cassette)
+        assistant = prototype.new_session() if prototype else Assistant(client=player.client)
+        prototype = prototype or assistant
+        assistant.client = player.client
+        # Render displays as usual so their cost is measured, but don't show them
+        assistant.console = Console(file=io.StringIO(), width=120)
+        assistant.start_replay(player)
+        start_time = time.perf_counter()
+        for user_input in cassette.user_inputs:
+            assistant.chat(user_input, on_event=(lambda event: None) if stream else None)
+        player.finish()
+        results.append((player, time.perf_counter() - start_time, assistant.phase_timer.as_dict()))
+    return cassette, results
+
+
+def main():
+    from rich.console import Console
+    from rich.table import Table
+
+    parser = argparse.ArgumentParser(description="Replay a recorded session and report framework overhead")
+    parser.add_argument('cassette', help="Cassette file written by the 'record' command")
+    parser.add_argument('--runs', type=int, default=3, help="Replays to time (default: 3)")
+    parser.add_argument('--stream', action='store_true', help="Replay through the streaming code path")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).parent))
+    console = Console()
+    cassette, results = replay(args.cassette, args.runs, args.stream)
+
+    table = Table(title=f"Replay of {os.path.basename(args.cassette)}: "
+                        f"{len(cassette.user_inputs)} turns, {len(cassette.of_type('model'))} model calls, "
+                        f"{len(cassette.of_type('tool'))} tool calls")
+    table.add_column("Phase")
+    table.add_column("Mean (ms)", justify="right")
+    table.add_column("Share", justify="right")
+    walls = [wall for _, wall, _ in results]
+    mean_wall = sum(walls) / len(walls)
+    phases = sorted({name for _, _, timings in results for name in timings})
+    for name in phases:
+        mean = sum(timings.get(name, 0.0) for _, _, timings in results) / len(results)
+        table.add_row(name, f"{mean * 1000:.1f}", f"{mean / mean_wall:.0%}" if mean_wall else "-")
+    table.add_row("[bold]replay wall time[/bold]", f"{mean_wall * 1000:.1f}", "100%")
+    console.print(table)
+    console.print(f"[dim]Recorded session: {cassette.model_seconds:.2f}s in model calls, "
+                  f"{cassette.tool_seconds:.2f}s in tools; replay runs: "
+                  + ", ".join(f"{wall * 1000:.0f}ms" for wall in walls) + "[/dim]")
+
+    player = results[-1][0]
+    if player.request_drift:
+        console.print(f"[yellow]{player.request_drift} model requests differ from the recording "
+                      "(prompt or history building changed)[/yellow]")
+    if not player.finished:
+        console.print("[yellow]Replay made fewer model calls than the recording[/yellow]")
+    if player.mismatches:
+        for mismatch in player.mismatches:
+            console.print(f"[bold red]{mismatch}[/bold red]")
+        sys.exit(1)
+    console.print("[green]Tool dispatch matches the recording.[/green]")
+
+
+if __name__ == '__main__':
+    main()
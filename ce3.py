@@ -5,17 +5,36 @@ from rich.markdown import Markdown
 from rich.live import Live
 from rich.spinner import Spinner
 from rich.panel import Panel
-from typing import List, Dict, Any
+from rich.table import Table
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import importlib
-import inspect
+import io
 import pkgutil
 import os
 import json
+import re
 import sys
+import time
 import logging
+from pathlib import Path
 
 from config import Config
-from tools.base import BaseTool
+from agent_loop import AgentLoop, StepEvent
+from api_resilience import ResilientAPI
+from cassette import CassetteRecorder, RecordingClient
+from context_manager import ContextManager, estimate_content_tokens, estimate_tokens
+from dependency_resolver import DependencyResolver
+from image_store import ImageStore
+import metrics
+from profiling import TurnProfiler, render_profile
+from spill_store import SpillStore
+from token_accounting import TokenAccounting
+from tool_cache import ToolCache, looks_like_error
+from tool_registry import ToolChangeDetector, ToolManifest, ToolRegistry, find_tool_classes
+from tracing import Tracer, render_timeline
+from turn_records import PhaseTimer, TurnRecord, normalize_content
 from prompt_toolkit import prompt
 from prompt_toolkit.styles import Style
 from prompts.system_prompts import SystemPrompts
@@ -36,46 +55,91 @@ class Assistant:
     - Tool execution upon request from model responses.
     """
 
-    def __init__(self):
+    def __init__(self, client=None, tool_registry: Optional[ToolRegistry] = None,
+                 tools: Optional[List[Dict[str, Any]]] = None):
+        """
+        client, tool_registry and tools may be passed in to share them with
+        another Assistant (see new_session); tools are loaded only when no
+        registry is given.
+        """
         if not getattr(Config, 'ANTHROPIC_API_KEY', None):
             raise ValueError("No ANTHROPIC_API_KEY found in environment variables")
 
-        # Initialize Anthropics client
-        self.client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
+        # Initialize Anthropics client; retries are handled by the ResilientAPI layer
+        self.client = client or anthropic.Anthropic(
+            api_key=Config.ANTHROPIC_API_KEY,
+            base_url=getattr(Config, 'ANTHROPIC_BASE_URL', None),
+            max_retries=0
+        )
+        self.api = ResilientAPI.from_config(Config)
 
         self.conversation_history: List[Dict[str, Any]] = []
         self.console = Console()
 
         self.thinking_enabled = getattr(Config, 'ENABLE_THINKING', False)
         self.temperature = getattr(Config, 'DEFAULT_TEMPERATURE', 0.7)
-        self.total_tokens_used = 0
-
-        self.tools = self._load_tools()
-
-    def _execute_uv_install(self, package_name: str) -> bool:
+        self.token_accounting = TokenAccounting.from_config(Config)
+        self.context_manager = ContextManager.from_config(
+            Config, summarizer=self._summarize_history, accounting=self.token_accounting
+        )
+        # (turn, history length) of the last compaction that found nothing to remove
+        self._compaction_noop = None
+        self.spill_store = SpillStore.from_config(Config)
+        self.image_store = ImageStore.from_config(Config)
+        if getattr(Config, 'SPILL_MAX_AGE_HOURS', None):
+            self.spill_store.prune(Config.SPILL_MAX_AGE_HOURS * 3600)
+        self.image_store.prune()
+
+        # Live tool instances keyed by name; rebuilt by _load_tools and patched by refresh_tools
+        self.tool_registry = tool_registry if tool_registry is not None else ToolRegistry()
+        self.tool_changes = ToolChangeDetector()
+        self._failed_tool_modules = set()
+        self.tool_import_report = []
+        self._tool_executor = None  # Created on the first parallel tool round
+        self.tool_cache = ToolCache(getattr(Config, 'TOOL_CACHE_MAX_ENTRIES', 256))
+
+        # Callables receiving a StepEvent after every model call and tool round
+        self.step_listeners = [self._display_step_event, self._record_turn_step]
+        # One TurnRecord per user message, the latest last
+        self.turns: List[TurnRecord] = []
+        self._current_turn: Optional[TurnRecord] = None
+        # Streaming event callback, only set while chat() is running
+        self._event_handler = None
+        # Set by a caller (e.g. a background job) to stop the current turn before its next model call
+        self._cancel_event = None
+        # Exclusive time per phase of the agent loop (serialize, model, tool, display, ...)
+        self.phase_timer = PhaseTimer()
+        # Nested spans per turn (model calls, tool calls, rendering), shown by the 'trace' command
+        self.tracer = Tracer.from_config(Config)
+        # Session cassette being written by 'record', or the CassettePlayer answering a replay
+        self.recorder: Optional[CassetteRecorder] = None
+        self.replayer = None
+        self.tools = tools if tool_registry is not None else self._load_tools()
+
+    def new_session(self) -> "Assistant":
         """
-        Execute the uvpackagemanager tool directly to install the missing package.
-        Returns True if installation seems successful (no errors in output), otherwise False.
+        Return an Assistant with its own conversation that shares this one's API
+        client, tool registry and tool list, so it starts without loading tools.
+        A 'refresh' in any session updates the shared tools for all of them.
+        Sessions also share the tool thread pool, so MAX_TOOL_WORKERS bounds
+        tool threads across all conversations rather than per conversation.
         """
-        class ToolUseMock:
-            name = "uvpackagemanager"
-            input = {
-                "command": "install",
-                "packages": [package_name]
-            }
-
-        result = self._execute_tool(ToolUseMock())
-        if "Error" not in result and "failed" not in result.lower():
-            self.console.print("[green]The package was installed successfully.[/green]")
-            return True
-        else:
-            self.console.print(f"[red]Failed to install {package_name}. Output:[/red] {result}")
-            return False
+        session = type(self)(client=self.client, tool_registry=self.tool_registry, tools=self.tools)
+        session.tool_changes = self.tool_changes
+        session._failed_tool_modules = self._failed_tool_modules
+        # Threads are only started on the first submit, so creating the pool here costs nothing
+        session._tool_executor = self._get_tool_executor()
+        return session
 
     def _load_tools(self) -> List[Dict[str, Any]]:
         """
-        Dynamically load all tool classes from the tools directory.
-        If a dependency is missing, prompt the user to install it via uvpackagemanager.
+        Dynamically load all tool classes from the tools directory and
+        rebuild the tool registry with one live instance per tool.
+        With LAZY_TOOL_LOADING, tools whose file hash matches the schema manifest
+        are registered from the manifest and only imported on their first call.
+        With PARALLEL_TOOL_IMPORT, the remaining modules are imported on a thread pool.
+        Missing dependencies are collected and installed in one batch at the end,
+        according to DEPENDENCY_INSTALL_POLICY.
         
         Returns:
             A list of tools (dicts) containing their 'name', 'description', and 'input_schema'.
@@ -87,94 +151,301 @@ class Assistant:
             self.console.print("[red]TOOLS_DIR not set in Config[/red]")
             return tools
 
-        # Clear cached tool modules for fresh import
+        # Clear cached tool modules and live instances for fresh import
         for module_name in list(sys.modules.keys()):
             if module_name.startswith('tools.') and module_name != 'tools.base':
                 del sys.modules[module_name]
+        self.tool_registry.clear()
+        self.tool_changes.reset()
+        self._failed_tool_modules = set()
 
         try:
-            for module_info in pkgutil.iter_modules([str(tools_path)]):
-                if module_info.name == 'base':
-                    continue
+            module_paths = self._scan_tool_modules(tools_path)
+            manifest = self._open_tool_manifest(tools_path)
 
-                # Attempt loading the tool module
-                try:
-                    module = importlib.import_module(f'tools.{module_info.name}')
-                    self._extract_tools_from_module(module, tools)
-                except ImportError as e:
-                    # Handle missing dependencies
-                    missing_module = self._parse_missing_dependency(str(e))
-                    self.console.print(f"\n[yellow]Missing dependency:[/yellow] {missing_module} for tool {module_info.name}")
-                    user_response = input(f"Would you like to install {missing_module}? (y/n): ").lower()
-
-                    if user_response == 'y':
-                        success = self._execute_uv_install(missing_module)
-                        if success:
-                            # Retry loading the module after installation
-                            try:
-                                module = importlib.import_module(f'tools.{module_info.name}')
-                                self._extract_tools_from_module(module, tools)
-                            except Exception as retry_err:
-                                self.console.print(f"[red]Failed to load tool after installation: {str(retry_err)}[/red]")
-                        else:
-                            self.console.print(f"[red]Installation of {missing_module} failed. Skipping this tool.[/red]")
-                    else:
-                        self.console.print(f"[yellow]Skipping tool {module_info.name} due to missing dependency[/yellow]")
-                except Exception as mod_err:
-                    self.console.print(f"[red]Error loading module {module_info.name}:[/red] {str(mod_err)}")
+            module_hashes = {
+                module_name: self.tool_changes.record(module_name, module_path)
+                for module_name, module_path in module_paths.items()
+            }
+            self.tool_import_report = []
+            tools.extend(self._load_tool_modules(module_hashes, manifest))
+            if getattr(Config, 'SHOW_TOOL_IMPORT_REPORT', False):
+                self.display_import_report()
+
+            if manifest is not None:
+                manifest.prune(module_paths)
+                manifest.save()
         except Exception as overall_err:
             self.console.print(f"[red]Error in tool loading process:[/red] {str(overall_err)}")
 
         return tools
 
-    def _parse_missing_dependency(self, error_str: str) -> str:
+    def _load_tool_modules(self, module_hashes: Dict[str, str], manifest,
+                           resolver: Optional[DependencyResolver] = None) -> List[Dict[str, Any]]:
+        """
+        Load tool modules, from the manifest when their hash is known, and register
+        their tools. Modules that need importing are imported first (in parallel if
+        enabled), then registered in directory order on the calling thread.
+        Modules with missing dependencies are retried once the resolver has installed them.
+        Returns the schemas of the tools provided by the loaded modules.
+        """
+        if resolver is None:
+            resolver = DependencyResolver(getattr(Config, 'DEPENDENCY_INSTALL_POLICY', 'prompt'), self.console)
+        tools = []
+        to_import = []
+
+        for module_name, file_hash in module_hashes.items():
+            # Serve schemas from the manifest when the tool file is unchanged
+            cached_schemas = manifest.lookup(module_name, file_hash) if manifest is not None else None
+            if cached_schemas is None:
+                to_import.append(module_name)
+                continue
+            for schema in cached_schemas:
+                self.tool_registry.register_lazy(schema, f'tools.{module_name}')
+                tools.append(schema)
+                self.console.print(f"[green]Loaded tool:[/green] {schema['name']}")
+            self.tool_import_report.append((module_name, 0.0, "manifest"))
+
+        for module_name, (module, error, seconds) in self._import_tool_modules(to_import).items():
+            if module is not None:
+                module_tools = []
+                self._extract_tools_from_module(module, module_tools)
+                tools.extend(module_tools)
+                self._failed_tool_modules.discard(module_name)
+                if manifest is not None:
+                    manifest.update(module_name, module_hashes[module_name], module_tools)
+                self.tool_import_report.append((module_name, seconds, "imported"))
+            elif isinstance(error, ImportError):
+                self._failed_tool_modules.add(module_name)
+                resolver.add(module_name, error)
+                self.tool_import_report.append((module_name, seconds, "missing dependency"))
+            else:
+                self._failed_tool_modules.add(module_name)
+                self.console.print(f"[red]Error loading module {module_name}:[/red] {str(error)}")
+                self.tool_import_report.append((module_name, seconds, "error"))
+
+        # Retry only the modules whose dependencies were just installed
+        retried = resolver.resolve()
+        if retried:
+            for module_name in retried:
+                sys.modules.pop(f'tools.{module_name}', None)
+            tools.extend(self._load_tool_modules(
+                {name: module_hashes[name] for name in retried}, manifest, resolver
+            ))
+        return tools
+
+    def _import_tool_modules(self, module_names: List[str]) -> Dict[str, tuple]:
         """
-        Parse the missing dependency name from an ImportError string.
+        Import tool modules and time each import.
+
+        Returns:
+            A dict keyed by module name, in the given order, of (module, error, seconds).
         """
-        if "No module named" in error_str:
-            parts = error_str.split("No module named")
-            missing_module = parts[-1].strip(" '\"")
+        def timed_import(module_name):
+            start_time = time.perf_counter()
+            try:
+                module = importlib.import_module(f'tools.{module_name}')
+                return module, None, time.perf_counter() - start_time
+            except Exception as import_err:
+                return None, import_err, time.perf_counter() - start_time
+
+        results = {}
+        if getattr(Config, 'PARALLEL_TOOL_IMPORT', False) and len(module_names) > 1:
+            workers = min(getattr(Config, 'TOOL_IMPORT_WORKERS', 8), len(module_names))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tool-import') as executor:
+                futures = {name: executor.submit(timed_import, name) for name in module_names}
+                results = {name: future.result() for name, future in futures.items()}
+
+            # Imports that tripped over each other (e.g. import lock deadlock detection)
+            # get one more sequential attempt
+            for module_name, (module, error, seconds) in results.items():
+                if module is None and not isinstance(error, ImportError):
+                    sys.modules.pop(f'tools.{module_name}', None)
+                    results[module_name] = timed_import(module_name)
         else:
-            missing_module = error_str
-        return missing_module
+            for module_name in module_names:
+                results[module_name] = timed_import(module_name)
+        return results
+
+    def display_import_report(self):
+        """
+        Print how long each tool module took to import during the last load, slowest first.
+        """
+        table = Table(title="Tool import times", title_justify="left")
+        table.add_column("Module", style="cyan")
+        table.add_column("Time (ms)", justify="right")
+        table.add_column("Status")
+        for module_name, seconds, status in sorted(self.tool_import_report, key=lambda row: -row[1]):
+            table.add_row(module_name, f"{seconds * 1000:.1f}", status)
+        self.console.print(table)
+
+    def _scan_tool_modules(self, tools_path) -> Dict[str, Path]:
+        """
+        Return the source file of every tool module in the tools directory, keyed by module name.
+        """
+        module_paths = {}
+        for module_info in pkgutil.iter_modules([str(tools_path)]):
+            if module_info.name == 'base':
+                continue
+            if module_info.ispkg:
+                module_paths[module_info.name] = Path(tools_path) / module_info.name / '__init__.py'
+            else:
+                module_paths[module_info.name] = Path(tools_path) / f"{module_info.name}.py"
+        return module_paths
+
+    def _open_tool_manifest(self, tools_path) -> Optional[ToolManifest]:
+        """
+        Return the schema manifest when lazy tool loading is enabled, otherwise None.
+        """
+        if not getattr(Config, 'LAZY_TOOL_LOADING', False):
+            return None
+        return ToolManifest(getattr(Config, 'TOOL_MANIFEST_FILE', Path(tools_path) / '.tool_manifest.json'))
 
     def _extract_tools_from_module(self, module, tools: List[Dict[str, Any]]) -> None:
         """
         Given a tool module, find and instantiate all tool classes (subclasses of BaseTool).
-        Append them to the 'tools' list.
+        Register each instance and append its schema to the 'tools' list.
         """
-        for name, obj in inspect.getmembers(module):
-            if (inspect.isclass(obj) and issubclass(obj, BaseTool) and obj != BaseTool):
-                try:
-                    tool_instance = obj()
-                    tools.append({
-                        "name": tool_instance.name,
-                        "description": tool_instance.description,
-                        "input_schema": tool_instance.input_schema
-                    })
-                    self.console.print(f"[green]Loaded tool:[/green] {tool_instance.name}")
-                except Exception as tool_init_err:
-                    self.console.print(f"[red]Error initializing tool {name}:[/red] {str(tool_init_err)}")
+        for obj in find_tool_classes(module):
+            try:
+                entry = self.tool_registry.register(obj(), module.__name__)
+                tools.append(entry.schema())
+                self.console.print(f"[green]Loaded tool:[/green] {entry.name}")
+            except Exception as tool_init_err:
+                self.console.print(f"[red]Error initializing tool {obj.__name__}:[/red] {str(tool_init_err)}")
 
-    def refresh_tools(self):
+    def refresh_tools(self) -> Dict[str, Any]:
         """
-        Refresh the list of tools and show newly discovered tools.
+        Reload only the tool modules that were added, modified or removed since the
+        last load (plus modules that previously failed to load), patch self.tools in
+        place and show what changed. Holds the tool registry lock throughout, since
+        the registry, tool list and tool modules are shared by every session.
+
+        Returns:
+            A report with the 'added', 'updated' and 'removed' tool names, the
+            reloaded 'modules' and the reload time in 'seconds'.
         """
-        current_tool_names = {tool['name'] for tool in self.tools}
-        self.tools = self._load_tools()
-        new_tool_names = {tool['name'] for tool in self.tools}
-        new_tools = new_tool_names - current_tool_names
+        start_time = time.perf_counter()
+        tools_path = getattr(Config, 'TOOLS_DIR', None)
+        report = {"added": [], "updated": [], "removed": [], "modules": [], "seconds": 0.0}
+
+        if tools_path is None:
+            self.console.print("[red]TOOLS_DIR not set in Config[/red]")
+            return report
 
-        if new_tools:
+        # New files written by toolcreator must be visible to the import system
+        importlib.invalidate_caches()
+
+        # Other sessions dispatch through the shared registry; they wait until the swap is done
+        with self.tool_registry.lock:
+            try:
+                module_paths = self._scan_tool_modules(tools_path)
+                added, modified, removed = self.tool_changes.detect(module_paths)
+                modified += [name for name in self._failed_tool_modules
+                             if name in module_paths and name not in added + modified]
+                report["modules"] = added + modified + removed
+
+                previous_names = {tool['name'] for tool in self.tools}
+                for module_name in modified + removed:
+                    self.tool_registry.unregister_module(f'tools.{module_name}')
+                    sys.modules.pop(f'tools.{module_name}', None)
+                    self._failed_tool_modules.discard(module_name)
+                for module_name in removed:
+                    self.tool_changes.forget(module_name)
+                if modified or removed:
+                    # Cached results may come from the old tool code
+                    self.tool_cache.clear()
+
+                manifest = self._open_tool_manifest(tools_path)
+                reloaded = {}
+                module_hashes = {
+                    module_name: self.tool_changes.record(module_name, module_paths[module_name])
+                    for module_name in added + modified
+                }
+                self.tool_import_report = []
+                for schema in self._load_tool_modules(module_hashes, manifest):
+                    reloaded[schema['name']] = schema
+                    if schema['name'] in previous_names:
+                        report["updated"].append(schema['name'])
+                if getattr(Config, 'SHOW_TOOL_IMPORT_REPORT', False) and self.tool_import_report:
+                    self.display_import_report()
+
+                if manifest is not None:
+                    manifest.prune(module_paths)
+                    manifest.save()
+
+                # Patch the shared tool list in one assignment, keeping the position of updated tools
+                tools = [reloaded.pop(tool['name'], tool) for tool in self.tools]
+                tools = [tool for tool in tools if tool['name'] in self.tool_registry]
+                self.tools[:] = tools + list(reloaded.values())
+
+                current_names = {tool['name'] for tool in self.tools}
+                report["added"] = [tool['name'] for tool in self.tools if tool['name'] not in previous_names]
+                report["removed"] = sorted(previous_names - current_names)
+            except Exception as refresh_err:
+                self.console.print(f"[red]Error refreshing tools:[/red] {str(refresh_err)}")
+
+        report["seconds"] = time.perf_counter() - start_time
+        self._display_refresh_report(report)
+        return report
+
+    def _display_refresh_report(self, report: Dict[str, Any]):
+        """
+        Print the tools added, updated and removed by refresh_tools and the reload time.
+        """
+        if not (report["added"] or report["updated"] or report["removed"]):
+            self.console.print("\n[yellow]No tool changes found[/yellow]")
+        else:
             self.console.print("\n")
-            for tool_name in new_tools:
+            for tool_name in report["added"]:
                 tool_info = next((t for t in self.tools if t['name'] == tool_name), None)
                 if tool_info:
                     description_lines = tool_info['description'].strip().split('\n')
                     formatted_description = '\n    '.join(line.strip() for line in description_lines)
                     self.console.print(f"[bold green]NEW[/bold green] 🔧 [cyan]{tool_name}[/cyan]:\n    {formatted_description}")
+            for tool_name in report["updated"]:
+                self.console.print(f"[bold yellow]UPDATED[/bold yellow] 🔧 [cyan]{tool_name}[/cyan]")
+            for tool_name in report["removed"]:
+                self.console.print(f"[bold red]REMOVED[/bold red] 🔧 [cyan]{tool_name}[/cyan]")
+
+        self.console.print(
+            f"[dim]Reloaded {len(report['modules'])} module(s) in {report['seconds'] * 1000:.0f} ms[/dim]"
+        )
+
+    def display_tool_stats(self):
+        """
+        Print how many times each tool has been dispatched through the registry.
+        Every call is one module import and one round of tool instantiation saved.
+        Also prints tool result cache hit ratios and the model API request, retry
+        and hedge counts.
+        """
+        counts = {name: calls for name, calls in self.tool_registry.call_counts().items() if calls}
+        self.console.print("\n[bold cyan]Tool calls this session:[/bold cyan]")
+        if counts:
+            for name, calls in sorted(counts.items(), key=lambda item: -item[1]):
+                self.console.print(f"🔧 [cyan]{name}[/cyan]: {calls}")
+            self.console.print(f"[dim]{sum(counts.values())} dispatches served from the tool registry[/dim]")
         else:
-            self.console.print("\n[yellow]No new tools found[/yellow]")
+            self.console.print("No tools have been called yet.")
+
+        cache_stats = {name: stats for name, stats in self.tool_cache.stats().items() if stats.hits or stats.misses}
+        if cache_stats:
+            self.console.print("\n[bold cyan]Tool result cache:[/bold cyan]")
+            for name, stats in sorted(cache_stats.items()):
+                self.console.print(
+                    f"💾 [cyan]{name}[/cyan]: {stats.hits} hits / {stats.misses} misses "
+                    f"({stats.hit_ratio:.0%}), {stats.saved_seconds:.2f}s saved, "
+                    f"{stats.invalidations} invalidated"
+                )
+
+        api = self.api.metrics.as_dict()
+        retries = ", ".join(f"{reason}: {count}" for reason, count in sorted(api['retries'].items()))
+        self.console.print(
+            f"\n[bold cyan]Model API:[/bold cyan] {api['requests']} requests, "
+            f"{sum(api['retries'].values())} retries{f' ({retries})' if retries else ''}, "
+            f"{api['failures']} failures, {api['hedges_fired']} hedges fired / {api['hedge_wins']} won"
+        )
+        self.console.print("\n---")
 
     def display_available_tools(self):
         """
@@ -197,11 +468,12 @@ class Assistant:
         if not getattr(Config, 'SHOW_TOOL_USAGE', False):
             return
 
-        # Clean up input data by removing any large binary/base64 content
-        cleaned_input = self._clean_data_for_display(input_data)
-        
-        # Clean up result data
-        cleaned_result = self._clean_data_for_display(result)
+        with self.tracer.span('clean_data', chars=len(result)):
+            # Clean up input data by removing any large binary/base64 content
+            cleaned_input = self._clean_data_for_display(input_data)
+
+            # Clean up result data
+            cleaned_result = self._clean_data_for_display(result)
 
         tool_info = f"""[cyan]📥 Input:[/cyan] {json.dumps(cleaned_input, indent=2)}
 [cyan]📤 Result:[/cyan] {cleaned_result}"""
@@ -213,7 +485,8 @@ class Assistant:
             border_style="cyan",
             padding=(1, 2)
         )
-        self.console.print(panel)
+        with self.tracer.span('render'):
+            self.console.print(panel)
 
     def _clean_data_for_display(self, data):
         """
@@ -261,59 +534,229 @@ class Assistant:
     def _execute_tool(self, tool_use):
         """
         Given a tool usage request (with tool name and inputs),
-        dynamically load and execute the corresponding tool.
+        look up the live tool instance in the registry and execute it.
         """
         tool_name = tool_use.name
         tool_input = tool_use.input or {}
         tool_result = None
+        outcome = 'error'
+        start_time = time.perf_counter()
 
         try:
-            module = importlib.import_module(f'tools.{tool_name}')
-            tool_instance = self._find_tool_instance_in_module(module, tool_name)
-
-            if not tool_instance:
+            # Only tools registered by the last load or refresh_tools can be dispatched
+            entry = self.tool_registry.get(tool_name)
+            if entry is not None and not entry.loaded and self.replayer is None:
+                # First call of a tool registered from the manifest
+                entry = self.tool_registry.load(tool_name)
+
+            if self.replayer is not None:
+                # Replaying a cassette: answer with the recorded output if the same call was recorded
+                with self._phase('tool', replayed=True):
+                    tool_result = self.replayer.tool_result(tool_use.id, tool_name, tool_input)
+                outcome = 'replayed'
+            elif entry is None:
                 tool_result = f"Tool not found: {tool_name}"
+                outcome = 'not_found'
             else:
                 # Execute the tool with the provided input
                 try:
-                    result = tool_instance.execute(**tool_input)
-                    # Keep structured data intact
-                    tool_result = result
+                    with self._phase('tool', cached=False) as span:
+                        tool_result = self._execute_cached(entry, tool_input, span)
+                    outcome = 'error' if looks_like_error(tool_result) else 'ok'
                 except Exception as exec_err:
                     tool_result = f"Error executing tool '{tool_name}': {str(exec_err)}"
         except ImportError:
             tool_result = f"Failed to import tool: {tool_name}"
         except Exception as e:
             tool_result = f"Error executing tool: {str(e)}"
+        seconds = time.perf_counter() - start_time
+        # Tool names come from the model; made-up ones share one label value
+        tool_label = tool_name if tool_name in self.tool_registry else 'unknown'
+        metrics.TOOL_SECONDS.observe(seconds, tool=tool_label)
+        metrics.TOOL_CALLS.inc(tool=tool_label, outcome=outcome)
+        if self.recorder is not None:
+            self.recorder.record_tool(tool_use.id, tool_name, tool_input, tool_result, seconds)
 
         # Display tool usage with proper handling of structured data
-        self._display_tool_usage(tool_name, tool_input, 
-            json.dumps(tool_result) if not isinstance(tool_result, str) else tool_result)
+        with self._phase('display'):
+            self._display_tool_usage(tool_name, tool_input,
+                json.dumps(tool_result) if not isinstance(tool_result, str) else tool_result)
         return tool_result
 
-    def _find_tool_instance_in_module(self, module, tool_name: str):
+    def _execute_cached(self, entry, tool_input: Dict[str, Any], span=None):
         """
-        Search a given module for a tool class matching tool_name and return an instance of it.
+        Execute a loaded tool through the result cache. Tools with a cache_policy
+        are answered from the cache while their entry is valid; file-mutating
+        tools drop cached results for the paths they touch.
         """
-        for name, obj in inspect.getmembers(module):
-            if (inspect.isclass(obj) and issubclass(obj, BaseTool) and obj != BaseTool):
-                candidate_tool = obj()
-                if candidate_tool.name == tool_name:
-                    return candidate_tool
-        return None
+        tool = entry.instance
+        use_cache = getattr(Config, 'ENABLE_TOOL_CACHE', False)
+        if use_cache:
+            hit, result = self.tool_cache.lookup(tool, tool_input)
+            if hit:
+                if span is not None:
+                    span.set(cached=True)
+                return result
+
+        start_time = time.perf_counter()
+        try:
+            result = self.tool_registry.execute(entry.name, tool_input)
+        finally:
+            if use_cache and tool.mutates_files:
+                try:
+                    self.tool_cache.invalidate([os.path.abspath(p) for p in tool.affected_paths(**tool_input)])
+                except Exception:
+                    # Without known paths, drop everything the call might have changed
+                    self.tool_cache.clear()
+        if use_cache:
+            self.tool_cache.store(tool, tool_input, result, time.perf_counter() - start_time)
+        return result
+
+    def _execute_tool_calls(self, tool_uses) -> List[Dict[str, Any]]:
+        """
+        Execute the tool_use blocks of one model response and return their
+        tool_result blocks in the original order. With PARALLEL_TOOL_EXECUTION,
+        independent calls run on a bounded thread pool; calls that touch the same
+        path as a file-mutating call stay serial, in their original order.
+        """
+        results = [None] * len(tool_uses)
+        durations = [0.0] * len(tool_uses)
+
+        parent_span = self.tracer.current()
+
+        def run_group(indexes):
+            # Tool spans from pool threads belong under this turn's dispatch span
+            with self.tracer.attach(parent_span):
+                for index in indexes:
+                    results[index], durations[index] = self._run_tool_call(tool_uses[index])
+
+        start_time = time.perf_counter()
+        if getattr(Config, 'PARALLEL_TOOL_EXECUTION', False) and len(tool_uses) > 1:
+            groups = self._group_tool_calls(tool_uses)
+            executor = self._get_tool_executor()
+            for future in [executor.submit(run_group, group) for group in groups]:
+                future.result()
+            self._display_parallel_savings(len(tool_uses), len(groups), time.perf_counter() - start_time, durations)
+        else:
+            run_group(range(len(tool_uses)))
+
+        with self._phase('serialize'):
+            return self._build_tool_results(tool_uses, results)
+
+    def _run_tool_call(self, tool_use):
+        """Execute one tool call between tool_start and tool_end events; returns (result, seconds)."""
+        self._emit('tool_start', id=tool_use.id, name=tool_use.name)
+        start_time = time.perf_counter()
+        with self.tracer.span('tool_call', tool=tool_use.name):
+            result = self._execute_tool(tool_use)
+        seconds = time.perf_counter() - start_time
+        self._emit('tool_end', id=tool_use.id, name=tool_use.name, seconds=seconds)
+        return result, seconds
+
+    def _get_tool_executor(self) -> ThreadPoolExecutor:
+        if self._tool_executor is None:
+            self._tool_executor = ThreadPoolExecutor(
+                max_workers=getattr(Config, 'MAX_TOOL_WORKERS', 4),
+                thread_name_prefix='tool-call'
+            )
+        return self._tool_executor
+
+    def _display_parallel_savings(self, call_count: int, group_count: int, wall_time: float, durations):
+        serial_time = sum(durations)
+        self.console.print(
+            f"[dim]Ran {call_count} tools in {group_count} parallel group(s): "
+            f"{wall_time:.2f}s wall vs {serial_time:.2f}s sequential "
+            f"(saved {max(0.0, serial_time - wall_time):.2f}s)[/dim]"
+        )
+
+    def _build_tool_results(self, tool_uses, results) -> List[Dict[str, Any]]:
+        """Turn tool call results into tool_result blocks, in call order."""
+        tool_results = []
+        for tool_use, result in zip(tool_uses, results):
+            # Oversized results go to the spill store; the model pages through them
+            if getattr(Config, 'ENABLE_RESULT_SPILL', False) and tool_use.name != 'resultpagertool':
+                spilled = self.spill_store.spill(result)
+                if spilled is not None:
+                    result = spilled
+
+            # Handle structured data (like image blocks) vs text
+            if isinstance(result, (list, dict)):
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": tool_use.id,
+                    "content": self._intern_images(result)  # Keep structured data intact
+                })
+            else:
+                # Convert text results to proper content blocks
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": tool_use.id,
+                    "content": [{"type": "text", "text": str(result)}]
+                })
+        return tool_results
+
+    def _group_tool_calls(self, tool_uses) -> List[List[int]]:
+        """
+        Partition tool calls into groups that can run concurrently. Two calls end up
+        in the same group when they share a path and at least one of them mutates files.
+        Each group lists call indexes in their original order.
+        """
+        footprints = []
+        for tool_use in tool_uses:
+            paths, mutates = [], False
+            try:
+                entry = self.tool_registry.get(tool_use.name)
+                if entry is not None and not entry.loaded:
+                    entry = self.tool_registry.load(tool_use.name)
+                if entry is not None:
+                    mutates = entry.instance.mutates_files
+                    paths = [os.path.abspath(p) for p in entry.instance.affected_paths(**(tool_use.input or {}))]
+            except Exception:
+                # Unknown tools and bad inputs fail in _execute_tool; they touch no paths
+                pass
+            footprints.append((paths, mutates))
+
+        def conflicts(first, second):
+            (paths_a, mutates_a), (paths_b, mutates_b) = first, second
+            if not (mutates_a or mutates_b):
+                return False
+            return any(
+                a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+                for a in paths_a for b in paths_b
+            )
+
+        # Union-find over conflicting pairs
+        parent = list(range(len(tool_uses)))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        for i in range(len(tool_uses)):
+            for j in range(i + 1, len(tool_uses)):
+                if conflicts(footprints[i], footprints[j]):
+                    parent[find(j)] = find(i)
+
+        groups = {}
+        for index in range(len(tool_uses)):
+            groups.setdefault(find(index), []).append(index)
+        return list(groups.values())
 
     def _display_token_usage(self, usage):
         """
-        Display a visual representation of token usage and remaining tokens.
-        Uses only the tracked total_tokens_used.
+        Display a visual representation of context window usage and remaining
+        tokens, followed by the tokens billed so far and prompt cache activity.
         """
-        used_percentage = (self.total_tokens_used / Config.MAX_CONVERSATION_TOKENS) * 100
-        remaining_tokens = max(0, Config.MAX_CONVERSATION_TOKENS - self.total_tokens_used)
+        accounting = self.token_accounting
+        used_percentage = (accounting.context_tokens / Config.MAX_CONVERSATION_TOKENS) * 100
+        remaining_tokens = accounting.remaining_tokens
 
-        self.console.print(f"\nTotal used: {self.total_tokens_used:,} / {Config.MAX_CONVERSATION_TOKENS:,}")
+        self.console.print(f"\nContext: {accounting.context_tokens:,} / {Config.MAX_CONVERSATION_TOKENS:,}")
 
         bar_width = 40
-        filled = int(used_percentage / 100 * bar_width)
+        filled = min(bar_width, int(used_percentage / 100 * bar_width))
         bar = "█" * filled + "░" * (bar_width - filled)
 
         color = "green"
@@ -323,6 +766,19 @@ class Assistant:
             color = "red"
 
         self.console.print(f"[{color}][{bar}] {used_percentage:.1f}%[/{color}]")
+        self.console.print(
+            f"[dim]Billed over {accounting.requests} requests: {accounting.input_tokens:,} input, "
+            f"{accounting.output_tokens:,} output[/dim]"
+        )
+
+        if accounting.cache_read_tokens or accounting.cache_write_tokens:
+            cache_read = getattr(usage, 'cache_read_input_tokens', None) or 0
+            cache_write = getattr(usage, 'cache_creation_input_tokens', None) or 0
+            self.console.print(
+                f"[dim]Prompt cache: {cache_read:,} read / {cache_write:,} written this request "
+                f"({accounting.cache_read_tokens:,} / {accounting.cache_write_tokens:,} total, "
+                f"{accounting.cache_hit_ratio:.0%} of prompt tokens read from cache)[/dim]"
+            )
 
         if remaining_tokens < 20000:
             self.console.print(f"[bold red]Warning: Only {remaining_tokens:,} tokens remaining![/bold red]")
@@ -333,138 +789,496 @@ class Assistant:
         """
         Get a completion from the Anthropic API.
         Handles both text-only and multimodal messages.
+        Tool rounds are driven iteratively by an AgentLoop, which stops the chain
+        once it exceeds MAX_AGENT_STEPS, AGENT_DEADLINE_SECONDS or AGENT_TOKEN_BUDGET.
         """
+        loop = AgentLoop.from_config(Config, listeners=self.step_listeners, cancel_event=self._cancel_event)
+
         try:
-            response = self.client.messages.create(
-                model=Config.MODEL,
-                max_tokens=min(
-                    Config.MAX_TOKENS,
-                    Config.MAX_CONVERSATION_TOKENS - self.total_tokens_used
-                ),
-                temperature=self.temperature,
-                tools=self.tools,
-                messages=self.conversation_history,
-                system=f"{SystemPrompts.DEFAULT}\n\n{SystemPrompts.TOOL_USAGE}"
-            )
+            while True:
+                stop_reason = loop.stop_reason()
+                if stop_reason:
+                    self.console.print(f"\n[bold red]Agent loop stopped: {stop_reason}.[/bold red]")
+                    return (f"Stopped after {loop.steps} steps: {stop_reason}. "
+                            "Send another message to let me continue.")
+
+                with self._phase('compaction'):
+                    estimated_prompt = self._compact_history_if_needed()
+
+                with self._phase('serialize'):
+                    request, estimated_prompt = self._prepare_request(estimated_prompt)
+                if request is None:
+                    self.console.print("\n[bold red]Token limit reached! Please reset the conversation.[/bold red]")
+                    return "Token limit reached! Please type 'reset' to start a new conversation."
+
+                start_time = time.perf_counter()
+                with self._phase('model', model=Config.MODEL, step=loop.steps + 1) as model_span, \
+                        metrics.track(metrics.MODEL_REQUEST_SECONDS, metrics.MODEL_REQUESTS, model=Config.MODEL):
+                    response = self._create_message(**request)
+                model_seconds = time.perf_counter() - start_time
+
+                with self._phase('accounting'):
+                    message_tokens = self._record_response(response, estimated_prompt)
+                if model_span is not None:
+                    model_span.set(stop_reason=response.stop_reason, tokens=message_tokens)
+                loop.record('model', model_seconds, message_tokens, stop_reason=response.stop_reason)
+
+                if response.stop_reason == "tool_use":
+                    self.console.print("\n[bold yellow]  Handling Tool Use...[/bold yellow]\n")
+
+                    if getattr(response, 'content', None) and isinstance(response.content, list):
+                        # Execute the tools in the response content
+                        start_time = time.perf_counter()
+                        tool_uses = [block for block in response.content if block.type == "tool_use"]
+                        with self._phase('dispatch'):
+                            tool_results = self._execute_tool_calls(tool_uses)
+                        loop.record('tools', time.perf_counter() - start_time,
+                                    tools=[tool_use.name for tool_use in tool_uses])
+
+                        # Append tool usage to conversation and continue
+                        with self._phase('serialize'):
+                            content = normalize_content(response.content)
+                        self.conversation_history.append({
+                            "role": "assistant",
+                            "content": content
+                        })
+                        self.conversation_history.append({
+                            "role": "user",
+                            "content": tool_results
+                        })
+                        continue
 
-            # Update token usage based on response usage
-            if hasattr(response, 'usage') and response.usage:
-                message_tokens = response.usage.input_tokens + response.usage.output_tokens
-                self.total_tokens_used += message_tokens
-                self._display_token_usage(response.usage)
-
-            if self.total_tokens_used >= Config.MAX_CONVERSATION_TOKENS:
-                self.console.print("\n[bold red]Token limit reached! Please reset the conversation.[/bold red]")
-                return "Token limit reached! Please type 'reset' to start a new conversation."
-
-            if response.stop_reason == "tool_use":
-                self.console.print("\n[bold yellow]  Handling Tool Use...[/bold yellow]\n")
-
-                tool_results = []
-                if getattr(response, 'content', None) and isinstance(response.content, list):
-                    # Execute each tool in the response content
-                    for content_block in response.content:
-                        if content_block.type == "tool_use":
-                            result = self._execute_tool(content_block)
-                            
-                            # Handle structured data (like image blocks) vs text
-                            if isinstance(result, (list, dict)):
-                                tool_results.append({
-                                    "type": "tool_result",
-                                    "tool_use_id": content_block.id,
-                                    "content": result  # Keep structured data intact
-                                })
-                            else:
-                                # Convert text results to proper content blocks
-                                tool_results.append({
-                                    "type": "tool_result",
-                                    "tool_use_id": content_block.id,
-                                    "content": [{"type": "text", "text": str(result)}]
-                                })
-
-                    # Append tool usage to conversation and continue
+                    else:
+                        self.console.print("[red]No tool content received despite 'tool_use' stop reason.[/red]")
+                        return "Error: No tool content received"
+
+                # Final assistant response
+                if (getattr(response, 'content', None) and 
+                    isinstance(response.content, list) and 
+                    response.content):
+                    final_content = response.content[0].text
+                    with self._phase('serialize'):
+                        content = normalize_content(response.content)
                     self.conversation_history.append({
                         "role": "assistant",
-                        "content": response.content
-                    })
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": tool_results
+                        "content": content
                     })
-                    return self._get_completion()  # Recursive call to continue the conversation
-
+                    return final_content
                 else:
-                    self.console.print("[red]No tool content received despite 'tool_use' stop reason.[/red]")
-                    return "Error: No tool content received"
-
-            # Final assistant response
-            if (getattr(response, 'content', None) and 
-                isinstance(response.content, list) and 
-                response.content):
-                final_content = response.content[0].text
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": response.content
-                })
-                return final_content
-            else:
-                self.console.print("[red]No content in final response.[/red]")
-                return "No response content available."
+                    self.console.print("[red]No content in final response.[/red]")
+                    return "No response content available."
 
         except Exception as e:
             logging.error(f"Error in _get_completion: {str(e)}")
             return f"Error: {str(e)}"
 
-    def chat(self, user_input):
+    def _prepare_request(self, estimated_prompt: Optional[int] = None):
+        """
+        Build the next Messages API request. The prompt size is forecast first so
+        max_tokens never overruns the context window. estimated_prompt is the
+        estimate _compact_history_if_needed returned, if it ran.
+
+        Returns:
+            (request kwargs, estimated prompt tokens), or (None, estimate) when less
+            than MIN_RESPONSE_TOKENS would be left for the response.
+        """
+        if estimated_prompt is None:
+            estimated_prompt = estimate_tokens(self.conversation_history) + self._prompt_overhead_tokens()
+        max_tokens = self.token_accounting.output_budget(self.token_accounting.forecast(estimated_prompt))
+        if max_tokens < getattr(Config, 'MIN_RESPONSE_TOKENS', 1024):
+            return None, estimated_prompt
+        request = dict(
+            model=Config.MODEL,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            **self._build_prompt()
+        )
+        return request, estimated_prompt
+
+    def _record_response(self, response, estimated_prompt: int) -> int:
+        """Update token accounting from a response and return the tokens it used."""
+        if not (hasattr(response, 'usage') and response.usage):
+            return 0
+        request = self.token_accounting.record(response.usage, estimated_prompt)
+        for kind in ('input', 'output', 'cache_read', 'cache_write'):
+            metrics.TOKENS.inc(getattr(request, f'{kind}_tokens'), kind=kind)
+        if self._current_turn is not None:
+            self._current_turn.add_usage(request)
+        with self._phase('display'):
+            self._display_token_usage(response.usage)
+        return request.total_tokens
+
+    def _record_discarded(self, response) -> None:
+        """Bill a hedged duplicate that lost the race; it never enters the conversation."""
+        if not (hasattr(response, 'usage') and response.usage):
+            return
+        request = self.token_accounting.record_billed(response.usage)
+        for kind in ('input', 'output', 'cache_read', 'cache_write'):
+            metrics.TOKENS.inc(getattr(request, f'{kind}_tokens'), kind=kind)
+
+    @property
+    def total_tokens_used(self) -> int:
+        """Tokens billed across all requests so far, cached or not."""
+        return self.token_accounting.billed_tokens
+
+    def _prompt_overhead_tokens(self) -> int:
+        """Estimated tokens of the tools and system prompt sent with every request."""
+        system_prompt = f"{SystemPrompts.DEFAULT}\n\n{SystemPrompts.TOOL_USAGE}"
+        return estimate_content_tokens(system_prompt) + estimate_content_tokens(json.dumps(self.tools))
+
+    def _compact_history_if_needed(self) -> int:
+        """
+        Compact conversation_history when the projected prompt passes
+        COMPACTION_THRESHOLD of MAX_CONVERSATION_TOKENS.
+
+        Returns:
+            The estimated prompt tokens of the history as it now stands, which
+            _prepare_request reuses instead of estimating again.
+        """
+        overhead = self._prompt_overhead_tokens()
+        estimate = estimate_tokens(self.conversation_history) + overhead
+        if not getattr(Config, 'ENABLE_CONTEXT_COMPACTION', False):
+            return estimate
+        if not self.context_manager.needs_compaction(self.conversation_history, overhead, estimate):
+            return estimate
+        if self._compaction_noop == (self._current_turn, len(self.conversation_history)):
+            return estimate
+
+        history, aged_images = self._age_images(self.conversation_history)
+        compacted, report = self.context_manager.compact(history, overhead, estimate)
+        details = []
+        if aged_images:
+            details.append(f"{aged_images} older images downscaled or omitted")
+        if report["stubbed"]:
+            details.append(f"{report['stubbed']} old tool results stubbed")
+        if report["summarized"]:
+            details.append(f"{report['summarized']} messages {'summarized' if report['summary'] == 'model' else 'removed'}")
+        if not details:
+            # A long tool chain stays over the threshold on every step; say so once per turn
+            if self._compaction_noop is None or self._compaction_noop[0] is not self._current_turn:
+                self.console.print("\n[yellow]Nothing left to compact; older turns are part of the current tool chain.[/yellow]")
+            self._compaction_noop = (self._current_turn, len(self.conversation_history))
+            return estimate
+        self.conversation_history = compacted
+        self.console.print(f"\n[yellow]Compacted conversation history: {', '.join(details)}: "
+                           f"~{report['before']:,} → ~{report['after']:,} tokens[/yellow]")
+        return estimate_tokens(self.conversation_history) + overhead
+
+    def _summarize_history(self, transcript: str) -> str:
+        """Summarize a rendered transcript of old turns with a separate model call."""
+        response = self.api.call(lambda: self.client.messages.create(
+            model=Config.MODEL,
+            max_tokens=getattr(Config, 'COMPACTION_SUMMARY_TOKENS', 1024),
+            temperature=0,
+            system=SystemPrompts.COMPACTION_SUMMARY,
+            messages=[{"role": "user", "content": transcript}]
+        ), on_discarded=self._record_discarded)
+        if hasattr(response, 'usage') and response.usage:
+            self.token_accounting.record_billed(response.usage)
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    def _build_prompt(self) -> Dict[str, Any]:
+        """
+        Build the tools, system and messages arguments of a request. With
+        ENABLE_PROMPT_CACHING, cache breakpoints are placed on the last tool, the
+        system prompt, the latest message and the user message that ended the
+        previous request, so each step of a tool chain reads the prefix the step
+        before it wrote. conversation_history itself is never modified.
+        """
+        system_prompt = f"{SystemPrompts.DEFAULT}\n\n{SystemPrompts.TOOL_USAGE}"
+        messages = self._materialize_history()
+        if not getattr(Config, 'ENABLE_PROMPT_CACHING', False):
+            return {"tools": self.tools, "system": system_prompt, "messages": messages}
+
+        cache_control = {"type": "ephemeral"}
+        tools = list(self.tools)
+        if tools:
+            tools[-1] = {**tools[-1], "cache_control": cache_control}
+        system = [{"type": "text", "text": system_prompt, "cache_control": cache_control}]
+
+        messages = list(messages)
+        user_indexes = [i for i, message in enumerate(messages) if message.get("role") == "user"]
+        for index in user_indexes[-2:]:
+            messages[index] = self._with_cache_breakpoint(messages[index], cache_control)
+
+        return {"tools": tools, "system": system, "messages": messages}
+
+    def _materialize_history(self) -> List[Dict[str, Any]]:
+        """Resolve image references in conversation_history into image blocks."""
+        if not getattr(Config, 'ENABLE_IMAGE_STORE', False):
+            return self.conversation_history
+        return self.image_store.materialize(self.conversation_history)
+
+    def _age_images(self, history: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Downscale or drop old images in history as configured. Only called while
+        compacting, so requests between compactions share a cacheable prefix.
+        """
+        if not getattr(Config, 'ENABLE_IMAGE_STORE', False):
+            return history, 0
+        return self.image_store.age(
+            history,
+            full_turns=getattr(Config, 'IMAGE_FULL_RESOLUTION_TURNS', None),
+            downscale_max_side=getattr(Config, 'IMAGE_DOWNSCALE_MAX_SIDE', 512),
+            placeholder_turns=getattr(Config, 'IMAGE_PLACEHOLDER_TURNS', None)
+        )
+
+    def _intern_images(self, content):
+        """Replace inline base64 images in message content with image store references."""
+        if not getattr(Config, 'ENABLE_IMAGE_STORE', False):
+            return content
+        return self.image_store.intern(content)
+
+    def _with_cache_breakpoint(self, message: Dict[str, Any], cache_control: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Return a copy of a user message whose last content block carries cache_control.
+        """
+        content = message.get("content")
+        if isinstance(content, str):
+            if not content:
+                return message
+            blocks = [{"type": "text", "text": content}]
+        elif isinstance(content, list) and content and isinstance(content[-1], dict):
+            blocks = list(content)
+        else:
+            return message
+        if blocks[-1].get("type") == "text" and not blocks[-1].get("text"):
+            return message
+        blocks[-1] = {**blocks[-1], "cache_control": cache_control}
+        return {**message, "content": blocks}
+
+    def _create_message(self, **request):
+        """
+        Send one request to the Messages API through the retrying ResilientAPI
+        layer. When an event handler is installed
+        (see chat), the response is streamed and every text delta is emitted as a
+        'text' event as it arrives; the assembled message is returned either way.
+        """
+        if self._event_handler is None:
+            return self.api.call(lambda: self.client.messages.create(**request),
+                                 on_discarded=self._record_discarded)
+
+        streamed = []
+
+        def stream_once():
+            with self.client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    streamed.append(text)
+                    self._emit('text', text=text)
+                return stream.get_final_message()
+
+        # A stream is only retried while none of its text has been shown
+        return self.api.call(stream_once, can_retry=lambda: not streamed, hedge=False)
+
+    def _emit(self, event_type: str, **data):
+        """
+        Pass an event ('text', 'tool_start', 'tool_end') to the handler installed by chat.
+        """
+        if self._event_handler is None:
+            return
+        try:
+            self._event_handler({"type": event_type, **data})
+        except Exception as handler_err:
+            logging.error(f"Event handler failed: {str(handler_err)}")
+
+    def _display_step_event(self, event: StepEvent):
+        """
+        Print the timing of an agent loop step when SHOW_STEP_TIMINGS is enabled.
+        """
+        if not getattr(Config, 'SHOW_STEP_TIMINGS', False):
+            return
+        if event.kind == 'model':
+            self.console.print(f"[dim]Step {event.step}: model call {event.seconds:.2f}s, "
+                               f"{event.tokens:,} tokens ({event.elapsed:.1f}s elapsed)[/dim]")
+        else:
+            tools = ", ".join(event.detail.get('tools', []))
+            self.console.print(f"[dim]Step {event.step}: tools {tools} {event.seconds:.2f}s "
+                               f"({event.elapsed:.1f}s elapsed)[/dim]")
+
+    def _record_turn_step(self, event: StepEvent):
+        if self._current_turn is not None:
+            self._current_turn.add_step(event)
+
+    def _begin_turn(self) -> TurnRecord:
+        self._current_turn = TurnRecord(len(self.turns) + 1)
+        self.turns.append(self._current_turn)
+        return self._current_turn
+
+    def _end_turn(self) -> None:
+        turn = self._current_turn
+        if turn is None:
+            return
+        turn.finish()
+        self._current_turn = None
+        metrics.TURN_SECONDS.observe(turn.seconds)
+        metrics.TURN_TOKENS.observe(turn.input_tokens + turn.cache_read_tokens + turn.cache_write_tokens
+                                    + turn.output_tokens)
+        if getattr(Config, 'SHOW_STEP_TIMINGS', False):
+            tools = f", tools: {', '.join(turn.tools_used)} ({turn.tool_seconds:.2f}s)" if turn.tools_used else ""
+            self.console.print(
+                f"[dim]Turn {turn.turn}: {turn.seconds:.2f}s, {turn.model_calls} model calls "
+                f"({turn.model_seconds:.2f}s){tools}, {turn.input_tokens + turn.cache_read_tokens + turn.cache_write_tokens:,} "
+                f"prompt / {turn.output_tokens:,} output tokens[/dim]"
+            )
+
+    @property
+    def last_turn(self) -> Optional[TurnRecord]:
+        """Record of the most recent user message, or None before the first one."""
+        return self.turns[-1] if self.turns else None
+
+    def chat(self, user_input, on_event=None, cancel_event=None):
         """
         Process a chat message from the user.
         user_input can be either a string (text-only) or a list (multimodal message)
+        on_event, if given, is called with event dicts while the message is processed:
+        {'type': 'text', 'text': ...} for each streamed text delta, and
+        {'type': 'tool_start' | 'tool_end', 'id': ..., 'name': ...} around tool calls.
+        Passing on_event switches model calls to the streaming API.
+        cancel_event, a threading.Event, stops the tool chain before the next model call once set.
         """
-        # Handle special commands only for text-only messages
-        if isinstance(user_input, str):
-            if user_input.lower() == 'refresh':
-                self.refresh_tools()
-                return "Tools refreshed successfully!"
-            elif user_input.lower() == 'reset':
-                self.reset()
-                return "Conversation reset!"
-            elif user_input.lower() == 'quit':
-                return "Goodbye!"
+        if self.recorder is not None:
+            # Commands such as 'reset' are recorded too, so a replay goes through the same states
+            self.recorder.record_user(user_input)
+        command_reply = self._handle_command(user_input)
+        if command_reply is not None:
+            return command_reply
 
         try:
             # Add user message to conversation history
             self.conversation_history.append({
                 "role": "user",
-                "content": user_input  # This can be either string or list
+                "content": self._intern_images(user_input)  # This can be either string or list
             })
 
-            # Show thinking indicator if enabled
-            if self.thinking_enabled:
-                with Live(Spinner('dots', text='Thinking...', style="cyan"), 
-                         refresh_per_second=10, transient=True):
+            self._event_handler = on_event
+            self._cancel_event = cancel_event
+            self._begin_turn()
+
+            with self.tracer.span('turn', streaming=on_event is not None):
+                # Show thinking indicator if enabled (streamed text replaces it)
+                if self.thinking_enabled and on_event is None:
+                    with Live(Spinner('dots', text='Thinking...', style="cyan"),
+                             refresh_per_second=10, transient=True):
+                        response = self._get_completion()
+                else:
                     response = self._get_completion()
-            else:
-                response = self._get_completion()
 
             return response
 
         except Exception as e:
             logging.error(f"Error in chat: {str(e)}")
             return f"Error: {str(e)}"
+        finally:
+            self._event_handler = None
+            self._cancel_event = None
+            self._end_turn()
+
+    @contextmanager
+    def _phase(self, name: str, **attributes):
+        """
+        Context manager timing a phase of the agent loop into phase_timer and
+        as a span of the current trace; yields the span (None with tracing off).
+        """
+        with self.phase_timer.phase(name), self.tracer.span(name, **attributes) as span:
+            yield span
+
+    def start_recording(self, path) -> CassetteRecorder:
+        """
+        Write the rest of the session to a cassette: every user message, model
+        request and response, and tool call with its output and timing.
+        """
+        self.stop_recording()
+        self.recorder = CassetteRecorder(path)
+        self.client = RecordingClient(self.client, self.recorder)
+        return self.recorder
+
+    def stop_recording(self) -> None:
+        if self.recorder is None:
+            return
+        self.recorder.close()
+        self.recorder = None
+        if isinstance(self.client, RecordingClient):
+            self.client = self.client._client
+
+    def start_replay(self, player) -> None:
+        """
+        Answer model calls and tool calls from a CassettePlayer instead of the
+        API and the tools, and start timing phases afresh.
+        """
+        self.replayer = player
+        self.client = player.client
+        self.phase_timer.reset()
+
+    def record_command(self, argument: str) -> str:
+        """
+        CLI 'record <name>' starts a cassette in CASSETTE_DIR; 'record off'
+        finishes it. Not a chat command, since web users must not be able to
+        write files with full prompts and responses on the server.
+        """
+        if argument.lower() == 'off':
+            if self.recorder is None:
+                return "Not recording."
+            path = self.recorder.path
+            self.stop_recording()
+            return f"Recording saved to {path}"
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', argument).strip('.') or 'session'
+        path = Path(getattr(Config, 'CASSETTE_DIR', Config.BASE_DIR / 'cassettes')) / f"{name}.cassette.jsonl.gz"
+        self.start_recording(path)
+        return f"Recording to {path}; type 'record off' to finish."
+
+    def _handle_command(self, user_input) -> Optional[str]:
+        """
+        Handle special commands, which only exist for text-only messages.
+        Returns the reply, or None if user_input is not a command.
+        """
+        if not isinstance(user_input, str):
+            return None
+        if user_input.lower() == 'refresh':
+            return self._command_output(self.refresh_tools)
+        elif user_input.lower() == 'stats':
+            return self._command_output(self.display_tool_stats)
+        elif user_input.lower() == 'reset':
+            self.reset()
+            return "Conversation reset!"
+        elif user_input.lower() == 'trace':
+            return self._command_output(lambda: render_timeline(self.console, self.tracer.last_trace()))
+        elif user_input.lower() == 'quit':
+            return "Goodbye!"
+        return None
+
+    def _command_output(self, command) -> str:
+        """
+        Run a display command against an off-screen console and return what it
+        printed as plain text, so the output reaches the caller (e.g. a web
+        client) instead of the server's terminal.
+        """
+        console = self.console
+        self.console = Console(file=io.StringIO(), width=console.width, color_system=None)
+        try:
+            command()
+            return self.console.file.getvalue().strip()
+        finally:
+            self.console = console
 
     def reset(self):
         """
         Reset the assistant's memory and token usage.
         """
         self.conversation_history = []
-        self.total_tokens_used = 0
+        self.token_accounting.reset()
+        self.context_manager.reset()
+        self.turns = []
         self.console.print("\n[bold green]🔄 Assistant memory has been reset![/bold green]")
 
         welcome_text = """
 # Claude Engineer v3. A self-improving assistant framework with tool creation
 
 Type 'refresh' to reload available tools
+Type 'stats' to show tool call counts
 Type 'reset' to clear conversation history
+Type 'record <name>' to record the session to a cassette ('record off' to stop)
+Type 'trace' to show the timeline of the last turn
+Type 'profile on' / 'profile off' to profile CPU time and allocations of each turn
 Type 'quit' to exit
 
 Available tools:
@@ -492,13 +1306,18 @@ def main():
 # Claude Engineer v3. A self-improving assistant framework with tool creation
 
 Type 'refresh' to reload available tools
+Type 'stats' to show tool call counts
 Type 'reset' to clear conversation history
+Type 'record <name>' to record the session to a cassette ('record off' to stop)
+Type 'trace' to show the timeline of the last turn
+Type 'profile on' / 'profile off' to profile CPU time and allocations of each turn
 Type 'quit' to exit
 
 Available tools:
 """
     console.print(Markdown(welcome_text))
     assistant.display_available_tools()
+    profiler = TurnProfiler.from_config(Config)
 
     while True:
         try:
@@ -510,14 +1329,63 @@ Available tools:
             elif user_input.lower() == 'reset':
                 assistant.reset()
                 continue
+            elif user_input.lower() == 'refresh':
+                assistant.refresh_tools()
+                continue
+            elif user_input.lower() == 'stats':
+                assistant.display_tool_stats()
+                continue
+            elif user_input.lower() == 'trace':
+                render_timeline(console, assistant.tracer.last_trace())
+                continue
+            elif user_input.lower() in ('profile on', 'profile off'):
+                if user_input.lower() == 'profile on':
+                    profiler.enable()
+                    console.print(f"[cyan]Profiling turns; reports go to {profiler.output_dir}[/cyan]")
+                else:
+                    profiler.disable()
+                    console.print(f"[cyan]Profiling off ({profiler.turns} turns profiled).[/cyan]")
+                continue
+            elif user_input.lower().startswith('record '):
+                console.print(f"[cyan]{assistant.record_command(user_input[len('record '):].strip())}[/cyan]")
+                continue
 
-            response = assistant.chat(user_input)
-            console.print("\n[bold purple]Claude Engineer:[/bold purple]")
-            if isinstance(response, str):
-                safe_response = response.replace('[', '\\[').replace(']', '\\]')
-                console.print(safe_response)
-            else:
-                console.print(str(response))
+            streamed = False
+            delivered = []  # Text streamed since the last tool call
+            with profiler.profile(f"turn {profiler.turns + 1}") as profiles:
+                if getattr(Config, 'ENABLE_STREAMING', False):
+                    def print_event(event):
+                        nonlocal streamed
+                        if event['type'] == 'text':
+                            if not streamed:
+                                console.print("\n[bold purple]Claude Engineer:[/bold purple]")
+                                streamed = True
+                            console.print(event['text'], end='', markup=False, highlight=False)
+                            delivered.append(event['text'])
+                        elif event['type'] == 'tool_start':
+                            if streamed:
+                                console.print()
+                                streamed = False
+                            delivered.clear()
+
+                    response = assistant.chat(user_input, on_event=print_event)
+                else:
+                    response = assistant.chat(user_input)
+
+            if streamed:
+                console.print()
+            # Print the response unless streaming already showed it; an error or stop
+            # notice after partial output would otherwise leave the user with cut-off text
+            if str(response).strip() not in ''.join(delivered):
+                if not streamed:
+                    console.print("\n[bold purple]Claude Engineer:[/bold purple]")
+                if isinstance(response, str):
+                    safe_response = response.replace('[', '\\[').replace(']', '\\]')
+                    console.print(safe_response)
+                else:
+                    console.print(str(response))
+            for result in profiles:
+                render_profile(console, result)
 
         except KeyboardInterrupt:
             continue
@@ -0,0 +1,222 @@
+# ce3_async.py
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+import anthropic
+
+from agent_loop import AgentLoop
+from cassette import AsyncRecordingClient
+from ce3 import Assistant
+from config import Config
+import metrics
+from turn_records import normalize_content
+
+
+class AsyncAssistant(Assistant):
+    """
+    asyncio variant of Assistant for serving many conversations from one process.
+
+    Model calls go through AsyncAnthropic, so a conversation waiting on the API
+    doesn't hold up any other. Tools are synchronous (requests, subprocess) and
+    run on the shared tool thread pool via run_in_executor; other blocking steps
+    (commands, history compaction) run on the event loop's default executor, so
+    they never hold a tool worker. Tool loading, prompt building, token
+    accounting, compaction, result spilling, phase timing, tracing and cassette
+    recording/replay are the same as in Assistant.
+
+    Use one AsyncAssistant per conversation:
+
+        assistant = AsyncAssistant()
+        reply = await assistant.chat("Summarize README.md")
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_client = anthropic.AsyncAnthropic(
+            api_key=Config.ANTHROPIC_API_KEY,
+            base_url=getattr(Config, 'ANTHROPIC_BASE_URL', None),
+            max_retries=0
+        )
+
+    def new_session(self) -> "AsyncAssistant":
+        """Like Assistant.new_session, also sharing the async client."""
+        session = super().new_session()
+        session.async_client = self.async_client
+        return session
+
+    def start_recording(self, path):
+        recorder = super().start_recording(path)
+        self.async_client = AsyncRecordingClient(self.async_client, recorder)
+        return recorder
+
+    def stop_recording(self) -> None:
+        super().stop_recording()
+        if isinstance(self.async_client, AsyncRecordingClient):
+            self.async_client = self.async_client._client
+
+    def start_replay(self, player) -> None:
+        super().start_replay(player)
+        self.async_client = player.async_client
+
+    async def chat(self, user_input, on_event=None, cancel_event=None):
+        """
+        Awaitable counterpart of Assistant.chat. on_event receives the same
+        events; tool events may be delivered from tool worker threads.
+        """
+        if self.recorder is not None:
+            self.recorder.record_user(user_input)
+        command_reply = await self._run_sync(self._handle_command, user_input)
+        if command_reply is not None:
+            return command_reply
+
+        try:
+            self.conversation_history.append({
+                "role": "user",
+                "content": self._intern_images(user_input)
+            })
+            self._event_handler = on_event
+            self._cancel_event = cancel_event
+            self._begin_turn()
+            with self.tracer.span('turn', streaming=on_event is not None):
+                return await self._get_completion_async()
+
+        except Exception as e:
+            logging.error(f"Error in chat: {str(e)}")
+            return f"Error: {str(e)}"
+        finally:
+            self._event_handler = None
+            self._cancel_event = None
+            self._end_turn()
+
+    async def _get_completion_async(self):
+        """
+        Drive the tool loop like Assistant._get_completion, awaiting model calls
+        and tool rounds instead of blocking on them.
+        """
+        loop = AgentLoop.from_config(Config, listeners=self.step_listeners, cancel_event=self._cancel_event)
+
+        try:
+            while True:
+                stop_reason = loop.stop_reason()
+                if stop_reason:
+                    self.console.print(f"\n[bold red]Agent loop stopped: {stop_reason}.[/bold red]")
+                    return (f"Stopped after {loop.steps} steps: {stop_reason}. "
+                            "Send another message to let me continue.")
+
+                # Summarizing old turns makes a blocking model call
+                with self._phase('compaction'):
+                    estimated_prompt = await self._run_sync(self._compact_history_if_needed)
+
+                with self._phase('serialize'):
+                    request, estimated_prompt = self._prepare_request(estimated_prompt)
+                if request is None:
+                    self.console.print("\n[bold red]Token limit reached! Please reset the conversation.[/bold red]")
+                    return "Token limit reached! Please type 'reset' to start a new conversation."
+
+                start_time = time.perf_counter()
+                with self._phase('model', model=Config.MODEL, step=loop.steps + 1) as model_span, \
+                        metrics.track(metrics.MODEL_REQUEST_SECONDS, metrics.MODEL_REQUESTS, model=Config.MODEL):
+                    response = await self._create_message_async(**request)
+                model_seconds = time.perf_counter() - start_time
+
+                with self._phase('accounting'):
+                    message_tokens = self._record_response(response, estimated_prompt)
+                if model_span is not None:
+                    model_span.set(stop_reason=response.stop_reason, tokens=message_tokens)
+                loop.record('model', model_seconds, message_tokens, stop_reason=response.stop_reason)
+
+                if response.stop_reason == "tool_use":
+                    if not (getattr(response, 'content', None) and isinstance(response.content, list)):
+                        self.console.print("[red]No tool content received despite 'tool_use' stop reason.[/red]")
+                        return "Error: No tool content received"
+
+                    start_time = time.perf_counter()
+                    tool_uses = [block for block in response.content if block.type == "tool_use"]
+                    with self._phase('dispatch'):
+                        tool_results = await self._execute_tool_calls_async(tool_uses)
+                    loop.record('tools', time.perf_counter() - start_time,
+                                tools=[tool_use.name for tool_use in tool_uses])
+
+                    self.conversation_history.append({
+                        "role": "assistant",
+                        "content": normalize_content(response.content)
+                    })
+                    self.conversation_history.append({
+                        "role": "user",
+                        "content": tool_results
+                    })
+                    continue
+
+                if getattr(response, 'content', None) and isinstance(response.content, list):
+                    self.conversation_history.append({
+                        "role": "assistant",
+                        "content": normalize_content(response.content)
+                    })
+                    return response.content[0].text
+
+                self.console.print("[red]No content in final response.[/red]")
+                return "No response content available."
+
+        except Exception as e:
+            logging.error(f"Error in _get_completion_async: {str(e)}")
+            return f"Error: {str(e)}"
+
+    async def _create_message_async(self, **request):
+        """
+        Send one request with AsyncAnthropic through the retrying ResilientAPI layer,
+        streaming text events when a handler is installed.
+        """
+        if self._event_handler is None:
+            return await self.api.acall(lambda: self.async_client.messages.create(**request),
+                                        on_discarded=self._record_discarded)
+
+        streamed = []
+
+        async def stream_once():
+            async with self.async_client.messages.stream(**request) as stream:
+                async for text in stream.text_stream:
+                    streamed.append(text)
+                    self._emit('text', text=text)
+                return await stream.get_final_message()
+
+        return await self.api.acall(stream_once, can_retry=lambda: not streamed, hedge=False)
+
+    async def _execute_tool_calls_async(self, tool_uses) -> List[Dict[str, Any]]:
+        """
+        Run the tool calls of one response on the tool thread pool. With
+        PARALLEL_TOOL_EXECUTION the independent groups from _group_tool_calls
+        are awaited together; otherwise calls run one after another.
+        """
+        results = [None] * len(tool_uses)
+        durations = [0.0] * len(tool_uses)
+
+        async def run_group(indexes):
+            for index in indexes:
+                results[index], durations[index] = await self._run_sync(
+                    self._run_tool_call, tool_uses[index], executor=self._get_tool_executor())
+
+        start_time = time.perf_counter()
+        if getattr(Config, 'PARALLEL_TOOL_EXECUTION', False) and len(tool_uses) > 1:
+            groups = self._group_tool_calls(tool_uses)
+            await asyncio.gather(*(run_group(group) for group in groups))
+            self._display_parallel_savings(len(tool_uses), len(groups), time.perf_counter() - start_time, durations)
+        else:
+            await run_group(range(len(tool_uses)))
+
+        return self._build_tool_results(tool_uses, results)
+
+    async def _run_sync(self, func, *args, executor=None):
+        """
+        Run a blocking callable on a worker thread, inside the current trace span.
+        Tool calls pass the shared tool pool; anything else runs on the event
+        loop's default executor.
+        """
+        parent_span = self.tracer.current()
+
+        def run():
+            with self.tracer.attach(parent_span):
+                return func(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(executor, run)
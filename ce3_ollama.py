@@ -4,17 +4,20 @@ from rich.markdown import Markdown
 from rich.live import Live
 from rich.spinner import Spinner
 from rich.panel import Panel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import importlib
 import inspect
 import pkgutil
 import os
 import json
 import sys
+import time
 import logging
 
 from config_ollama import Config
 from tools.base import BaseTool
+from dependency_resolver import DependencyResolver
+from agent_loop import AgentLoop, StepEvent
 def get_user_input(prompt_text="You: "):
     """Windows-compatible input function"""
     print(prompt_text, end="", flush=True)
@@ -53,27 +56,16 @@ class Assistant:
         self.temperature = getattr(Config, 'DEFAULT_TEMPERATURE', 0.7)
         self.total_tokens_used = 0
 
-        self.tools = self._load_tools()
+        # Callables receiving a StepEvent after every model call and tool round
+        self.step_listeners = [self._display_step_event]
 
-    def _execute_uv_install(self, package_name: str) -> bool:
-        """Execute uvpackagemanager tool to install missing packages."""
-        class ToolUseMock:
-            name = "uvpackagemanager"
-            input = {
-                "command": "install",
-                "packages": [package_name]
-            }
-
-        result = self._execute_tool(ToolUseMock())
-        if "Error" not in result and "failed" not in result.lower():
-            self.console.print("[green]Package installed successfully.[/green]")
-            return True
-        else:
-            self.console.print(f"[red]Failed to install {package_name}. Output:[/red] {result}")
-            return False
+        self.tools = self._load_tools()
 
     def _load_tools(self) -> List[Dict[str, Any]]:
-        """Dynamically load all tool classes from the tools directory."""
+        """
+        Dynamically load all tool classes from the tools directory.
+        Missing dependencies are installed in one batch and only the affected modules retried.
+        """
         tools = []
         tools_path = getattr(Config, 'TOOLS_DIR', None)
 
@@ -86,6 +78,8 @@ class Assistant:
             if module_name.startswith('tools.') and module_name != 'tools.base':
                 del sys.modules[module_name]
 
+        resolver = DependencyResolver(getattr(Config, 'DEPENDENCY_INSTALL_POLICY', 'prompt'), self.console)
+
         try:
             for module_info in pkgutil.iter_modules([str(tools_path)]):
                 if module_info.name == 'base':
@@ -95,38 +89,22 @@ class Assistant:
                     module = importlib.import_module(f'tools.{module_info.name}')
                     self._extract_tools_from_module(module, tools)
                 except ImportError as e:
-                    missing_module = self._parse_missing_dependency(str(e))
-                    self.console.print(f"\n[yellow]Missing dependency:[/yellow] {missing_module} for tool {module_info.name}")
-                    user_response = input(f"Install {missing_module}? (y/n): ").lower()
-
-                    if user_response == 'y':
-                        success = self._execute_uv_install(missing_module)
-                        if success:
-                            try:
-                                module = importlib.import_module(f'tools.{module_info.name}')
-                                self._extract_tools_from_module(module, tools)
-                            except Exception as retry_err:
-                                self.console.print(f"[red]Failed to load tool after installation: {str(retry_err)}[/red]")
-                        else:
-                            self.console.print(f"[red]Installation of {missing_module} failed. Skipping this tool.[/red]")
-                    else:
-                        self.console.print(f"[yellow]Skipping tool {module_info.name} due to missing dependency[/yellow]")
+                    resolver.add(module_info.name, e)
                 except Exception as mod_err:
                     self.console.print(f"[red]Error loading module {module_info.name}:[/red] {str(mod_err)}")
+
+            for module_name in resolver.resolve():
+                sys.modules.pop(f'tools.{module_name}', None)
+                try:
+                    module = importlib.import_module(f'tools.{module_name}')
+                    self._extract_tools_from_module(module, tools)
+                except Exception as retry_err:
+                    self.console.print(f"[red]Failed to load tool {module_name} after installation: {str(retry_err)}[/red]")
         except Exception as overall_err:
             self.console.print(f"[red]Error in tool loading process:[/red] {str(overall_err)}")
 
         return tools
 
-    def _parse_missing_dependency(self, error_str: str) -> str:
-        """Parse the missing dependency name from an ImportError string."""
-        if "No module named" in error_str:
-            parts = error_str.split("No module named")
-            missing_module = parts[-1].strip(" '\"")
-        else:
-            missing_module = error_str
-        return missing_module
-
     def _extract_tools_from_module(self, module, tools: List[Dict[str, Any]]) -> None:
         """Find and instantiate all tool classes from a module."""
         for name, obj in inspect.getmembers(module):
@@ -298,25 +276,23 @@ class Assistant:
         
         return "\n\n".join(tool_descriptions)
 
-    def _get_completion(self):
-        """Get completion from Ollama."""
-        try:
-            # Format conversation for Ollama
-            messages = []
-            for msg in self.conversation_history:
-                if msg['role'] == 'user':
-                    messages.append({
-                        'role': 'user',
-                        'content': msg['content'] if isinstance(msg['content'], str) else str(msg['content'])
-                    })
-                elif msg['role'] == 'assistant':
-                    messages.append({
-                        'role': 'assistant',
-                        'content': msg['content'] if isinstance(msg['content'], str) else str(msg['content'])
-                    })
+    def _build_messages(self) -> List[Dict[str, Any]]:
+        """Format the system prompt and conversation history for Ollama."""
+        messages = []
+        for msg in self.conversation_history:
+            if msg['role'] == 'user':
+                messages.append({
+                    'role': 'user',
+                    'content': msg['content'] if isinstance(msg['content'], str) else str(msg['content'])
+                })
+            elif msg['role'] == 'assistant':
+                messages.append({
+                    'role': 'assistant',
+                    'content': msg['content'] if isinstance(msg['content'], str) else str(msg['content'])
+                })
 
-            # Add system prompt with tools
-            system_prompt = f"""{SystemPrompts.DEFAULT}
+        # Add system prompt with tools
+        system_prompt = f"""{SystemPrompts.DEFAULT}
 
 Available Tools:
 {self._format_tools_for_ollama()}
@@ -327,48 +303,75 @@ TOOL_INPUT: {{"param": "value"}}
 
 {SystemPrompts.TOOL_USAGE}"""
 
-            # Create system message as first message instead of system parameter
-            system_message = {
-                'role': 'system',
-                'content': system_prompt
-            }
-            
-            # Combine system + conversation messages
-            all_messages = [system_message] + messages
-
-            response = self.client.chat(
-                model=Config.MODEL,
-                messages=all_messages,
-                options={
-                    'temperature': self.temperature,
-                    'num_ctx': min(Config.MAX_TOKENS, Config.MAX_CONVERSATION_TOKENS - self.total_tokens_used)
-                }
-            )
-
-            response_text = response['message']['content']
-            
-            # Estimate token usage (rough approximation)
-            estimated_tokens = len(response_text.split()) * 1.3
-            self._display_token_usage(int(estimated_tokens))
+        # Create system message as first message instead of system parameter
+        system_message = {
+            'role': 'system',
+            'content': system_prompt
+        }
 
-            # Check for tool calls in response
-            if "TOOL_CALL:" in response_text and "TOOL_INPUT:" in response_text:
-                return self._handle_tool_call(response_text)
-            
-            # Add response to conversation history
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": response_text
-            })
-            
-            return response_text
+        # Combine system + conversation messages
+        return [system_message] + messages
+
+    def _get_completion(self):
+        """
+        Get completion from Ollama, running tool calls iteratively until the model
+        answers without one or the AgentLoop budget is exhausted.
+        """
+        loop = AgentLoop.from_config(Config, listeners=self.step_listeners)
+
+        try:
+            while True:
+                stop_reason = loop.stop_reason()
+                if stop_reason:
+                    self.console.print(f"\n[bold red]Agent loop stopped: {stop_reason}.[/bold red]")
+                    return (f"Stopped after {loop.steps} steps: {stop_reason}. "
+                            "Send another message to let me continue.")
+
+                start_time = time.perf_counter()
+                response = self.client.chat(
+                    model=Config.MODEL,
+                    messages=self._build_messages(),
+                    options={
+                        'temperature': self.temperature,
+                        'num_ctx': min(Config.MAX_TOKENS, Config.MAX_CONVERSATION_TOKENS - self.total_tokens_used)
+                    }
+                )
+                model_seconds = time.perf_counter() - start_time
+
+                response_text = response['message']['content']
+
+                # Estimate token usage (rough approximation)
+                estimated_tokens = len(response_text.split()) * 1.3
+                self._display_token_usage(int(estimated_tokens))
+                loop.record('model', model_seconds, int(estimated_tokens))
+
+                # Check for tool calls in response
+                if "TOOL_CALL:" in response_text and "TOOL_INPUT:" in response_text:
+                    start_time = time.perf_counter()
+                    reply = self._handle_tool_call(response_text)
+                    loop.record('tools', time.perf_counter() - start_time)
+                    if reply is None:
+                        continue
+                    return reply
+
+                # Add response to conversation history
+                self.conversation_history.append({
+                    "role": "assistant",
+                    "content": response_text
+                })
+
+                return response_text
 
         except Exception as e:
             logging.error(f"Error in _get_completion: {str(e)}")
             return f"Error: {str(e)}"
 
-    def _handle_tool_call(self, response_text: str):
-        """Parse and execute tool calls from Ollama response."""
+    def _handle_tool_call(self, response_text: str) -> Optional[str]:
+        """
+        Parse and execute a tool call from an Ollama response and add the exchange
+        to the conversation. Returns None when the loop should continue, otherwise
+        the reply to return to the user.
+        """
         try:
             lines = response_text.split('\n')
             tool_name = None
@@ -405,14 +408,21 @@ TOOL_INPUT: {{"param": "value"}}
                     "content": f"Tool result: {tool_result}"
                 })
                 
-                # Get follow-up response
-                return self._get_completion()
+                # Let the loop get the follow-up response
+                return None
             
             return response_text
             
         except Exception as e:
             return f"Error handling tool call: {str(e)}"
 
+    def _display_step_event(self, event: StepEvent):
+        """Print agent loop step timings when SHOW_STEP_TIMINGS is enabled."""
+        if not getattr(Config, 'SHOW_STEP_TIMINGS', False):
+            return
+        self.console.print(f"[dim]Step {event.step}: {event.kind} {event.seconds:.2f}s "
+                           f"({event.elapsed:.1f}s elapsed)[/dim]")
+
     def chat(self, user_input):
         """Process a chat message from the user."""
         if isinstance(user_input, str):
@@ -6,16 +6,101 @@ load_dotenv()
 
 class Config:
     ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
+    ANTHROPIC_BASE_URL = os.getenv('ANTHROPIC_BASE_URL')  # e.g. a local fake_model_server.py; None uses the real API
     MODEL = "claude-3-5-sonnet-20241022"
     MAX_TOKENS = 8000
-    MAX_CONVERSATION_TOKENS = 200000  # Maximum tokens per conversation
+    MAX_CONVERSATION_TOKENS = 200000  # Context window size the conversation must fit in
+    MIN_RESPONSE_TOKENS = 1024  # Stop when less than this is left for the response
 
     # Paths
     BASE_DIR = Path(__file__).parent
     TOOLS_DIR = BASE_DIR / "tools"
     PROMPTS_DIR = BASE_DIR / "prompts"
+    TOOL_MANIFEST_FILE = TOOLS_DIR / ".tool_manifest.json"  # Cached tool schemas keyed by file hash
+    SPILL_DIR = BASE_DIR / ".spill"  # Oversized tool results, read back with resultpagertool
+    IMAGE_STORE_DIR = BASE_DIR / ".images"  # Conversation images, referenced from history by hash
+    CASSETTE_DIR = BASE_DIR / "cassettes"  # Sessions recorded with the 'record' command
+    TRACE_FILE = BASE_DIR / ".traces" / "trace.jsonl"  # Spans of every turn, one JSON object per line
+    PROFILE_DIR = BASE_DIR / ".profiles"  # pstats files and allocation reports from 'profile on'
 
     # Assistant Configuration
     ENABLE_THINKING = True
     SHOW_TOOL_USAGE = True
     DEFAULT_TEMPERATURE = 0.7
+    ENABLE_STREAMING = True  # Print CLI responses as they are generated
+    ENABLE_PROMPT_CACHING = True  # Cache tools, system prompt and history prefix between requests
+    LAZY_TOOL_LOADING = True  # Import tool modules on first use instead of at startup
+    PARALLEL_TOOL_IMPORT = False  # Import tool modules on a thread pool
+    TOOL_IMPORT_WORKERS = 8
+    SHOW_TOOL_IMPORT_REPORT = False  # Print per-module import times after loading tools
+    DEPENDENCY_INSTALL_POLICY = os.getenv('CE3_DEPENDENCY_POLICY', 'prompt')  # prompt, auto or never
+    PARALLEL_TOOL_EXECUTION = False  # Run independent tool calls from one response concurrently
+    MAX_TOOL_WORKERS = 4
+
+    # Agent loop limits per user message (None disables a limit)
+    MAX_AGENT_STEPS = 25
+    AGENT_DEADLINE_SECONDS = 600
+    AGENT_TOKEN_BUDGET = None
+    SHOW_STEP_TIMINGS = False
+
+    # Per-turn tracing: nested spans for the turn, model calls, tool calls and rendering
+    ENABLE_TRACING = True
+    TRACE_KEEP_TURNS = 20  # Traces kept in memory for the 'trace' command
+    TRACE_MAX_MB = 50  # TRACE_FILE is rotated to trace.jsonl.1 past this size
+
+    # CLI 'profile on': cProfile and a tracemalloc snapshot diff around every turn
+    PROFILE_TOP_N = 20  # Functions and allocation sites listed per turn report
+    PROFILE_TRACEMALLOC_FRAMES = 1  # Stack depth stored per allocation; more frames cost more memory
+
+    # Context compaction: once the projected prompt passes COMPACTION_THRESHOLD of
+    # MAX_CONVERSATION_TOKENS, old tool results are stubbed and old turns summarized
+    # until it is under COMPACTION_TARGET
+    ENABLE_CONTEXT_COMPACTION = True
+    COMPACTION_THRESHOLD = 0.75
+    COMPACTION_TARGET = 0.5
+    COMPACTION_KEEP_RECENT_MESSAGES = 8  # Messages never stubbed or summarized
+    COMPACTION_STUB_CHARS = 200  # Preview length kept from a stubbed tool result
+    COMPACTION_SUMMARY_TOKENS = 1024
+
+    # Tool results longer than SPILL_THRESHOLD_CHARS are stored in SPILL_DIR and
+    # replaced in the conversation by a handle and a preview
+    ENABLE_RESULT_SPILL = True
+    SPILL_THRESHOLD_CHARS = 20000
+    SPILL_PREVIEW_CHARS = 1500
+    SPILL_PAGE_CHARS = 8000  # Maximum characters returned by one resultpagertool call
+    SPILL_MAX_AGE_HOURS = 24  # Stored results older than this are deleted at startup
+
+    # Model API retries: jittered exponential backoff that honours retry-after
+    API_MAX_RETRIES = 5
+    API_RETRY_BASE_DELAY = 1.0
+    API_RETRY_MAX_DELAY = 60.0
+    API_REQUESTS_PER_MINUTE = None  # Client-side rate limit shared by all sessions (None disables)
+    ENABLE_HEDGED_REQUESTS = False  # Duplicate a request that runs past the observed p95 latency
+    HEDGE_MIN_SAMPLES = 20  # Latency samples needed before hedging starts
+
+    # Tool result cache for tools that declare a cache_policy
+    ENABLE_TOOL_CACHE = True
+    TOOL_CACHE_MAX_ENTRIES = 256
+
+    # Images in history are stored once and sent as base64 only when a request is built
+    ENABLE_IMAGE_STORE = True
+    IMAGE_FULL_RESOLUTION_TURNS = 2  # Images older than this many user turns are downscaled when history is compacted
+    IMAGE_DOWNSCALE_MAX_SIDE = 512
+    IMAGE_PLACEHOLDER_TURNS = 6  # Images older than this are replaced by a placeholder (None keeps them)
+    # Uploads are scaled to fit the model's preferred image size before they are stored
+    UPLOAD_IMAGE_MAX_SIDE = 1568
+    UPLOAD_IMAGE_MAX_PIXELS = 1_150_000
+    IMAGE_STORE_MAX_AGE_HOURS = 24  # Images not stored or referenced for this long are deleted
+    IMAGE_STORE_MAX_MB = 500  # Oldest images are deleted once the store grows past this
+
+    # Web sessions: one conversation per browser, evicted least recently used first
+    SESSION_COOKIE_NAME = 'ce3_session'
+    MAX_SESSIONS = 100
+    SESSION_IDLE_TIMEOUT = 3600  # Seconds before an idle session is dropped
+    SESSION_MEMORY_LIMIT_MB = 512  # Combined history size before sessions are evicted
+
+    # Web chat jobs: messages run on a bounded worker pool and are polled or streamed by job id
+    JOB_WORKERS = 4
+    JOB_MAX_PENDING = 100  # Queued jobs before /chat answers 503
+    JOB_RETENTION_SECONDS = 600  # How long finished jobs and their results are kept
+    ENABLE_METRICS = True  # Serve /metrics from the web app (collection itself is always on)
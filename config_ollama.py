@@ -23,3 +23,10 @@ class Config:
     ENABLE_THINKING = True
     SHOW_TOOL_USAGE = True
     DEFAULT_TEMPERATURE = 0.7
+    DEPENDENCY_INSTALL_POLICY = os.getenv('CE3_DEPENDENCY_POLICY', 'prompt')  # prompt, auto or never
+
+    # Agent loop limits per user message (None disables a limit)
+    MAX_AGENT_STEPS = 25
+    AGENT_DEADLINE_SECONDS = 600
+    AGENT_TOKEN_BUDGET = None
+    SHOW_STEP_TIMINGS = False
@@ -0,0 +1,268 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from token_accounting import TokenAccounting
+
+# Rough size of an image block in tokens (a ~1568px image is about 1,600 tokens)
+IMAGE_TOKENS = 1600
+CHARS_PER_TOKEN = 4
+
+
+def block_to_dict(block: Any) -> Dict[str, Any]:
+    """Return a content block as a dict, converting SDK objects from responses."""
+    if isinstance(block, dict):
+        return block
+    if hasattr(block, 'model_dump'):
+        return block.model_dump(exclude_none=True)
+    return {"type": "text", "text": str(block)}
+
+
+def estimate_content_tokens(content: Any) -> int:
+    """Estimate the tokens of a message's content at roughly four characters per token."""
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN
+    if not isinstance(content, list):
+        return len(str(content)) // CHARS_PER_TOKEN
+
+    tokens = 0
+    for block in content:
+        block = block_to_dict(block)
+        block_type = block.get("type")
+        if block_type == "text":
+            tokens += len(block.get("text", "")) // CHARS_PER_TOKEN
+        elif block_type in ("image", "image_ref"):
+            tokens += IMAGE_TOKENS
+        elif block_type == "tool_use":
+            tokens += len(json.dumps(block.get("input", {}), default=str)) // CHARS_PER_TOKEN + 10
+        elif block_type == "tool_result":
+            tokens += estimate_content_tokens(block.get("content")) + 10
+        else:
+            tokens += len(json.dumps(block, default=str)) // CHARS_PER_TOKEN
+    return tokens
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the prompt tokens of a list of messages."""
+    return sum(estimate_content_tokens(message.get("content")) + 4 for message in messages)
+
+
+def is_plain_user_message(message: Dict[str, Any]) -> bool:
+    """True for a user message typed by the user, as opposed to one carrying tool results."""
+    if message.get("role") != "user":
+        return False
+    content = message.get("content")
+    if isinstance(content, list):
+        return not any(block_to_dict(block).get("type") == "tool_result" for block in content)
+    return True
+
+
+class ContextManager:
+    """
+    Keeps the prompt within MAX_CONVERSATION_TOKENS by compacting the
+    conversation history once its projected size passes a threshold.
+
+    Compaction runs in two stages until the projection is under the target:
+    1. Tool results older than the most recent messages are replaced with short
+       stubs. The tool_result blocks themselves are kept, so every tool_use
+       still has its matching result.
+    2. Old turns are replaced with a summary. History is only cut at a message
+       the user typed, so no tool_use/tool_result pair is ever split, and the
+       summary is prepended to the first message that is kept.
+
+    Projections use a chars/4 estimate, calibrated by the TokenAccounting
+    against the prompt sizes reported in response usage.
+    """
+
+    def __init__(self, max_tokens: int, threshold: float = 0.75, target: float = 0.5,
+                 keep_recent_messages: int = 8, stub_chars: int = 200,
+                 summarizer: Optional[Callable[[str], str]] = None,
+                 accounting: Optional[TokenAccounting] = None):
+        self.max_tokens = max_tokens
+        self.threshold = threshold
+        self.target = target
+        self.keep_recent_messages = keep_recent_messages
+        self.stub_chars = stub_chars
+        self.summarizer = summarizer
+        self.accounting = accounting
+        self.compactions = 0
+
+    @classmethod
+    def from_config(cls, config, summarizer=None, accounting=None) -> "ContextManager":
+        return cls(
+            max_tokens=config.MAX_CONVERSATION_TOKENS,
+            threshold=getattr(config, 'COMPACTION_THRESHOLD', 0.75),
+            target=getattr(config, 'COMPACTION_TARGET', 0.5),
+            keep_recent_messages=getattr(config, 'COMPACTION_KEEP_RECENT_MESSAGES', 8),
+            stub_chars=getattr(config, 'COMPACTION_STUB_CHARS', 200),
+            summarizer=summarizer,
+            accounting=accounting
+        )
+
+    def reset(self) -> None:
+        self.compactions = 0
+
+    def projected_tokens(self, messages: List[Dict[str, Any]], overhead_tokens: int = 0,
+                         estimate: Optional[int] = None) -> int:
+        """
+        Projected prompt size of a request sending these messages. estimate, if the
+        caller already has it, is estimate_tokens(messages) + overhead_tokens.
+        """
+        if estimate is None:
+            estimate = estimate_tokens(messages) + overhead_tokens
+        return self.accounting.project(estimate) if self.accounting else estimate
+
+    def needs_compaction(self, messages: List[Dict[str, Any]], overhead_tokens: int = 0,
+                         estimate: Optional[int] = None) -> bool:
+        return self.projected_tokens(messages, overhead_tokens, estimate) >= self.max_tokens * self.threshold
+
+    def compact(self, messages: List[Dict[str, Any]], overhead_tokens: int = 0,
+                estimate: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Return a compacted copy of messages and a report of what was done.
+        The input list and its messages are not modified.
+        """
+        target_tokens = self.max_tokens * self.target
+        report = {
+            "before": self.projected_tokens(messages, overhead_tokens, estimate),
+            "stubbed": 0,
+            "summarized": 0,
+            "summary": None
+        }
+
+        messages, report["stubbed"] = self._stub_tool_results(messages)
+
+        if self.projected_tokens(messages, overhead_tokens) > target_tokens:
+            cut = self._find_cut(messages)
+            if cut:
+                summary = self._summarize(messages[:cut])
+                report["summarized"] = cut
+                report["summary"] = "model" if summary else "truncated"
+                messages = [self._prepend_summary(messages[cut], summary)] + messages[cut + 1:]
+
+        report["after"] = self.projected_tokens(messages, overhead_tokens)
+        if report["stubbed"] or report["summarized"]:
+            self.compactions += 1
+        return messages, report
+
+    def _stub_tool_results(self, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """Replace large tool results outside the recent window with short stubs."""
+        recent_start = max(0, len(messages) - self.keep_recent_messages)
+        compacted = list(messages)
+        stubbed = 0
+        for index in range(recent_start):
+            message = messages[index]
+            content = message.get("content")
+            if message.get("role") != "user" or not isinstance(content, list):
+                continue
+            blocks = []
+            changed = False
+            for block in content:
+                if isinstance(block, dict) and block.get("type") == "tool_result":
+                    stub = self._stub(block)
+                    if stub is not block:
+                        block = stub
+                        changed = True
+                        stubbed += 1
+                blocks.append(block)
+            if changed:
+                compacted[index] = {**message, "content": blocks}
+        return compacted, stubbed
+
+    def _stub(self, block: Dict[str, Any]) -> Dict[str, Any]:
+        text = content_text(block.get("content"))
+        if len(text) <= self.stub_chars and not _has_images(block.get("content")):
+            return block
+        if text.startswith("[Earlier tool result elided"):
+            return block
+        preview = text[:self.stub_chars].replace("\n", " ")
+        stub = {
+            "type": "tool_result",
+            "tool_use_id": block["tool_use_id"],
+            "content": f"[Earlier tool result elided ({len(text):,} chars). Preview: {preview}]"
+        }
+        if block.get("is_error"):
+            stub["is_error"] = True
+        return stub
+
+    def _find_cut(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Index of the latest user-typed message that leaves the recent window intact,
+        or 0 if history can't be cut without splitting a tool chain.
+        """
+        latest = len(messages) - self.keep_recent_messages
+        for index in range(min(latest, len(messages) - 1), 0, -1):
+            if is_plain_user_message(messages[index]):
+                return index
+        return 0
+
+    def _summarize(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        if self.summarizer is None:
+            return None
+        try:
+            summary = self.summarizer(render_transcript(messages))
+            return summary.strip() or None
+        except Exception as e:
+            logging.error(f"Conversation summary failed, truncating instead: {str(e)}")
+            return None
+
+    def _prepend_summary(self, message: Dict[str, Any], summary: Optional[str]) -> Dict[str, Any]:
+        if summary:
+            note = f"[Summary of the earlier conversation]\n{summary}\n[End of summary]"
+        else:
+            note = "[Earlier conversation was removed to stay within the context window]"
+        content = message.get("content")
+        if isinstance(content, list):
+            blocks = list(content)
+        else:
+            blocks = [{"type": "text", "text": content or ""}]
+        return {**message, "content": [{"type": "text", "text": note}] + blocks}
+
+
+def content_text(content: Any) -> str:
+    """Return the text of a content value, ignoring non-text blocks."""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            block = block_to_dict(block)
+            if block.get("type") == "text":
+                parts.append(block.get("text", ""))
+        return "\n".join(parts)
+    return str(content)
+
+
+def _has_images(content: Any) -> bool:
+    return isinstance(content, list) and any(block_to_dict(block).get("type") in ("image", "image_ref")
+                                             for block in content)
+
+
+def render_transcript(messages: List[Dict[str, Any]], block_chars: int = 2000) -> str:
+    """Render messages as plain text for summarization, clipping long blocks."""
+    lines = []
+    for message in messages:
+        role = message.get("role", "user").upper()
+        content = message.get("content")
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+        for block in blocks:
+            block = block_to_dict(block)
+            block_type = block.get("type")
+            if block_type == "text":
+                text = block.get("text", "")
+            elif block_type == "tool_use":
+                text = f"(called tool {block.get('name')} with {json.dumps(block.get('input', {}), default=str)})"
+            elif block_type == "tool_result":
+                text = f"(tool result) {content_text(block.get('content'))}"
+            elif block_type in ("image", "image_ref"):
+                text = "(image)"
+            else:
+                continue
+            if len(text) > block_chars:
+                text = text[:block_chars] + " ..."
+            lines.append(f"{role}: {text}")
+    return "\n".join(lines)
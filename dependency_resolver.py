@@ -0,0 +1,158 @@
+import importlib
+import importlib.util
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from rich.console import Console
+
+# Import names that differ from the distribution that provides them
+IMPORT_TO_DISTRIBUTION = {
+    'PIL': 'Pillow',
+    'bs4': 'beautifulsoup4',
+    'e2b_code_interpreter': 'e2b-code-interpreter',
+    'pyautogui': 'PyAutoGUI',
+    'readability': 'readability-lxml',
+    'dotenv': 'python-dotenv',
+    'prompt_toolkit': 'prompt-toolkit',
+    'yaml': 'PyYAML',
+    'cv2': 'opencv-python',
+    'sklearn': 'scikit-learn',
+    'skimage': 'scikit-image',
+    'dateutil': 'python-dateutil',
+    'docx': 'python-docx',
+    'pptx': 'python-pptx',
+    'magic': 'python-magic',
+    'serial': 'pyserial',
+    'Crypto': 'pycryptodome',
+    'jwt': 'PyJWT',
+    'git': 'GitPython',
+    'attr': 'attrs',
+    'fitz': 'PyMuPDF',
+}
+
+POLICIES = ('prompt', 'auto', 'never')
+
+
+def missing_module_name(error: ImportError) -> Optional[str]:
+    """
+    Return the top-level module name behind an ImportError. Follows the
+    exception chain so tools that re-raise with a friendlier message
+    (e.g. screenshottool) still resolve to the module that was missing.
+
+    Only modules that can't be found count: "cannot import name 'x' from
+    'pkg'" also sets ImportError.name, but names a package that is already
+    installed, and installing it again would never fix the import.
+    """
+    current = error
+    while current is not None:
+        name = None
+        message = str(current)
+        if isinstance(current, ModuleNotFoundError) and current.name:
+            name = current.name
+        elif "No module named" in message:
+            name = message.split("No module named")[-1].strip(" '\"")
+        if name:
+            top_level = name.split('.')[0]
+            return top_level if importlib.util.find_spec(top_level) is None else None
+        current = current.__cause__ or current.__context__
+    return None
+
+
+def distribution_for(import_name: str) -> str:
+    """Map an import name to the distribution to install."""
+    return IMPORT_TO_DISTRIBUTION.get(import_name, import_name)
+
+
+class DependencyResolver:
+    """
+    Collects the missing dependencies of every tool module during loading and
+    installs them in a single `uv pip install` transaction.
+
+    Policies:
+    - prompt: ask once for the whole batch
+    - auto: install without asking (headless use)
+    - never: skip tools with missing dependencies
+    """
+
+    def __init__(self, policy: str = 'prompt', console: Optional[Console] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown dependency install policy '{policy}'. Use one of: {', '.join(POLICIES)}")
+        self.policy = policy
+        self.console = console or Console()
+        self.missing: Dict[str, List[str]] = {}
+        self.unresolved: Dict[str, str] = {}
+        self._attempted = set()
+
+    def add(self, tool_module: str, error: ImportError) -> Optional[str]:
+        """
+        Record a tool module that failed to import. Returns the distribution
+        that would provide the missing module, or None if it can't be determined.
+        """
+        import_name = missing_module_name(error)
+        if import_name is None:
+            self.unresolved[tool_module] = str(error)
+            return None
+        distribution = distribution_for(import_name)
+        self.missing.setdefault(distribution, []).append(tool_module)
+        return distribution
+
+    def resolve(self) -> List[str]:
+        """
+        Install the pending distributions according to the policy.
+        Distributions that were already attempted are not retried.
+
+        Returns:
+            The tool modules whose dependencies were installed and should be re-imported.
+        """
+        for tool_module, message in self.unresolved.items():
+            self.console.print(f"[red]Could not determine the missing dependency for tool {tool_module}:[/red] {message}")
+        self.unresolved = {}
+
+        pending = {dist: modules for dist, modules in self.missing.items() if dist not in self._attempted}
+        for dist, modules in self.missing.items():
+            if dist in self._attempted:
+                self.console.print(f"[red]{dist} is installed but tools {', '.join(modules)} still fail to import[/red]")
+        self.missing = {}
+        if not pending:
+            return []
+
+        self.console.print("\n[yellow]Missing dependencies:[/yellow]")
+        for dist, modules in pending.items():
+            self.console.print(f"  • {dist} [dim](tools: {', '.join(modules)})[/dim]")
+
+        if not self._confirm():
+            self.console.print("[yellow]Skipping tools with missing dependencies[/yellow]")
+            return []
+
+        self._attempted.update(pending)
+        success, output = self.install(list(pending))
+        if not success:
+            self.console.print(f"[red]Failed to install dependencies. Output:[/red] {output}")
+            return []
+
+        self.console.print("[green]Dependencies installed successfully.[/green]")
+        importlib.invalidate_caches()
+        return [module for modules in pending.values() for module in modules]
+
+    def _confirm(self) -> bool:
+        if self.policy == 'auto':
+            return True
+        if self.policy == 'never':
+            return False
+        try:
+            return input("Would you like to install them? (y/n): ").lower() == 'y'
+        except EOFError:
+            return False
+
+    def install(self, distributions: List[str]) -> Tuple[bool, str]:
+        """
+        Install distributions into the running interpreter's environment with one
+        `uv pip install` call. Success is judged by uv's exit status.
+        """
+        args = ["uv", "pip", "install", "--python", sys.executable] + distributions
+        try:
+            result = subprocess.run(args, capture_output=True, text=True)
+        except FileNotFoundError:
+            return False, "uv executable not found"
+        return result.returncode == 0, result.stderr or result.stdout
@@ -0,0 +1,378 @@
+# Deterministic stand-in for the Anthropic Messages and Ollama chat APIs
+#
+# Usage: python fake_model_server.py scenarios/tool_chain.json [--port 8765]
+#
+# Point the assistant at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8765
+# (ce3.py) or OLLAMA_BASE_URL=http://127.0.0.1:8765 (ce3_ollama.py). Any API
+# key is accepted. Replies come from a scenario file:
+#
+# {
+#   "model": "fake-model",
+#   "latency_ms": 200,            # before the first byte of every reply
+#   "token_latency_ms": 5,        # between streamed text chunks
+#   "steps": [                    # one entry per model call of a user turn
+#     {"text": "Let me read it.",
+#      "tool_use": [{"name": "filecontentreadertool", "input": {"file_paths": ["readme.md"]}}]},
+#     {"text": "Done.", "latency_ms": 50}
+#   ],
+#   "failures": [                 # optional; fail the first `times` attempts of a step
+#     {"step": 0, "times": 1, "status": 529, "type": "overloaded_error"}
+#   ],
+#   "failure_rate": 0.0,          # optional; fail this share of all calls at random
+#   "seed": 0
+# }
+#
+# The step is picked from the request itself: the number of assistant messages
+# since the last message the user typed. Every user turn therefore replays the
+# steps from the start and concurrent conversations don't interfere. Calls past
+# the last step repeat it. Ollama tool calls are rendered in the
+# TOOL_CALL/TOOL_INPUT text format ce3_ollama.py parses.
+
+import argparse
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_STEPS = [{"text": "Hello from the fake model server."}]
+ERROR_TYPES = {
+    429: "rate_limit_error",
+    500: "api_error",
+    529: "overloaded_error",
+}
+
+
+class Scenario:
+    """Replies, latencies and failures loaded from a scenario file or dict."""
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.name = data.get('name', 'default')
+        self.model = data.get('model', 'fake-model')
+        self.latency_ms = data.get('latency_ms', 0)
+        self.token_latency_ms = data.get('token_latency_ms', 0)
+        self.steps: List[Dict[str, Any]] = data.get('steps') or DEFAULT_STEPS
+        self.failures: List[Dict[str, Any]] = data.get('failures', [])
+        self.failure_rate = data.get('failure_rate', 0.0)
+        self._random = random.Random(data.get('seed', 0))
+        self._attempts: Dict[Tuple[str, int], int] = collections.Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path) -> "Scenario":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data.setdefault('name', Path(path).stem)
+        return cls(data)
+
+    def step(self, index: int) -> Dict[str, Any]:
+        return self.steps[min(index, len(self.steps) - 1)]
+
+    def failure(self, request_key: str, index: int) -> Optional[Dict[str, Any]]:
+        """The error to inject for this attempt of a request, or None to answer it."""
+        with self._lock:
+            self._attempts[(request_key, index)] += 1
+            attempt = self._attempts[(request_key, index)]
+            for failure in self.failures:
+                if failure.get('step', 0) == index and attempt <= failure.get('times', 1):
+                    return failure
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                return {"status": 529, "type": "overloaded_error"}
+        return None
+
+
+def count_tokens(value: Any) -> int:
+    """Rough token count (4 characters per token) used for the reported usage."""
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    return max(1, len(text) // 4)
+
+
+def anthropic_step_index(messages: List[Dict[str, Any]]) -> int:
+    """Assistant messages since the last user message that isn't only tool results."""
+    index = 0
+    for message in reversed(messages):
+        content = message.get('content')
+        if message.get('role') == 'user':
+            if isinstance(content, list) and content and all(
+                    isinstance(block, dict) and block.get('type') == 'tool_result' for block in content):
+                continue
+            break
+        index += 1
+    return index
+
+
+def ollama_step_index(messages: List[Dict[str, Any]]) -> int:
+    """Like anthropic_step_index for ce3_ollama.py, which sends tool results as 'Tool result: ...' user messages."""
+    index = 0
+    for message in reversed(messages):
+        if message.get('role') == 'user':
+            if str(message.get('content', '')).startswith('Tool result:'):
+                continue
+            break
+        if message.get('role') == 'assistant':
+            index += 1
+    return index
+
+
+def anthropic_content(step: Dict[str, Any]) -> List[Dict[str, Any]]:
+    content = []
+    if step.get('text'):
+        content.append({"type": "text", "text": step['text']})
+    for tool_use in step.get('tool_use', []):
+        content.append({
+            "type": "tool_use",
+            "id": f"toolu_fake_{uuid.uuid4().hex[:20]}",
+            "name": tool_use['name'],
+            "input": tool_use.get('input', {})
+        })
+    return content
+
+
+def ollama_text(step: Dict[str, Any]) -> str:
+    lines = [step['text']] if step.get('text') else []
+    for tool_use in step.get('tool_use', [])[:1]:  # ce3_ollama.py runs one call per reply
+        lines.append(f"TOOL_CALL: {tool_use['name']}")
+        lines.append(f"TOOL_INPUT: {json.dumps(tool_use.get('input', {}))}")
+    return '\n'.join(lines)
+
+
+def text_chunks(text: str) -> List[str]:
+    """Split text into word-sized chunks for streaming."""
+    words = text.split(' ')
+    return [word + (' ' if i < len(words) - 1 else '') for i, word in enumerate(words)]
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    server_version = "FakeModelServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def scenario(self) -> Scenario:
+        return self.server.scenario
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json(200, {"models": [{"name": self.scenario.model, "model": self.scenario.model}]})
+        elif self.path in ('/', '/health'):
+            self._send_json(200, {"status": "ok", "scenario": self.scenario.name, "requests": self.server.requests})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {"type": "error", "error": {"type": "invalid_request_error", "message": "Invalid JSON"}})
+            return
+        with self.server.lock:
+            self.server.requests += 1
+
+        path = self.path.split('?', 1)[0]
+        if path == '/v1/messages':
+            self._anthropic_messages(body)
+        elif path == '/api/chat':
+            self._ollama_chat(body)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    # Anthropic Messages API
+
+    def _anthropic_messages(self, body: Dict[str, Any]) -> None:
+        messages = body.get('messages', [])
+        index = anthropic_step_index(messages)
+        step = self.scenario.step(index)
+        self._sleep(step.get('latency_ms', self.scenario.latency_ms))
+
+        failure = self.scenario.failure(request_key(body), index)
+        if failure is not None:
+            status = failure.get('status', 529)
+            error_type = failure.get('type') or ERROR_TYPES.get(status, 'api_error')
+            headers = {'retry-after': str(failure['retry_after'])} if 'retry_after' in failure else {}
+            self._send_json(status, {"type": "error", "error": {
+                "type": error_type, "message": failure.get('message', f"Injected {error_type}")}}, headers)
+            return
+
+        content = anthropic_content(step)
+        message = {
+            "id": f"msg_fake_{uuid.uuid4().hex[:16]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get('model', self.scenario.model),
+            "content": content,
+            "stop_reason": "tool_use" if step.get('tool_use') else "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": count_tokens([body.get('system'), body.get('tools'), messages]),
+                "output_tokens": count_tokens(content),
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0
+            }
+        }
+        if body.get('stream'):
+            self._anthropic_stream(message)
+        else:
+            self._send_json(200, message)
+
+    def _anthropic_stream(self, message: Dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        start = {**message, "content": [], "stop_reason": None,
+                 "usage": {**message['usage'], "output_tokens": 1}}
+        self._sse('message_start', {"type": "message_start", "message": start})
+        for index, block in enumerate(message['content']):
+            if block['type'] == 'text':
+                self._sse('content_block_start', {"type": "content_block_start", "index": index,
+                                                  "content_block": {"type": "text", "text": ""}})
+                for chunk in text_chunks(block['text']):
+                    self._sleep(self.scenario.token_latency_ms)
+                    self._sse('content_block_delta', {"type": "content_block_delta", "index": index,
+                                                      "delta": {"type": "text_delta", "text": chunk}})
+            else:
+                self._sse('content_block_start', {"type": "content_block_start", "index": index,
+                                                  "content_block": {**block, "input": {}}})
+                self._sse('content_block_delta', {"type": "content_block_delta", "index": index,
+                                                  "delta": {"type": "input_json_delta",
+                                                            "partial_json": json.dumps(block['input'])}})
+            self._sse('content_block_stop', {"type": "content_block_stop", "index": index})
+        self._sse('message_delta', {"type": "message_delta",
+                                    "delta": {"stop_reason": message['stop_reason'], "stop_sequence": None},
+                                    "usage": {"output_tokens": message['usage']['output_tokens']}})
+        self._sse('message_stop', {"type": "message_stop"})
+
+    def _sse(self, event: str, data: Dict[str, Any]) -> None:
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    # Ollama chat API
+
+    def _ollama_chat(self, body: Dict[str, Any]) -> None:
+        messages = body.get('messages', [])
+        index = ollama_step_index(messages)
+        step = self.scenario.step(index)
+        self._sleep(step.get('latency_ms', self.scenario.latency_ms))
+
+        failure = self.scenario.failure(request_key(body), index)
+        if failure is not None:
+            self._send_json(failure.get('status', 500), {"error": failure.get('message', "Injected failure")})
+            return
+
+        text = ollama_text(step)
+        model = body.get('model', self.scenario.model)
+        final = {
+            "model": model,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": count_tokens(messages),
+            "eval_count": count_tokens(text)
+        }
+        if not body.get('stream', False):
+            self._send_json(200, {**final, "message": {"role": "assistant", "content": text}})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for chunk in text_chunks(text):
+            self._sleep(self.scenario.token_latency_ms)
+            line = {"model": model, "created_at": final['created_at'], "done": False,
+                    "message": {"role": "assistant", "content": chunk}}
+            self.wfile.write((json.dumps(line) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write((json.dumps({**final, "message": {"role": "assistant", "content": ""}}) + '\n').encode('utf-8'))
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    @staticmethod
+    def _sleep(milliseconds: float) -> None:
+        if milliseconds:
+            time.sleep(milliseconds / 1000)
+
+
+def request_key(body: Dict[str, Any]) -> str:
+    """Identifies a request across retries, so injected failures count attempts per request."""
+    return hashlib.sha256(json.dumps(body.get('messages', []), sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class FakeModelServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering from a Scenario. Use start() to serve from
+    a background thread, e.g. inside a benchmark, and stop() to shut it down.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, scenario: Optional[Scenario] = None, host: str = '127.0.0.1', port: int = 0,
+                 verbose: bool = False):
+        super().__init__((host, port), FakeModelHandler)
+        self.scenario = scenario or Scenario()
+        self.verbose = verbose
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeModelServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve scripted Anthropic/Ollama replies for offline runs")
+    parser.add_argument('scenario', nargs='?', help="Scenario JSON file (default: a single text reply)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    scenario = Scenario.load(args.scenario) if args.scenario else Scenario()
+    server = FakeModelServer(scenario, args.host, args.port, verbose=args.verbose)
+    print(f"Serving scenario '{scenario.name}' on {server.base_url} "
+          f"(ANTHROPIC_BASE_URL / OLLAMA_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
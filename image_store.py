@@ -0,0 +1,386 @@
+import base64
+import collections
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+IMAGE_REF = "image_ref"
+
+# Leading bytes of the image formats the Messages API accepts
+MAGIC_BYTES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class ImageStore:
+    """
+    Content-addressed store for images in the conversation.
+
+    History keeps {"type": "image_ref", "image_id": ..., "media_type": ...}
+    blocks instead of inline base64; the bytes live once in <directory>/<sha256>
+    however often an image appears. References are turned back into image
+    blocks only when a request is built. When the context is compacted, images
+    older than a given number of user turns can be swapped for a downscaled
+    copy or a text placeholder.
+
+    Images not stored or referenced for max_age_seconds are deleted, oldest
+    first, as are the oldest images once the store exceeds max_bytes. The
+    store is pruned at most every prune_interval seconds while images are
+    added; a pruned image still in some history is sent as a placeholder.
+    """
+
+    def __init__(self, directory: Path, cache_entries: int = 16, max_age_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None, prune_interval: float = 300):
+        self.directory = Path(directory)
+        self.cache_entries = cache_entries
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self._encoded: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._derived: Dict[tuple, Optional[Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> "ImageStore":
+        max_age_hours = getattr(config, 'IMAGE_STORE_MAX_AGE_HOURS', None)
+        max_mb = getattr(config, 'IMAGE_STORE_MAX_MB', None)
+        return cls(
+            config.IMAGE_STORE_DIR,
+            max_age_seconds=max_age_hours * 3600 if max_age_hours else None,
+            max_bytes=max_mb * 1024 * 1024 if max_mb else None
+        )
+
+    def put(self, data: bytes, media_type: str) -> Dict[str, str]:
+        """Store image bytes and return a reference block."""
+        image_id = hashlib.sha256(data).hexdigest()
+        path = self.directory / image_id
+        if path.exists():
+            _touch(path)
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{image_id}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._maybe_prune()
+        return {"type": IMAGE_REF, "image_id": image_id, "media_type": media_type}
+
+    def prune(self, max_age_seconds: Optional[float] = None, max_bytes: Optional[int] = None) -> int:
+        """
+        Delete images last stored or referenced more than max_age_seconds ago,
+        then the oldest until the store fits max_bytes (the store's own limits
+        when not given). Returns how many images were removed.
+        """
+        max_age_seconds = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if not self.directory.exists():
+            return 0
+        files = []
+        for path in self.directory.iterdir():
+            if not re.fullmatch(r"[0-9a-f]{64}", path.name):
+                continue  # Temporary files of writes in progress
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        cutoff = time.time() - max_age_seconds if max_age_seconds is not None else None
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if not ((cutoff is not None and mtime < cutoff) or (max_bytes is not None and total > max_bytes)):
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            with self._lock:
+                self._encoded.clear()
+                self._derived.clear()
+        return removed
+
+    def _maybe_prune(self) -> None:
+        if self.max_age_seconds is None and self.max_bytes is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._last_prune and now - self._last_prune < self.prune_interval:
+                return
+            self._last_prune = now
+        self.prune()
+
+    def get(self, image_id: str) -> bytes:
+        with open(self.directory / image_id, 'rb') as f:
+            return f.read()
+
+    def put_upload(self, data: bytes, max_side: Optional[int] = 1568,
+                   max_pixels: Optional[int] = None) -> Dict[str, str]:
+        """
+        Store an uploaded image after checking its real type from its magic
+        bytes, scaled down to fit max_side and max_pixels when Pillow is
+        available. Raises ValueError if data is not a supported image or,
+        with Pillow, can't be decoded.
+        """
+        media_type = sniff_media_type(data)
+        if media_type is None:
+            raise ValueError("Unsupported image type; use PNG, JPEG, GIF or WebP")
+        try:
+            fitted = fit_image(data, max_side, max_pixels)
+            if fitted is None:
+                verify_image(data)
+        except (OSError, SyntaxError, ValueError) as e:
+            # Pillow's UnidentifiedImageError and truncated-file errors are OSErrors
+            raise ValueError(f"Corrupt or unreadable image: {str(e)}") from e
+        if fitted is not None:
+            data, media_type = fitted
+        return self.put(data, media_type)
+
+    def reference(self, image_id: str) -> Optional[Dict[str, str]]:
+        """Reference block for a stored image, or None if image_id is not in the store."""
+        if not re.fullmatch(r"[0-9a-f]{64}", image_id or ""):
+            return None
+        path = self.directory / image_id
+        try:
+            with open(path, 'rb') as f:
+                media_type = sniff_media_type(f.read(16))
+        except OSError:
+            return None
+        if media_type is None:
+            return None
+        _touch(path)
+        return {"type": IMAGE_REF, "image_id": image_id, "media_type": media_type}
+
+    def inline(self, ref: Dict[str, str]) -> Dict[str, Any]:
+        """Base64 image block for a reference, for callers that don't keep references in history."""
+        return self._image_block(ref)
+
+    def intern(self, content: Any) -> Any:
+        """
+        Return content with every inline base64 image block, including those
+        inside tool results, replaced by a reference. Other values are returned as is.
+        """
+        if not isinstance(content, list):
+            return content
+        interned = []
+        for block in content:
+            if isinstance(block, dict):
+                source = block.get("source") or {}
+                if block.get("type") == "image" and source.get("type") == "base64":
+                    try:
+                        block = self.put(base64.b64decode(source["data"]), source.get("media_type", "image/png"))
+                    except (ValueError, KeyError) as e:
+                        logging.error(f"Keeping malformed image block inline: {str(e)}")
+                elif block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                    block = {**block, "content": self.intern(block["content"])}
+            interned.append(block)
+        return interned
+
+    def materialize(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Return request-ready copies of messages with references resolved. A
+        reference always resolves to the same block, so earlier messages stay
+        byte-identical across turns and keep the prompt cache prefix valid.
+        """
+        materialized = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, list) and contains_refs(content):
+                message = {**message, "content": self._resolve(content)}
+            materialized.append(message)
+        return materialized
+
+    def age(self, messages: List[Dict[str, Any]], full_turns: Optional[int] = None,
+            downscale_max_side: int = 512, placeholder_turns: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return a copy of messages with old images rewritten in place, and how
+        many were changed. The age of an image is the number of user-typed
+        messages after the one holding it: images older than full_turns are
+        referenced as a downscaled copy and images older than placeholder_turns
+        become text placeholders. None disables either step.
+
+        This changes the prompt prefix, so callers run it only where the
+        history is rewritten anyway, i.e. when the context is compacted.
+        """
+        aged = []
+        changed = 0
+        for message, turns in zip(messages, message_turn_ages(messages)):
+            content = message.get("content")
+            if isinstance(content, list) and contains_refs(content):
+                content, count = self._age_blocks(content, turns, full_turns, downscale_max_side, placeholder_turns)
+                if count:
+                    message = {**message, "content": content}
+                    changed += count
+            aged.append(message)
+        return aged, changed
+
+    def _age_blocks(self, content: List[Any], turns: int, full_turns, max_side: int,
+                    placeholder_turns) -> Tuple[List[Any], int]:
+        aged = []
+        changed = 0
+        for block in content:
+            if isinstance(block, dict) and block.get("type") == IMAGE_REF:
+                if placeholder_turns is not None and turns > placeholder_turns:
+                    block = placeholder(block["image_id"])
+                    changed += 1
+                elif full_turns is not None and turns > full_turns:
+                    derived = self._downscaled(block["image_id"], max_side)
+                    if derived is not None:
+                        block = derived
+                        changed += 1
+            elif isinstance(block, dict) and block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                inner, count = self._age_blocks(block["content"], turns, full_turns, max_side, placeholder_turns)
+                if count:
+                    block = {**block, "content": inner}
+                    changed += count
+            aged.append(block)
+        return aged, changed
+
+    def _resolve(self, content: List[Any]) -> List[Any]:
+        resolved = []
+        for block in content:
+            if isinstance(block, dict) and block.get("type") == IMAGE_REF:
+                block = self._image_block(block)
+            elif isinstance(block, dict) and block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                block = {**block, "content": self._resolve(block["content"])}
+            resolved.append(block)
+        return resolved
+
+    def _image_block(self, ref: Dict[str, str]) -> Dict[str, Any]:
+        image_id, media_type = ref["image_id"], ref["media_type"]
+        try:
+            data = self._encode(image_id)
+        except OSError as e:
+            logging.error(f"Image {image_id} is missing from the image store: {str(e)}")
+            return placeholder(image_id)
+        return {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": data}}
+
+    def _encode(self, image_id: str) -> str:
+        with self._lock:
+            if image_id in self._encoded:
+                self._encoded.move_to_end(image_id)
+                return self._encoded[image_id]
+        data = base64.b64encode(self.get(image_id)).decode('utf-8')
+        with self._lock:
+            self._encoded[image_id] = data
+            while len(self._encoded) > self.cache_entries:
+                self._encoded.popitem(last=False)
+        return data
+
+    def _downscaled(self, image_id: str, max_side: int) -> Optional[Dict[str, str]]:
+        """Reference to a copy scaled to fit max_side, or None if Pillow is unavailable or it's small enough."""
+        key = (image_id, max_side)
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+        derived = None
+        try:
+            fitted = fit_image(self.get(image_id), max_side)
+            if fitted is not None:
+                derived = self.put(*fitted)
+        except Exception as e:
+            logging.error(f"Could not downscale image {image_id}: {str(e)}")
+        with self._lock:
+            self._derived[key] = derived
+        return derived
+
+
+def sniff_media_type(data: bytes) -> Optional[str]:
+    """Media type of image bytes from their magic bytes, or None if not a supported format."""
+    for magic, media_type in MAGIC_BYTES:
+        if data.startswith(magic):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def fit_image(data: bytes, max_side: Optional[int], max_pixels: Optional[int] = None) -> Optional[Tuple[bytes, str]]:
+    """
+    Re-encode an image scaled down to fit within max_side on its longest edge
+    and max_pixels in area. Images with transparency or a palette become PNG,
+    others JPEG. Returns (data, media_type), or None if the image already fits
+    or Pillow is unavailable.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        scale = 1.0
+        if max_side:
+            scale = min(scale, max_side / max(width, height))
+        if max_pixels:
+            scale = min(scale, math.sqrt(max_pixels / (width * height)))
+        if scale >= 1.0:
+            return None
+        image.thumbnail((max(1, int(width * scale)), max(1, int(height * scale))))
+        buffer = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(buffer, format='PNG', optimize=True)
+            return buffer.getvalue(), 'image/png'
+        image.convert('RGB').save(buffer, format='JPEG', quality=80)
+        return buffer.getvalue(), 'image/jpeg'
+
+
+def verify_image(data: bytes) -> None:
+    """Raise if Pillow can't parse the image; does nothing without Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+
+
+def _touch(path: Path) -> None:
+    """Mark a stored image as recently used so age-based pruning keeps it."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def contains_refs(content: List[Any]) -> bool:
+    for block in content:
+        if isinstance(block, dict):
+            if block.get("type") == IMAGE_REF:
+                return True
+            if block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                if contains_refs(block["content"]):
+                    return True
+    return False
+
+
+def message_turn_ages(messages: List[Dict[str, Any]]) -> List[int]:
+    """For each message, how many user-typed messages come after it."""
+    ages = []
+    later_turns = 0
+    for message in reversed(messages):
+        ages.append(later_turns)
+        content = message.get("content")
+        typed = message.get("role") == "user" and not (
+            isinstance(content, list) and any(isinstance(b, dict) and b.get("type") == "tool_result" for b in content)
+        )
+        if typed:
+            later_turns += 1
+    return list(reversed(ages))
+
+
+def placeholder(image_id: str) -> Dict[str, str]:
+    return {"type": "text", "text": f"[Earlier image {image_id[:12]} omitted]"}
@@ -0,0 +1,207 @@
+import collections
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when max_pending jobs are already waiting."""
+
+
+class Job:
+    """
+    A chat message processed in the background. Events from the assistant
+    ('text', 'tool_start', 'tool_end') are kept in order so clients can poll
+    or stream them from any index.
+    """
+
+    __slots__ = ("job_id", "owner", "status", "created", "started", "finished", "result", "error",
+                 "events", "tools", "cancel_event", "_condition")
+
+    def __init__(self, owner: Optional[str] = None):
+        self.job_id = secrets.token_urlsafe(12)
+        self.owner = owner
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.tools: List[str] = []
+        self.cancel_event = threading.Event()
+        self._condition = threading.Condition()
+
+    def on_event(self, event: Dict[str, Any]) -> None:
+        """Event callback to pass to Assistant.chat."""
+        with self._condition:
+            if event.get('type') == 'tool_start':
+                self.tools.append(event.get('name'))
+            self.events.append(event)
+            self._condition.notify_all()
+
+    def wait_events(self, after: int, timeout: float) -> List[Dict[str, Any]]:
+        """Events from index `after` on, waiting up to timeout for new ones while the job is active."""
+        with self._condition:
+            if len(self.events) <= after and self.status not in FINISHED:
+                self._condition.wait(timeout)
+            return self.events[after:]
+
+    def _set_status(self, status: str) -> None:
+        with self._condition:
+            self.status = status
+            self._condition.notify_all()
+
+    @property
+    def wait_seconds(self) -> Optional[float]:
+        """Time spent queued before a worker picked the job up."""
+        return self.started - self.created if self.started else None
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            'events': len(self.events),
+            'tools': list(self.tools),
+            'current_tool': self.tools[-1] if self.tools and self.events
+            and self.events[-1].get('type') == 'tool_start' else None,
+            'elapsed': (self.finished or time.time()) - (self.started or self.created) if self.started else 0.0
+        }
+
+    def as_dict(self, events_after: Optional[int] = None) -> Dict[str, Any]:
+        data = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'created': self.created,
+            'wait_seconds': self.wait_seconds,
+            'progress': self.progress(),
+            'result': self.result,
+            'error': self.error
+        }
+        if events_after is not None:
+            data['events'] = self.events[events_after:]
+        return data
+
+
+class JobQueue:
+    """
+    Runs jobs on a bounded thread pool so a long tool chain holds a pool
+    worker instead of a web server worker. At most max_pending jobs may wait;
+    finished jobs are kept for retention_seconds so their results can be
+    collected. Queue depth and wait times are tracked for sizing the pool.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: Optional[int] = 100, retention_seconds: float = 600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._wait_times = collections.deque(maxlen=500)
+        self.completed = 0
+        self.peak_depth = 0
+
+    @classmethod
+    def from_config(cls, config) -> "JobQueue":
+        return cls(
+            max_workers=getattr(config, 'JOB_WORKERS', 4),
+            max_pending=getattr(config, 'JOB_MAX_PENDING', 100),
+            retention_seconds=getattr(config, 'JOB_RETENTION_SECONDS', 600)
+        )
+
+    def submit(self, func: Callable[[Job], Dict[str, Any]], owner: Optional[str] = None) -> Job:
+        """
+        Queue func(job), which returns the job's result dict. Raises QueueFull
+        when too many jobs are already waiting.
+        """
+        job = Job(owner)
+        with self._lock:
+            self._prune()
+            depth = self._depth()
+            if self.max_pending is not None and depth >= self.max_pending:
+                raise QueueFull(f"{depth} jobs are already waiting")
+            self._jobs[job.job_id] = job
+            self.peak_depth = max(self.peak_depth, depth + 1)
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id: str, owner: Optional[str]) -> Optional[Job]:
+        """
+        Return a job, or None if it is unknown, expired or belongs to another
+        owner. A caller without an owner (e.g. no session cookie) gets None.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or not owner or job.owner != owner:
+            return None
+        return job
+
+    def cancel(self, job_id: str, owner: Optional[str]) -> Optional[Job]:
+        """
+        Cancel a job. A queued job never starts; a running job stops at the
+        next step of its agent loop.
+        """
+        job = self.get(job_id, owner)
+        if job is not None and job.status not in FINISHED:
+            job.cancel_event.set()
+            with job._condition:
+                # Checked under the job's condition so a worker can't start it in between
+                if job.status == QUEUED:
+                    job.finished = time.time()
+                    job.status = CANCELLED
+                    job._condition.notify_all()
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            waits = sorted(self._wait_times)
+            return {
+                'workers': self.max_workers,
+                'queued': self._depth(),
+                'running': running,
+                'completed': self.completed,
+                'retained': len(self._jobs),
+                'peak_depth': self.peak_depth,
+                'wait_mean': sum(waits) / len(waits) if waits else 0.0,
+                'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+            }
+
+    def _run(self, job: Job, func: Callable[[Job], Dict[str, Any]]) -> None:
+        with job._condition:
+            if job.status == CANCELLED:
+                return
+            job.started = time.time()
+            job.status = RUNNING
+            job._condition.notify_all()
+        with self._lock:
+            self._wait_times.append(job.wait_seconds)
+        try:
+            job.result = func(job)
+            status = CANCELLED if job.cancel_event.is_set() else DONE
+        except Exception as e:
+            logging.error(f"Job {job.job_id} failed: {str(e)}")
+            job.error = str(e)
+            status = FAILED
+        job.finished = time.time()
+        with self._lock:
+            self.completed += 1
+        job._set_status(status)
+
+    def _depth(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job_id]
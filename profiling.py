@@ -0,0 +1,173 @@
+import cProfile
+import io
+import linecache
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+# Allocations made by the profilers themselves or the import machinery are noise in a turn report
+_ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class TurnProfile:
+    """CPU and allocation results of one profiled turn."""
+
+    def __init__(self, label: str, seconds: float, stats: pstats.Stats, allocations: List[tracemalloc.StatisticDiff],
+                 peak_bytes: int, stats_path: Optional[Path] = None, report_path: Optional[Path] = None):
+        self.label = label
+        self.seconds = seconds
+        self.stats = stats
+        self.allocations = allocations
+        self.peak_bytes = peak_bytes
+        self.stats_path = stats_path
+        self.report_path = report_path
+
+    @property
+    def allocated_bytes(self) -> int:
+        return sum(diff.size_diff for diff in self.allocations)
+
+    def top_functions(self, top: int) -> str:
+        """The top functions by cumulative time, as printed by pstats."""
+        out = io.StringIO()
+        self.stats.stream = out
+        self.stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        return out.getvalue()
+
+    def top_allocations(self, top: int) -> List[tracemalloc.StatisticDiff]:
+        """Source lines that grew the most during the turn (net of what was freed)."""
+        return [diff for diff in self.allocations if diff.size_diff > 0][:top]
+
+
+class TurnProfiler:
+    """
+    Profiles whole turns with cProfile and a tracemalloc snapshot diff. While
+    enabled, every turn run inside profile() is written to output_dir as a
+    pstats file (open with `python -m pstats` or snakeviz) and a text report
+    of the slowest functions and the top allocation sites.
+
+    cProfile only sees the thread that runs the turn; with
+    PARALLEL_TOOL_EXECUTION, tool calls on the pool show up as waits.
+    """
+
+    def __init__(self, output_dir: Path, top: int = 20, frames: int = 1):
+        self.output_dir = Path(output_dir)
+        self.top = top
+        self.frames = frames
+        self.enabled = False
+        self.turns = 0
+        self._started_tracemalloc = False
+
+    @classmethod
+    def from_config(cls, config) -> "TurnProfiler":
+        return cls(
+            output_dir=getattr(config, 'PROFILE_DIR', Path('.profiles')),
+            top=getattr(config, 'PROFILE_TOP_N', 20),
+            frames=getattr(config, 'PROFILE_TRACEMALLOC_FRAMES', 1)
+        )
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        # Tracing allocations slows every allocation down, so it only runs while profiling is on
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self) -> None:
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.enabled = False
+
+    @contextmanager
+    def profile(self, label: str = 'turn') -> Iterator[List[TurnProfile]]:
+        """
+        Profile the block when enabled. Yields a list that holds the block's
+        TurnProfile once the block has finished (and stays empty when disabled).
+        """
+        results: List[TurnProfile] = []
+        if not self.enabled:
+            yield results
+            return
+
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+; before that the peak spans the whole session
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot().filter_traces(_ALLOCATION_FILTERS)
+        profiler = cProfile.Profile()
+        start_time = time.perf_counter()
+        profiler.enable()
+        try:
+            yield results
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start_time
+            after = tracemalloc.take_snapshot().filter_traces(_ALLOCATION_FILTERS)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            self.turns += 1
+            result = TurnProfile(label, seconds, pstats.Stats(profiler), after.compare_to(before, 'lineno'), peak_bytes)
+            self._save(result)
+            results.append(result)
+
+    def _save(self, result: TurnProfile) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-turn{self.turns}"
+        result.stats_path = self.output_dir / f"{stem}.pstats"
+        result.stats.dump_stats(str(result.stats_path))
+        result.report_path = self.output_dir / f"{stem}.txt"
+        result.report_path.write_text(self.format_report(result), encoding='utf-8')
+
+    def format_report(self, result: TurnProfile) -> str:
+        lines = [
+            f"Profile of {result.label}: {result.seconds:.3f}s, "
+            f"{result.allocated_bytes / 1024:+.1f} KiB net allocated, peak {result.peak_bytes / 1024:.1f} KiB traced",
+            "",
+            f"Top {self.top} allocation sites (net growth during the turn):",
+        ]
+        for diff in result.top_allocations(self.top):
+            frame = diff.traceback[0]
+            lines.append(f"  {diff.size_diff / 1024:+10.1f} KiB {diff.count_diff:+8d} blocks  "
+                         f"{frame.filename}:{frame.lineno}")
+            source = linecache.getline(frame.filename, frame.lineno).strip()
+            if source:
+                lines.append(f"        {source}")
+        lines.append("")
+        lines.append(result.top_functions(self.top))
+        return '\n'.join(lines)
+
+
+def render_profile(console, result: TurnProfile, top: int = 10) -> None:
+    """Print the slowest functions and largest allocation sites of a profiled turn."""
+    from rich.table import Table
+
+    functions = Table(title=f"Profile: {result.seconds:.2f}s in {result.label}", title_justify="left")
+    functions.add_column("Function")
+    functions.add_column("Calls", justify="right")
+    functions.add_column("Own ms", justify="right")
+    functions.add_column("Cumulative ms", justify="right")
+    rows = sorted(result.stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    for (filename, lineno, name), (_, calls, own, cumulative, _) in rows[:top]:
+        label = f"{name} ({Path(filename).name}:{lineno})" if lineno else name
+        functions.add_row(label, str(calls), f"{own * 1000:.1f}", f"{cumulative * 1000:.1f}")
+    console.print(functions)
+
+    allocations = Table(title=f"Allocations: {result.allocated_bytes / 1024:+.1f} KiB net, "
+                              f"peak {result.peak_bytes / 1024:.1f} KiB", title_justify="left")
+    allocations.add_column("Source line")
+    allocations.add_column("KiB", justify="right")
+    allocations.add_column("Blocks", justify="right")
+    for diff in result.top_allocations(top):
+        frame = diff.traceback[0]
+        allocations.add_row(f"{Path(frame.filename).name}:{frame.lineno}", f"{diff.size_diff / 1024:+.1f}",
+                            f"{diff.count_diff:+d}")
+    console.print(allocations)
+    console.print(f"[dim]Saved {result.stats_path} and {result.report_path}[/dim]")
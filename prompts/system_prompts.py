@@ -23,6 +23,7 @@ class SystemPrompts:
        - FileEditTool: Edits existing file contents
        - GitOperationsTool: Handles Git operations (clone, commit, push, etc.)
        - LintingTool: Lints Python code using Ruff
+       - ResultPagerTool: Reads ranges of large tool results that were stored out of band
        - SequentialThinkingTool: Helps break down complex problems into steps
        - ShellTool: Executes shell commands securely
        - ToolCreatorTool: Creates new tool classes based on descriptions
@@ -74,3 +75,14 @@ class SystemPrompts:
     I can help with various development tasks while maintaining
     security and following best practices.
     """
+
+    COMPACTION_SUMMARY = """
+    You are summarizing the earlier part of a conversation between a user and a
+    software engineering assistant so the conversation can continue without it.
+    Write a concise summary that preserves:
+    - The user's goals, requirements and preferences
+    - Decisions made and the reasons for them
+    - Files, paths, commands and tools that were used or changed
+    - Results, errors and anything still unresolved
+    Write only the summary.
+    """
@@ -0,0 +1,152 @@
+import collections
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from context_manager import CHARS_PER_TOKEN, estimate_tokens
+from job_queue import FINISHED
+
+
+class Session:
+    """
+    One browser's conversation. Its assistant is only used by the session's
+    current job; `lock` guards checking and replacing that job and is never
+    held while the assistant runs.
+    """
+
+    __slots__ = ("session_id", "assistant", "lock", "job", "created", "last_used")
+
+    def __init__(self, session_id: str, assistant):
+        self.session_id = session_id
+        self.assistant = assistant
+        self.lock = threading.Lock()
+        self.job = None  # The latest chat job submitted for this session
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    @property
+    def active_job(self):
+        """The session's job if it is still queued or running, else None."""
+        job = self.job
+        return job if job is not None and job.status not in FINISHED else None
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked() or self.active_job is not None
+
+    def history_bytes(self) -> int:
+        """Approximate size of the conversation history (images are stored by reference)."""
+        return estimate_tokens(self.assistant.conversation_history) * CHARS_PER_TOKEN
+
+
+class SessionManager:
+    """
+    Maps session ids to per-session Assistants for the web app.
+
+    Sessions are created from factory(), which should share the API client and
+    tool registry of a prototype (see Assistant.new_session), so a new session
+    only costs its own history. Sessions are kept in LRU order and evicted
+    when idle for longer than idle_timeout, when there are more than
+    max_sessions, or when their combined history exceeds max_memory_bytes.
+    A session that is handling a request is never evicted.
+    """
+
+    def __init__(self, factory: Callable[[], Any], max_sessions: int = 100,
+                 idle_timeout: Optional[float] = 3600, max_memory_bytes: Optional[int] = None):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_memory_bytes = max_memory_bytes
+        self._sessions: "collections.OrderedDict[str, Session]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config, factory) -> "SessionManager":
+        memory_limit = getattr(config, 'SESSION_MEMORY_LIMIT_MB', None)
+        return cls(
+            factory,
+            max_sessions=getattr(config, 'MAX_SESSIONS', 100),
+            idle_timeout=getattr(config, 'SESSION_IDLE_TIMEOUT', 3600),
+            max_memory_bytes=memory_limit * 1024 * 1024 if memory_limit else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_urlsafe(24)
+
+    def get(self, session_id: Optional[str]) -> Session:
+        """
+        Return the session for session_id. If it is missing, unknown or was
+        evicted, a new session is started under a fresh id; an id chosen by
+        the client is never adopted, so a planted cookie can't fix the id of
+        someone else's session. Callers compare session_id to see if the
+        client needs the new id.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None:
+                self._sessions.move_to_end(session.session_id)
+                session.last_used = time.monotonic()
+                return session
+
+        # Building an assistant can take a while; don't hold the table lock for it
+        session = Session(self.new_id(), self.factory())
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._evict()
+        return session
+
+    def remove(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict(self) -> int:
+        """Apply the eviction policy now; returns how many sessions were evicted."""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        evicted = 0
+        now = time.monotonic()
+        if self.idle_timeout is not None:
+            for session_id, session in list(self._sessions.items()):
+                if not session.busy and now - session.last_used > self.idle_timeout:
+                    del self._sessions[session_id]
+                    evicted += 1
+
+        # History sizes are measured once per pass; evictions subtract from the total
+        sizes = {}
+        if self.max_memory_bytes is not None:
+            sizes = {session_id: session.history_bytes() for session_id, session in self._sessions.items()}
+        total_bytes = sum(sizes.values())
+
+        newest = next(reversed(self._sessions), None)
+        for session_id, session in list(self._sessions.items()):
+            over_limit = len(self._sessions) > self.max_sessions or (
+                self.max_memory_bytes is not None and total_bytes > self.max_memory_bytes)
+            if not over_limit:
+                break
+            # Least recently used first; the newest session is never evicted
+            if session_id == newest or session.busy:
+                continue
+            del self._sessions[session_id]
+            total_bytes -= sizes.get(session_id, 0)
+            evicted += 1
+
+        self.evictions += evicted
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            'sessions': len(sessions),
+            'busy': sum(1 for session in sessions if session.busy),
+            'history_bytes': sum(session.history_bytes() for session in sessions),
+            'evictions': self.evictions
+        }
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+HANDLE_PATTERN = re.compile(r'^[0-9a-f]{16,64}$')
+
+
+class SpillStore:
+    """
+    Content-addressed store for tool results too large to keep in the
+    conversation. A spilled result is written once to <directory>/<sha256>.txt
+    and replaced in the conversation by a handle and a preview; the model reads
+    the parts it needs through resultpagertool.
+    """
+
+    def __init__(self, directory: Path, threshold_chars: int = 20000, preview_chars: int = 1500):
+        self.directory = Path(directory)
+        self.threshold_chars = threshold_chars
+        self.preview_chars = preview_chars
+
+    @classmethod
+    def from_config(cls, config) -> "SpillStore":
+        return cls(
+            directory=config.SPILL_DIR,
+            threshold_chars=getattr(config, 'SPILL_THRESHOLD_CHARS', 20000),
+            preview_chars=getattr(config, 'SPILL_PREVIEW_CHARS', 1500)
+        )
+
+    def put(self, text: str) -> str:
+        """Store text and return its handle. Identical text is stored once."""
+        handle = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        path = self._path(handle)
+        if not path.exists():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        return handle
+
+    def get(self, handle: str) -> str:
+        """Return the stored text for a handle. Raises KeyError if it doesn't exist."""
+        if not HANDLE_PATTERN.match(handle or ''):
+            raise KeyError(f"Invalid result handle '{handle}'")
+        try:
+            with open(self._path(handle), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(f"No stored result for handle '{handle}'")
+
+    def spill(self, result: Any) -> Optional[str]:
+        """
+        Spill a tool result if it exceeds the threshold. Returns the text that
+        replaces it in the conversation, or None if the result is kept inline.
+        Lists of content blocks (e.g. images) are always kept inline.
+        """
+        if isinstance(result, str):
+            text = result
+        elif isinstance(result, dict) or (isinstance(result, list) and not is_content_blocks(result)):
+            text = json.dumps(result, indent=2, default=str)
+        else:
+            return None
+        if len(text) <= self.threshold_chars:
+            return None
+
+        handle = self.put(text)
+        line_count = text.count('\n') + 1
+        summary = [f"[Large result stored out of band. handle={handle} "
+                   f"({len(text):,} chars, {line_count:,} lines)]"]
+        keys = json_keys(text)
+        if keys:
+            shown = ", ".join(keys[:50])
+            more = f" and {len(keys) - 50} more" if len(keys) > 50 else ""
+            summary.append(f"Top-level JSON keys: {shown}{more}")
+        summary.append(f"Preview:\n{text[:self.preview_chars]}")
+        summary.append("[Use resultpagertool with this handle to read more by offset, line range or JSON key]")
+        return "\n".join(summary)
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete stored results older than max_age_seconds and return how many were removed."""
+        if not self.directory.exists():
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for path in self.directory.glob('*.txt'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _path(self, handle: str) -> Path:
+        return self.directory / f"{handle}.txt"
+
+
+def is_content_blocks(result: List[Any]) -> bool:
+    """True for a list of API content blocks, such as the image blocks returned by screenshottool."""
+    return bool(result) and all(isinstance(item, dict) and item.get("type") in ("text", "image")
+                                for item in result)
+
+
+def json_keys(text: str) -> List[str]:
+    """Return the top-level keys of a JSON object, or [] if text isn't one."""
+    if not text.lstrip().startswith('{'):
+        return []
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return []
+    return [str(key) for key in data] if isinstance(data, dict) else []
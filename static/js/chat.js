@@ -1,5 +1,5 @@
-let currentImageData = null;
-let currentMediaType = null;
+let currentImageId = null;
+let currentImageUrl = null;
 
 // Auto-resize textarea
 const textarea = document.getElementById('message-input');
@@ -60,6 +60,11 @@ document.getElementById('upload-btn').addEventListener('click', () => {
 document.getElementById('file-input').addEventListener('change', async (e) => {
     const file = e.target.files[0];
     if (file) {
+        // Preview the local file right away; the server keeps the uploaded copy
+        currentImageUrl = URL.createObjectURL(file);
+        document.getElementById('preview-img').src = currentImageUrl;
+        document.getElementById('image-preview').classList.remove('hidden');
+
         const formData = new FormData();
         formData.append('file', file);
 
@@ -71,21 +76,30 @@ document.getElementById('file-input').addEventListener('change', async (e) => {
             const data = await response.json();
             
             if (data.success) {
-                currentImageData = data.image_data;
-                currentMediaType = data.media_type;
-                document.getElementById('preview-img').src = `data:${data.media_type};base64,${data.image_data}`;
-                document.getElementById('image-preview').classList.remove('hidden');
+                currentImageId = data.image_id;
+            } else {
+                console.error('Error uploading image:', data.error);
+                clearImage();
             }
         } catch (error) {
             console.error('Error uploading image:', error);
+            clearImage();
         }
     }
 });
 
-document.getElementById('remove-image').addEventListener('click', () => {
-    currentImageData = null;
+function clearImage(revoke = true) {
+    if (revoke && currentImageUrl) {
+        URL.revokeObjectURL(currentImageUrl);
+    }
+    currentImageId = null;
+    currentImageUrl = null;
     document.getElementById('image-preview').classList.add('hidden');
     document.getElementById('file-input').value = '';
+}
+
+document.getElementById('remove-image').addEventListener('click', () => {
+    clearImage();
 });
 
 function appendThinkingIndicator() {
@@ -180,6 +194,136 @@ function updateTokenUsage(usedTokens, maxTokens) {
     }
 }
 
+// Turn a rejected /chat or /chat/stream response into a message for the user.
+// A 409 means this session's previous message is still running; its job_id
+// belongs to that message, so it is never adopted for the new one.
+async function rejectedMessage(response) {
+    if (response.status === 409) {
+        return 'Error: Your previous message is still being processed. Wait for it to finish, then send again.';
+    }
+    try {
+        const body = await response.json();
+        return `Error: ${body.error || response.statusText}`;
+    } catch (e) {
+        return `Error: ${response.status} ${response.statusText}`;
+    }
+}
+
+// Stream a message through the /chat/stream Server-Sent Events endpoint.
+// Returns false only if streaming is unavailable (network error or no response
+// body) so the caller can fall back to /chat; rejections are shown to the user.
+async function sendMessageStreaming(payload, thinkingMessage) {
+    let response;
+    try {
+        response = await fetch('/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: payload
+        });
+    } catch (error) {
+        return false;
+    }
+    if (!response.ok) {
+        const message = await rejectedMessage(response);
+        if (thinkingMessage) {
+            thinkingMessage.remove();
+        }
+        appendMessage(message);
+        return true;
+    }
+    if (!response.body) {
+        return false;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let currentText = '';
+    let currentDiv = null;
+    let receivedText = false;
+
+    const removeThinking = () => {
+        if (thinkingMessage) {
+            thinkingMessage.remove();
+            thinkingMessage = null;
+        }
+    };
+
+    const handleEvent = (event) => {
+        if (event.type === 'text') {
+            removeThinking();
+            if (!currentDiv) {
+                appendMessage('');
+                currentDiv = document.querySelector('.message-wrapper:last-child .prose');
+                currentText = '';
+            }
+            currentText += event.text;
+            receivedText = true;
+            try {
+                currentDiv.innerHTML = marked.parse(currentText);
+            } catch (e) {
+                currentDiv.textContent = currentText;
+            }
+            const messagesDiv = document.getElementById('chat-messages');
+            messagesDiv.scrollTop = messagesDiv.scrollHeight;
+        } else if (event.type === 'tool_start') {
+            removeThinking();
+            appendToolUsage(event.name);
+            // Text after a tool call starts a new message
+            currentDiv = null;
+        } else if (event.type === 'done') {
+            removeThinking();
+            if (event.token_usage) {
+                updateTokenUsage(event.token_usage.context_tokens, event.token_usage.max_tokens);
+            }
+            if (!receivedText) {
+                appendMessage(event.response || 'Error: No response received');
+            }
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        for (const frame of frames) {
+            const data = frame.split('\n')
+                .filter(line => line.startsWith('data: '))
+                .map(line => line.slice(6))
+                .join('\n');
+            if (data) {
+                handleEvent(JSON.parse(data));
+            }
+        }
+    }
+    removeThinking();
+    return true;
+}
+
+// Poll a background chat job until it finishes and return its result
+async function waitForJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        if (!response.ok) {
+            return { response: `Error: ${job.error}` };
+        }
+        if (job.status === 'done' || job.status === 'cancelled') {
+            return job.result || { response: 'Cancelled.' };
+        }
+        if (job.status === 'failed') {
+            return { response: `Error: ${job.error}` };
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 // Update the chat form submit handler
 document.getElementById('chat-form').addEventListener('submit', async (e) => {
     e.preventDefault();
@@ -187,14 +331,14 @@ document.getElementById('chat-form').addEventListener('submit', async (e) => {
     const messageInput = document.getElementById('message-input');
     const message = messageInput.value.trim();
     
-    if (!message && !currentImageData) return;
+    if (!message && !currentImageId) return;
     
     // Append user message (and image if present)
     appendMessage(message, true);
-    if (currentImageData) {
-        // Optionally show the image in the chat
+    if (currentImageId) {
+        // Show the local copy of the image in the chat
         const imagePreview = document.createElement('img');
-        imagePreview.src = `data:image/jpeg;base64,${currentImageData}`;
+        imagePreview.src = currentImageUrl;
         imagePreview.className = 'max-h-48 rounded-lg mt-2';
         document.querySelector('.message-wrapper:last-child .prose').appendChild(imagePreview);
     }
@@ -206,46 +350,51 @@ document.getElementById('chat-form').addEventListener('submit', async (e) => {
     try {
         // Add thinking indicator
         const thinkingMessage = appendThinkingIndicator();
-        
-        const response = await fetch('/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                message: message,
-                image: currentImageData  // This will be null if no image is selected
-            })
+        const payload = JSON.stringify({
+            message: message,
+            image_id: currentImageId  // This will be null if no image is selected
         });
         
-        const data = await response.json();
-        
-        // Update token usage if provided in response
-        if (data.token_usage) {
-            updateTokenUsage(data.token_usage.total_tokens, data.token_usage.max_tokens);
-        }
-        
-        // Remove thinking indicator
-        if (thinkingMessage) {
-            thinkingMessage.remove();
-        }
-        
-        // Show tool usage if present
-        if (data.tool_name) {
-            appendToolUsage(data.tool_name);
-        }
-        
-        // Show response if we have one
-        if (data && data.response) {
-            appendMessage(data.response);
-        } else {
-            appendMessage('Error: No response received');
+        const streamed = await sendMessageStreaming(payload, thinkingMessage);
+        if (!streamed) {
+            const response = await fetch('/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: payload
+            });
+            
+            // /chat queues the message as a job; wait for its result
+            const data = response.ok
+                ? await waitForJob((await response.json()).job_id)
+                : { response: await rejectedMessage(response) };
+            
+            // Update token usage if provided in response
+            if (data.token_usage) {
+                updateTokenUsage(data.token_usage.context_tokens, data.token_usage.max_tokens);
+            }
+            
+            // Remove thinking indicator
+            if (thinkingMessage) {
+                thinkingMessage.remove();
+            }
+            
+            // Show tool usage if present
+            if (data.tool_name) {
+                appendToolUsage(data.tool_name);
+            }
+            
+            // Show response if we have one
+            if (data && data.response) {
+                appendMessage(data.response);
+            } else {
+                appendMessage('Error: No response received');
+            }
         }
         
-        // Clear image after sending
-        currentImageData = null;
-        document.getElementById('image-preview').classList.add('hidden');
-        document.getElementById('file-input').value = '';
+        // Clear image after sending; the chat still shows its local copy
+        clearImage(false);
         
     } catch (error) {
         console.error('Error sending message:', error);
@@ -286,9 +435,7 @@ window.addEventListener('load', async () => {
         }
         
         // Reset any other state
-        currentImageData = null;
-        document.getElementById('image-preview')?.classList.add('hidden');
-        document.getElementById('file-input').value = '';
+        clearImage();
         document.getElementById('message-input').value = '';
         resetTextarea();
         
@@ -0,0 +1,156 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import Config  # noqa: E402
+
+
+def use_temporary_stores(monkeypatch, root):
+    """Point every on-disk store, and the tool manifest, under root."""
+    monkeypatch.setattr(Config, 'ANTHROPIC_API_KEY', Config.ANTHROPIC_API_KEY or 'test-key')
+    monkeypatch.setattr(Config, 'SPILL_DIR', root / 'spill')
+    monkeypatch.setattr(Config, 'IMAGE_STORE_DIR', root / 'images')
+    monkeypatch.setattr(Config, 'CASSETTE_DIR', root / 'cassettes')
+    monkeypatch.setattr(Config, 'TRACE_FILE', root / 'traces' / 'trace.jsonl')
+    monkeypatch.setattr(Config, 'PROFILE_DIR', root / 'profiles')
+    monkeypatch.setattr(Config, 'TOOL_MANIFEST_FILE', root / 'tool_manifest.json')
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    """Config with an API key and every on-disk store under tmp_path."""
+    use_temporary_stores(monkeypatch, tmp_path)
+    monkeypatch.setattr(Config, 'ANTHROPIC_API_KEY', 'test-key')
+    monkeypatch.setattr(Config, 'ENABLE_THINKING', False)
+    monkeypatch.setattr(Config, 'SHOW_TOOL_USAGE', False)
+    return Config
+
+
+@pytest.fixture
+def assistant(config):
+    """An Assistant with no tools and no API client; tests register what they need."""
+    import ce3
+    from tool_registry import ToolRegistry
+
+    assistant = ce3.Assistant(client=SimpleNamespace(), tool_registry=ToolRegistry(), tools=[])
+    assistant.console.quiet = True
+    return assistant
+
+
+def tool_use(name, tool_input=None, id='toolu_1'):
+    """A tool_use block as the SDK returns it."""
+    return SimpleNamespace(type='tool_use', id=id, name=name, input=tool_input or {})
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """
+    The Flask app module, imported once. Config is only patched while the
+    module builds its assistant and stores, then restored.
+    """
+    root = tmp_path_factory.mktemp('webapp')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        use_temporary_stores(monkeypatch, root)
+        monkeypatch.setattr(Config, 'DEPENDENCY_INSTALL_POLICY', 'never')
+        import app
+    app.assistant.console.quiet = True
+    return app
+
+
+@pytest.fixture
+def webapp(app_module, config):
+    """The Flask app module, with Config pointing at temporary stores for the test."""
+    return app_module
+
+
+class ScriptedClient:
+    """
+    Stands in for anthropic.Anthropic: messages.create answers with the next
+    scripted step, either {'text': ...} or {'tool': name, 'input': {...}}.
+    messages.stream does the same, yielding the text word by word.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.requests = []
+        self.messages = self
+
+    def create(self, **request):
+        from anthropic.types import Message
+
+        self.requests.append(request)
+        step = self.steps[len(self.requests) - 1]
+        if 'tool' in step:
+            content = [{'type': 'tool_use', 'id': f"toolu_{len(self.requests)}", 'name': step['tool'],
+                        'input': step.get('input', {})}]
+            stop_reason = 'tool_use'
+        else:
+            content = [{'type': 'text', 'text': step['text']}]
+            stop_reason = 'end_turn'
+        return Message.model_validate({
+            'id': f"msg_{len(self.requests)}", 'type': 'message', 'role': 'assistant', 'model': request['model'],
+            'content': content, 'stop_reason': stop_reason, 'stop_sequence': None,
+            'usage': {'input_tokens': 100, 'output_tokens': 10}
+        })
+
+    def stream(self, **request):
+        return ScriptedStream(self.create(**request))
+
+
+class ScriptedStream:
+    """The context manager returned by ScriptedClient.messages.stream."""
+
+    def __init__(self, message):
+        self.message = message
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        for block in self.message.content:
+            if block.type == 'text':
+                words = block.text.split(' ')
+                yield from (word if i == 0 else ' ' + word for i, word in enumerate(words))
+
+    def get_final_message(self):
+        return self.message
+
+
+class AsyncScriptedClient:
+    """ScriptedClient for AsyncAnthropic: messages.create is awaited and streams are async."""
+
+    def __init__(self, steps):
+        self.scripted = ScriptedClient(steps)
+        self.requests = self.scripted.requests
+        self.messages = self
+
+    async def create(self, **request):
+        return self.scripted.create(**request)
+
+    def stream(self, **request):
+        return AsyncScriptedStream(self.scripted.create(**request))
+
+
+class AsyncScriptedStream(ScriptedStream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for text in ScriptedStream.text_stream.fget(self):
+            yield text
+
+    async def get_final_message(self):
+        return self.message
@@ -0,0 +1,78 @@
+import threading
+
+from agent_loop import AgentLoop
+from conftest import ScriptedClient
+from test_tool_registry import EchoTool
+
+
+def test_no_limits_never_stops():
+    loop = AgentLoop()
+    for _ in range(100):
+        loop.record('model', 0.0, tokens=1000)
+    assert loop.stop_reason() is None
+
+
+def test_step_limit_counts_model_calls_only():
+    loop = AgentLoop(max_steps=2)
+    loop.record('model', 0.0)
+    loop.record('tools', 0.0)
+    assert loop.stop_reason() is None
+    loop.record('model', 0.0)
+    assert loop.stop_reason() == 'step limit of 2 reached'
+
+
+def test_token_budget():
+    loop = AgentLoop(token_budget=1500)
+    loop.record('model', 0.0, tokens=1000)
+    assert loop.stop_reason() is None
+    loop.record('model', 0.0, tokens=500)
+    assert loop.stop_reason() == 'token budget of 1,500 reached'
+
+
+def test_deadline():
+    loop = AgentLoop(deadline_seconds=30)
+    assert loop.stop_reason() is None
+    loop.started_at -= 31
+    assert loop.stop_reason() == 'deadline of 30s reached'
+
+
+def test_cancel_event_wins():
+    cancel = threading.Event()
+    loop = AgentLoop(max_steps=10, cancel_event=cancel)
+    assert loop.stop_reason() is None
+    cancel.set()
+    assert loop.stop_reason() == 'cancelled'
+
+
+def test_listeners_get_events_and_failures_are_contained():
+    events = []
+
+    def broken(event):
+        raise RuntimeError('listener bug')
+
+    loop = AgentLoop(listeners=[broken, events.append])
+    loop.record('model', 0.25, tokens=10, stop_reason='tool_use')
+    loop.record('tools', 0.5, count=2)
+    assert [(event.step, event.kind, event.tokens) for event in events] == [(1, 'model', 10), (1, 'tools', 0)]
+    assert events[0].detail == {'stop_reason': 'tool_use'}
+    assert loop.tokens == 10
+
+
+def test_chat_stops_a_runaway_tool_chain(assistant, config, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_AGENT_STEPS', 3)
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.client = ScriptedClient([{'tool': 'echotool', 'input': {'text': 'again'}}] * 10)
+
+    reply = assistant.chat('loop forever')
+
+    assert reply.startswith('Stopped after 3 steps: step limit of 3 reached')
+    assert len(assistant.client.requests) == 3
+
+
+def test_chat_honours_a_set_cancel_event(assistant):
+    assistant.client = ScriptedClient([{'text': 'never sent'}])
+    cancel = threading.Event()
+    cancel.set()
+
+    assert 'cancelled' in assistant.chat('hello', cancel_event=cancel)
+    assert assistant.client.requests == []
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+import anthropic
+import httpx
+import pytest
+
+from api_resilience import (LatencyTracker, RateLimiter, ResilientAPI, RetryPolicy, hedge_executor,
+                            is_retryable, retry_after)
+
+REQUEST = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+
+
+def status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    return anthropic.APIStatusError(f'status {status}', response=response, body=None)
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after': '2'}, 2.0),
+    ({'retry-after-ms': '1500'}, 1.5),
+    ({'retry-after': 'soon'}, None),
+    ({'retry-after': 'Mon, 99 Foo 2024 25:61:00 GMT'}, None),
+    ({}, None),
+])
+def test_retry_after(headers, expected):
+    assert retry_after(status_error(429, headers)) == expected
+
+
+def test_retry_after_http_date_in_the_past_is_zero():
+    assert retry_after(status_error(529, {'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0.0
+
+
+def test_retryable_statuses():
+    assert is_retryable(status_error(529))
+    assert is_retryable(status_error(429))
+    assert not is_retryable(status_error(400))
+
+
+def test_unparseable_retry_after_is_still_retried(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    errors = [status_error(429, {'retry-after': 'soon'})]
+
+    def call():
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    api = ResilientAPI(policy=RetryPolicy(max_retries=2, base_delay=0.01), limiter=RateLimiter(None))
+    assert api.call(call) == 'ok'
+    assert api.metrics.as_dict()['retries'] == {'429': 1}
+
+
+def test_non_retryable_error_is_raised_without_retry():
+    api = ResilientAPI(policy=RetryPolicy(max_retries=3, base_delay=0.01), limiter=RateLimiter(None))
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise status_error(400)
+
+    with pytest.raises(anthropic.APIStatusError):
+        api.call(call)
+    assert len(calls) == 1
+
+
+def hedging_api():
+    latency = LatencyTracker(min_samples=1)
+    latency.add(0.01)
+    return ResilientAPI(policy=RetryPolicy(max_retries=0), limiter=RateLimiter(None),
+                        hedging=True, latency=latency)
+
+
+def test_hedged_loser_is_billed_when_it_finishes():
+    release = threading.Event()
+    discarded = []
+    finished = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return 'slow'
+        return 'fast'
+
+    def on_discarded(response):
+        discarded.append(response)
+        finished.set()
+
+    api = hedging_api()
+    assert api.call(call, on_discarded=on_discarded) == 'fast'
+    assert api.metrics.as_dict()['hedge_wins'] == 1
+    release.set()
+    assert finished.wait(5)
+    assert discarded == ['slow']
+
+
+def test_sessions_share_one_hedge_pool():
+    first, second = hedging_api(), hedging_api()
+    threads = set()
+
+    def call():
+        threads.add(threading.current_thread().name)
+        return 'ok'
+
+    first.call(call)
+    second.call(call)
+    assert not hasattr(first, '_hedge_executor')
+    assert len(threads) <= hedge_executor()._max_workers
+    assert all(name.startswith('api-hedge') for name in threads)
+
+
+def test_async_hedge_cancels_the_losing_request():
+    cancelled = []
+    discarded = []
+
+    async def run():
+        calls = []
+
+        async def request():
+            calls.append(1)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(1)
+                    raise
+                return 'slow'
+            return 'fast'
+
+        result = await hedging_api().acall(request, on_discarded=discarded.append)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == 'fast'
+    assert cancelled == [1]
+    assert discarded == []
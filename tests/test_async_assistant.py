@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import pytest
+
+from cassette import Cassette, CassettePlayer
+from conftest import AsyncScriptedClient, ScriptedClient
+from test_tool_registry import EchoTool
+from tool_registry import ToolRegistry
+from tracing import Tracer
+
+STEPS = [{'tool': 'echotool', 'input': {'text': 'hi'}}, {'text': 'Done here.'}]
+
+
+class ThreadNameTool(EchoTool):
+    name = 'threadnametool'
+
+    def execute(self, text=''):
+        return threading.current_thread().name
+
+
+@pytest.fixture
+def async_assistant(config):
+    from ce3_async import AsyncAssistant
+
+    assistant = AsyncAssistant(client=ScriptedClient([]), tool_registry=ToolRegistry(), tools=[])
+    assistant.console.quiet = True
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.async_client = AsyncScriptedClient(STEPS)
+    return assistant
+
+
+def test_chat_runs_the_tool_chain(async_assistant):
+    assert asyncio.run(async_assistant.chat('echo hi')) == 'Done here.'
+    assert len(async_assistant.async_client.requests) == 2
+    tool_result = async_assistant.conversation_history[2]['content'][0]
+    assert tool_result['type'] == 'tool_result' and tool_result['content'] == [{'type': 'text', 'text': 'hi'}]
+
+
+def test_chat_streams_events(async_assistant):
+    events = []
+    asyncio.run(async_assistant.chat('echo hi', on_event=events.append))
+    assert [event['type'] for event in events] == ['tool_start', 'tool_end', 'text', 'text']
+    assert ''.join(event['text'] for event in events if event['type'] == 'text') == 'Done here.'
+
+
+def test_only_tool_calls_use_the_tool_pool(async_assistant):
+    async_assistant.tool_registry.register(ThreadNameTool(), 'tools.threadnametool')
+    async_assistant.async_client = AsyncScriptedClient([{'tool': 'threadnametool'}, {'text': 'Done.'}])
+    command_threads = []
+    compact = async_assistant._compact_history_if_needed
+
+    def record_thread():
+        command_threads.append(threading.current_thread().name)
+        return compact()
+
+    async_assistant._compact_history_if_needed = record_thread
+    asyncio.run(async_assistant.chat('which thread?'))
+
+    assert async_assistant.conversation_history[2]['content'][0]['content'][0]['text'].startswith('tool-call')
+    assert command_threads and not any(name.startswith('tool-call') for name in command_threads)
+
+
+def test_chat_is_traced_and_timed(async_assistant, config):
+    async_assistant.tracer = Tracer.from_config(config)
+    asyncio.run(async_assistant.chat('echo hi'))
+
+    names = [span.name for span in async_assistant.tracer.last_trace()]
+    assert names[0] == 'turn'
+    assert names.count('model') == 2 and 'tool_call' in names
+    phases = async_assistant.phase_timer.as_dict()
+    assert {'model', 'serialize', 'compaction', 'dispatch', 'tool'} <= set(phases)
+    turn = async_assistant.turns[-1]
+    assert (turn.model_calls, turn.tools_used) == (2, ['echotool'])
+
+
+def test_record_and_replay(async_assistant, tmp_path):
+    path = tmp_path / 'async.cassette.jsonl.gz'
+    async_assistant.start_recording(path)
+    asyncio.run(async_assistant.chat('echo hi'))
+    async_assistant.stop_recording()
+    assert isinstance(async_assistant.async_client, AsyncScriptedClient)
+
+    cassette = Cassette.load(path)
+    assert [event['type'] for event in cassette.events] == ['meta', 'user', 'model', 'tool', 'model']
+
+    replaying = async_assistant.new_session()
+    player = CassettePlayer(cassette)
+    replaying.start_replay(player)
+    assert asyncio.run(replaying.chat('echo hi', on_event=lambda event: None)) == 'Done here.'
+    assert player.finished and not player.mismatches
@@ -0,0 +1,89 @@
+import pytest
+
+from cassette import Cassette, CassetteMismatch, CassettePlayer, common_prefix, prefix_key, request_hash
+from conftest import ScriptedClient
+from test_tool_registry import EchoTool
+
+STEPS = [{'tool': 'echotool', 'input': {'text': 'hi'}}, {'text': 'Done.'}]
+
+
+def record(assistant, path):
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.client = ScriptedClient(STEPS)
+    assistant.start_recording(path)
+    assert assistant.chat('echo hi') == 'Done.'
+    assistant.stop_recording()
+    return Cassette.load(path)
+
+
+def test_request_hash_ignores_key_order():
+    assert request_hash({'a': 1, 'b': [1, 2]}) == request_hash({'b': [1, 2], 'a': 1})
+
+
+def test_prefix_key_ignores_cache_breakpoints():
+    plain = {'role': 'user', 'content': 'hi'}
+    cached = {'role': 'user', 'content': [{'type': 'text', 'text': 'hi', 'cache_control': {'type': 'ephemeral'}}]}
+    assert prefix_key(cached) == plain
+    assert common_prefix([1, 2, 3], [1, 2, 4]) == 2
+
+
+def test_record_and_replay(assistant, tmp_path):
+    cassette = record(assistant, tmp_path / 'session.cassette.jsonl.gz')
+    assert [event['type'] for event in cassette.events] == ['meta', 'user', 'model', 'tool', 'model']
+    assert cassette.of_type('tool')[0]['output'] == 'hi'
+
+    replaying = assistant.new_session()
+    player = CassettePlayer(cassette)
+    replaying.start_replay(player)
+    assert replaying.chat('echo hi') == 'Done.'
+    assert player.finished and player.finish() == []
+
+
+def replay(assistant, cassette):
+    player = CassettePlayer(cassette)
+    replaying = assistant.new_session()
+    replaying.start_replay(player)
+    replaying.chat('echo hi')
+    return player.finish()
+
+
+def test_replay_reports_a_missing_tool_call(assistant, tmp_path):
+    cassette = record(assistant, tmp_path / 'session.cassette.jsonl.gz')
+    tool = cassette.of_type('tool')[0]
+    cassette.events.insert(cassette.events.index(tool) + 1,
+                           {**tool, 'id': 'toolu_2', 'input': {'text': 'again'}})
+    mismatches = replay(assistant, cassette)
+    assert mismatches == ['Model response 1: dispatched 1 tool calls, recorded 2; '
+                          'missing echotool({"text": "again"})']
+
+
+def test_replay_reports_an_extra_tool_call(assistant, tmp_path):
+    cassette = record(assistant, tmp_path / 'session.cassette.jsonl.gz')
+    cassette.events.remove(cassette.of_type('tool')[0])
+    mismatches = replay(assistant, cassette)
+    assert mismatches[-1] == 'Model response 1: dispatched 1 tool calls, recorded 0; extra echotool({"text": "hi"})'
+
+
+def test_replay_reports_a_different_tool_call(assistant, tmp_path):
+    cassette = record(assistant, tmp_path / 'session.cassette.jsonl.gz')
+    cassette.of_type('tool')[0]['input'] = {'text': 'something else'}
+    player = CassettePlayer(cassette)
+    with pytest.raises(CassetteMismatch):
+        player.tool_result('toolu_1', 'echotool', {'text': 'hi'})
+    assert player.mismatches
+
+
+def test_record_is_not_a_chat_command(assistant, config):
+    assistant.client = ScriptedClient([{'text': 'Just a message.'}])
+    assert assistant.chat('record stolen') == 'Just a message.'
+    assert assistant.recorder is None
+    assert not config.CASSETTE_DIR.exists()
+
+
+def test_record_command(assistant, config):
+    assistant.client = ScriptedClient([])
+    reply = assistant.record_command('my session')
+    assert assistant.recorder is not None
+    assert str(config.CASSETTE_DIR / 'my_session.cassette.jsonl.gz') in reply
+    assert assistant.record_command('off').startswith('Recording saved')
+    assert assistant.recorder is None
@@ -0,0 +1,133 @@
+import copy
+import io
+
+from rich.console import Console
+
+from context_manager import ContextManager, estimate_content_tokens, is_plain_user_message, render_transcript
+
+
+def tool_round(index, result_chars):
+    """An assistant tool call followed by its (large) result."""
+    return [
+        {'role': 'assistant', 'content': [{'type': 'tool_use', 'id': f'toolu_{index}', 'name': 'reader',
+                                           'input': {'path': f'file{index}.txt'}}]},
+        {'role': 'user', 'content': [{'type': 'tool_result', 'tool_use_id': f'toolu_{index}',
+                                      'content': 'x' * result_chars}]},
+    ]
+
+
+def conversation(turns, result_chars=4000):
+    messages = []
+    for turn in range(turns):
+        messages.append({'role': 'user', 'content': f'question {turn}'})
+        messages.extend(tool_round(turn, result_chars))
+        messages.append({'role': 'assistant', 'content': [{'type': 'text', 'text': f'answer {turn}'}]})
+    return messages
+
+
+def tool_ids(messages, block_type, key):
+    return [block[key] for message in messages if isinstance(message['content'], list)
+            for block in message['content'] if block.get('type') == block_type]
+
+
+def test_estimates():
+    assert estimate_content_tokens('a' * 400) == 100
+    assert estimate_content_tokens([{'type': 'image_ref', 'sha256': 'ab'}]) == 1600
+    assert estimate_content_tokens(None) == 0
+
+
+def test_plain_user_message():
+    assert is_plain_user_message({'role': 'user', 'content': 'hi'})
+    assert not is_plain_user_message({'role': 'assistant', 'content': 'hi'})
+    assert not is_plain_user_message(tool_round(0, 10)[1])
+
+
+def test_small_history_is_left_alone():
+    manager = ContextManager(max_tokens=100_000)
+    messages = conversation(2)
+    assert not manager.needs_compaction(messages)
+    compacted, report = manager.compact(messages)
+    assert compacted == messages
+    assert report['stubbed'] == 0 and report['summarized'] == 0
+    assert manager.compactions == 0
+
+
+def test_old_tool_results_are_stubbed_first():
+    manager = ContextManager(max_tokens=10_000, keep_recent_messages=4)
+    messages = conversation(4)
+    original = copy.deepcopy(messages)
+
+    compacted, report = manager.compact(messages)
+
+    assert messages == original  # the input is not modified
+    assert report['stubbed'] == 3 and report['summarized'] == 0
+    assert report['after'] < report['before']
+    assert compacted[2]['content'][0]['content'].startswith('[Earlier tool result elided (4,000 chars)')
+    assert compacted[-2]['content'][0]['content'] == 'x' * 4000  # the recent window is untouched
+    assert manager.compactions == 1
+
+
+def test_summary_never_splits_a_tool_pair():
+    summaries = []
+
+    def summarizer(transcript):
+        summaries.append(transcript)
+        return 'the user asked questions'
+
+    manager = ContextManager(max_tokens=2_000, keep_recent_messages=3, summarizer=summarizer)
+    compacted, report = manager.compact(conversation(6))
+
+    assert report['summary'] == 'model' and report['summarized'] > 0
+    assert is_plain_user_message(compacted[0])
+    assert compacted[0]['content'][0]['text'].startswith('[Summary of the earlier conversation]')
+    assert sorted(tool_ids(compacted, 'tool_use', 'id')) == sorted(tool_ids(compacted, 'tool_result', 'tool_use_id'))
+    assert 'USER: question 0' in summaries[0]
+
+
+def test_failed_summary_falls_back_to_truncation():
+    def summarizer(transcript):
+        raise RuntimeError('overloaded')
+
+    manager = ContextManager(max_tokens=2_000, keep_recent_messages=3, summarizer=summarizer)
+    compacted, report = manager.compact(conversation(6))
+    assert report['summary'] == 'truncated'
+    assert 'removed to stay within the context window' in compacted[0]['content'][0]['text']
+
+
+def test_render_transcript_clips_long_blocks():
+    transcript = render_transcript(tool_round(0, 5000), block_chars=100)
+    assert "ASSISTANT: (called tool reader with {\"path\": \"file0.txt\"})" in transcript
+    assert transcript.endswith('x' * (100 - len('(tool result) ')) + ' ...')
+
+
+def test_unremovable_history_is_reported_once_per_turn(assistant, config, monkeypatch):
+    monkeypatch.setattr(config, 'ENABLE_CONTEXT_COMPACTION', True)
+    import ce3
+
+    assistant.console = Console(file=io.StringIO(), record=True)
+    monkeypatch.setattr(ce3, 'estimate_tokens', lambda messages: 1000)
+    assistant.context_manager.max_tokens = 100
+    # One user message and a growing tool chain: nothing can be stubbed or cut
+    assistant.conversation_history = [{'role': 'user', 'content': 'go'}] + tool_round(0, 10)
+    assistant._begin_turn()
+
+    for index in range(1, 4):
+        assert assistant._compact_history_if_needed() > 0
+        assistant.conversation_history.extend(tool_round(index, 10))
+    assert assistant.console.export_text().count('Nothing left to compact') == 1
+
+    assistant._begin_turn()
+    assistant._compact_history_if_needed()
+    assert assistant.console.export_text().count('Nothing left to compact') == 1
+
+
+def test_request_reuses_the_compaction_estimate(assistant, monkeypatch):
+    import ce3
+
+    calls = []
+    monkeypatch.setattr(ce3, 'estimate_tokens', lambda messages: calls.append(1) or 10)
+    assistant.conversation_history = [{'role': 'user', 'content': 'hi'}]
+    estimate = assistant._compact_history_if_needed()
+    request, estimated_prompt = assistant._prepare_request(estimate)
+    assert estimated_prompt == estimate
+    assert len(calls) == 1
@@ -0,0 +1,98 @@
+import importlib.util
+
+import pytest
+from rich.console import Console
+
+from dependency_resolver import DependencyResolver, distribution_for, missing_module_name
+
+
+# Optional packages the tests treat as not installed, whatever this environment has
+UNINSTALLED = {'bs4', 'PIL', 'pyautogui', 'yaml'}
+
+
+@pytest.fixture(autouse=True)
+def uninstalled_packages(monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec',
+                        lambda name, *args: None if name in UNINSTALLED else find_spec(name, *args))
+
+
+def quiet_resolver(policy):
+    return DependencyResolver(policy=policy, console=Console(quiet=True))
+
+
+def test_missing_module_name_uses_the_top_level_package():
+    assert missing_module_name(ModuleNotFoundError("No module named 'bs4.element'", name='bs4.element')) == 'bs4'
+
+
+def test_missing_module_name_parses_the_message():
+    assert missing_module_name(ImportError("No module named 'yaml'")) == 'yaml'
+
+
+def test_missing_module_name_follows_the_exception_chain():
+    try:
+        try:
+            raise ModuleNotFoundError("No module named 'pyautogui'", name='pyautogui')
+        except ImportError as e:
+            raise ImportError("Install pyautogui to take screenshots") from e
+    except ImportError as e:
+        error = e
+    assert missing_module_name(error) == 'pyautogui'
+
+
+def test_missing_module_name_unknown():
+    assert missing_module_name(ImportError("cannot import name 'thing'")) is None
+
+
+def test_missing_name_from_an_installed_package_is_not_a_missing_module():
+    error = ImportError("cannot import name 'thing' from 'json'", name='json')
+    assert missing_module_name(error) is None
+    error = ModuleNotFoundError("No module named 'json.thing'", name='json.thing')
+    assert missing_module_name(error) is None
+
+
+@pytest.mark.parametrize('import_name, distribution', [
+    ('PIL', 'Pillow'),
+    ('bs4', 'beautifulsoup4'),
+    ('requests', 'requests'),
+])
+def test_distribution_for(import_name, distribution):
+    assert distribution_for(import_name) == distribution
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        DependencyResolver(policy='sometimes')
+
+
+def test_never_policy_installs_nothing(monkeypatch):
+    resolver = quiet_resolver('never')
+    monkeypatch.setattr(resolver, 'install', lambda distributions: pytest.fail('install was called'))
+    assert resolver.add('webscrapertool', ModuleNotFoundError("No module named 'bs4'", name='bs4')) == 'beautifulsoup4'
+    assert resolver.add('broken', ImportError("cannot import name 'thing'")) is None
+    assert resolver.resolve() == []
+    assert resolver.missing == {} and resolver.unresolved == {}
+
+
+def test_auto_policy_installs_once_per_batch(monkeypatch):
+    resolver = quiet_resolver('auto')
+    calls = []
+    monkeypatch.setattr(resolver, 'install', lambda distributions: calls.append(distributions) or (True, ''))
+    resolver.add('webscrapertool', ModuleNotFoundError("No module named 'bs4'", name='bs4'))
+    resolver.add('screenshottool', ModuleNotFoundError("No module named 'PIL'", name='PIL'))
+    resolver.add('imagetool', ModuleNotFoundError("No module named 'PIL'", name='PIL'))
+
+    assert resolver.resolve() == ['webscrapertool', 'screenshottool', 'imagetool']
+    assert calls == [['beautifulsoup4', 'Pillow']]
+
+    # A distribution that was already installed is not retried
+    resolver.add('webscrapertool', ModuleNotFoundError("No module named 'bs4'", name='bs4'))
+    assert resolver.resolve() == []
+    assert len(calls) == 1
+
+
+def test_failed_install_reloads_nothing(monkeypatch):
+    resolver = quiet_resolver('auto')
+    monkeypatch.setattr(resolver, 'install', lambda distributions: (False, 'boom'))
+    resolver.add('webscrapertool', ModuleNotFoundError("No module named 'bs4'", name='bs4'))
+    assert resolver.resolve() == []
@@ -0,0 +1,49 @@
+import anthropic
+import pytest
+
+from fake_model_server import FakeModelServer, Scenario
+
+SCENARIO = {
+    'model': 'fake-model',
+    'steps': [
+        {'text': 'Let me echo that.', 'tool_use': [{'name': 'echotool', 'input': {'text': 'hi'}}]},
+        {'text': 'Done.'}
+    ],
+    'failures': [{'step': 1, 'times': 1, 'status': 529}]
+}
+
+
+@pytest.fixture
+def server():
+    server = FakeModelServer(Scenario(SCENARIO)).start()
+    yield server
+    server.stop()
+
+
+def client_for(server, max_retries=0):
+    return anthropic.Anthropic(api_key='test-key', base_url=server.base_url, max_retries=max_retries)
+
+
+def test_request_round_trips_through_the_server(server):
+    messages = [{'role': 'user', 'content': 'echo hi'}]
+    response = client_for(server).messages.create(model='fake-model', max_tokens=100, messages=messages)
+    assert response.stop_reason == 'tool_use'
+    assert [block.type for block in response.content] == ['text', 'tool_use']
+    tool_use = response.content[1]
+    assert (tool_use.name, tool_use.input) == ('echotool', {'text': 'hi'})
+    assert response.usage.input_tokens > 0
+
+    messages += [
+        {'role': 'assistant', 'content': [block.model_dump(exclude_none=True) for block in response.content]},
+        {'role': 'user', 'content': [{'type': 'tool_result', 'tool_use_id': tool_use.id, 'content': 'hi'}]}
+    ]
+    # The scenario fails the first attempt of this step with an overloaded error
+    with pytest.raises(anthropic.APIStatusError) as error:
+        client_for(server).messages.create(model='fake-model', max_tokens=100, messages=messages)
+    assert error.value.status_code == 529
+
+    with client_for(server).messages.stream(model='fake-model', max_tokens=100, messages=messages) as stream:
+        assert ''.join(stream.text_stream) == 'Done.'
+        assert stream.get_final_message().stop_reason == 'end_turn'
+    assert server.requests == 3
+
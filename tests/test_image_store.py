@@ -0,0 +1,123 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from image_store import IMAGE_REF, ImageStore, placeholder, sniff_media_type
+
+
+def png(size=(8, 8), color=(255, 0, 0)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(tmp_path / 'images')
+
+
+def test_sniff_media_type():
+    assert sniff_media_type(png()) == 'image/png'
+    assert sniff_media_type(b'\xff\xd8\xff\xe0rest') == 'image/jpeg'
+    assert sniff_media_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'image/webp'
+    assert sniff_media_type(b'<html>') is None
+
+
+def test_upload_is_stored_once_and_referenced(store):
+    data = png()
+    first, second = store.put_upload(data), store.put_upload(data)
+    assert first == second == {'type': IMAGE_REF, 'image_id': first['image_id'], 'media_type': 'image/png'}
+    assert store.reference(first['image_id']) == first
+    assert store.reference('../../etc/passwd') is None
+
+
+def test_large_upload_is_scaled_down(store):
+    ref = store.put_upload(png(size=(3000, 2000)), max_side=1000)
+    with Image.open(io.BytesIO(store.get(ref['image_id']))) as image:
+        assert 990 <= max(image.size) <= 1000
+
+
+@pytest.mark.parametrize('data', [
+    b'\x89PNG\r\n\x1a\n' + b'garbage' * 20,
+    png()[:40],
+])
+def test_corrupt_upload_raises_value_error(store, data):
+    with pytest.raises(ValueError):
+        store.put_upload(data)
+
+
+def test_corrupt_upload_is_a_400(webapp):
+    client = webapp.app.test_client()
+    response = client.post('/upload', data={'file': (io.BytesIO(b'\x89PNG\r\n\x1a\n' + b'x' * 100), 'a.png')})
+    assert response.status_code == 400
+
+
+def test_prune_by_age_and_size(store):
+    old = store.put(png(color=(1, 1, 1)), 'image/png')
+    new = store.put(png(color=(2, 2, 2)), 'image/png')
+    hour_ago = time.time() - 3600
+    os.utime(store.directory / old['image_id'], (hour_ago, hour_ago))
+    assert store.prune(max_age_seconds=60) == 1
+    assert store.reference(old['image_id']) is None
+    assert store.reference(new['image_id']) is not None
+    assert store.prune(max_bytes=0) == 1
+    assert list(store.directory.iterdir()) == []
+
+
+def test_pruned_image_becomes_a_placeholder(store):
+    ref = store.put(png(), 'image/png')
+    store.prune(max_bytes=0)
+    messages = [{'role': 'user', 'content': [ref]}]
+    block = store.materialize(messages)[0]['content'][0]
+    assert block['type'] == 'text'
+
+
+def turns(ref, count):
+    """A user message holding ref followed by count typed exchanges."""
+    messages = [{'role': 'user', 'content': [ref]}, {'role': 'assistant', 'content': 'seen'}]
+    for index in range(count):
+        messages += [{'role': 'user', 'content': f'turn {index}'}, {'role': 'assistant', 'content': 'ok'}]
+    return messages
+
+
+def test_earlier_images_are_stable_across_turns(store):
+    ref = store.put(png(size=(1024, 1024)), 'image/png')
+    first = store.materialize(turns(ref, 0))[0]
+    for count in (3, 10):
+        assert store.materialize(turns(ref, count))[0] == first
+
+
+def test_age_downscales_then_drops_old_images(store):
+    ref = store.put(png(size=(1024, 1024)), 'image/png')
+    messages, changed = store.age(turns(ref, 3), full_turns=2, downscale_max_side=64, placeholder_turns=6)
+    assert changed == 1
+    downscaled = messages[0]['content'][0]
+    assert downscaled['type'] == IMAGE_REF and downscaled['image_id'] != ref['image_id']
+
+    # Ageing again leaves the downscaled copy alone
+    assert store.age(messages, full_turns=2, downscale_max_side=64, placeholder_turns=6)[1] == 0
+
+    messages, changed = store.age(turns(ref, 7), full_turns=2, downscale_max_side=64, placeholder_turns=6)
+    assert changed == 1
+    assert messages[0]['content'][0]['type'] == 'text'
+    assert store.age(turns(ref, 1), full_turns=2, placeholder_turns=6) == (turns(ref, 1), 0)
+
+
+def test_images_are_aged_when_history_is_compacted(assistant, config, monkeypatch):
+    import ce3
+
+    monkeypatch.setattr(config, 'ENABLE_IMAGE_STORE', True)
+    monkeypatch.setattr(config, 'ENABLE_CONTEXT_COMPACTION', True)
+    monkeypatch.setattr(config, 'IMAGE_PLACEHOLDER_TURNS', 6)
+    ref = assistant.image_store.put(png(), 'image/png')
+    assistant.conversation_history = turns(ref, 7)
+    assert assistant._materialize_history()[0]['content'][0]['type'] == 'image'
+
+    monkeypatch.setattr(ce3, 'estimate_tokens', lambda messages: 1000)
+    assistant.context_manager.max_tokens = 100
+    assistant.context_manager.keep_recent_messages = 100  # Nothing to cut, so only the image changes
+    assistant._compact_history_if_needed()
+    assert assistant._materialize_history()[0]['content'][0] == placeholder(ref['image_id'])
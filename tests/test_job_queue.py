@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from job_queue import CANCELLED, DONE, QUEUED, JobQueue, QueueFull
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=2)
+    yield queue
+    queue._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def blocking_job(release):
+    def run(job):
+        release.wait(5)
+        return {'response': 'ok'}
+    return run
+
+
+def wait_for(job, status):
+    while job.status != status:
+        job.wait_events(len(job.events), timeout=0.05)
+
+
+def test_jobs_are_only_visible_to_their_owner(queue):
+    job = queue.submit(lambda job: {'response': 'ok'}, owner='alice')
+    assert queue.get(job.job_id, 'alice') is job
+    assert queue.get(job.job_id, 'mallory') is None
+    assert queue.get(job.job_id, None) is None
+    assert queue.get(job.job_id, '') is None
+    assert queue.cancel(job.job_id, None) is None
+
+
+def test_cancelled_queued_job_never_runs(queue):
+    release, ran = threading.Event(), []
+    queue.submit(blocking_job(release), owner='a')
+    queued = queue.submit(lambda job: ran.append(job) or {}, owner='a')
+    assert queued.status == QUEUED
+    queue.cancel(queued.job_id, 'a')
+    assert queued.status == CANCELLED
+    release.set()
+    queue._executor.shutdown(wait=True)
+    assert ran == []
+
+
+def test_full_queue_raises(queue):
+    release = threading.Event()
+    running = queue.submit(blocking_job(release), owner='a')
+    wait_for(running, 'running')
+    queue.submit(blocking_job(release), owner='a')
+    queue.submit(blocking_job(release), owner='a')
+    with pytest.raises(QueueFull):
+        queue.submit(blocking_job(release), owner='a')
+    release.set()
+
+
+def test_events_and_result(queue):
+    def run(job):
+        job.on_event({'type': 'tool_start', 'name': 'echotool'})
+        return {'response': 'ok'}
+
+    job = queue.submit(run, owner='a')
+    wait_for(job, DONE)
+    assert job.result == {'response': 'ok'}
+    assert job.as_dict(events_after=0)['events'] == [{'type': 'tool_start', 'name': 'echotool'}]
+    assert queue.stats()['completed'] == 1
+
+
+@pytest.fixture
+def blocked_chat(webapp, monkeypatch):
+    """Make every session's chat() block until the returned event is set."""
+    release = threading.Event()
+
+    def chat(assistant, user_input, on_event=None, cancel_event=None):
+        release.wait(5)
+        return 'stopped' if cancel_event.is_set() else 'answer'
+
+    monkeypatch.setattr(type(webapp.assistant), 'chat', chat)
+    yield release
+    release.set()
+
+
+def test_second_message_in_a_session_is_rejected(webapp, blocked_chat):
+    client = webapp.app.test_client()
+    first = client.post('/chat', json={'message': 'one'})
+    assert first.status_code == 202
+    second = client.post('/chat', json={'message': 'two'})
+    assert second.status_code == 409
+    assert second.json['job_id'] == first.json['job_id']
+
+    # Other sessions are still served
+    other = webapp.app.test_client().post('/chat', json={'message': 'three'})
+    assert other.status_code == 202
+
+
+def test_cookieless_client_cannot_read_or_cancel_jobs(webapp, blocked_chat):
+    client = webapp.app.test_client()
+    job_id = client.post('/chat', json={'message': 'one'}).json['job_id']
+    stranger = webapp.app.test_client()
+    assert stranger.get(f'/jobs/{job_id}').status_code == 404
+    assert stranger.post(f'/jobs/{job_id}/cancel').status_code == 404
+    assert client.get(f'/jobs/{job_id}').status_code == 200
+
+
+def test_reset_cancels_a_running_job_instead_of_waiting(webapp, blocked_chat):
+    client = webapp.app.test_client()
+    job_id = client.post('/chat', json={'message': 'one'}).json['job_id']
+    job = webapp.jobs.get(job_id, client.get_cookie(webapp.SESSION_COOKIE).value)
+    wait_for(job, 'running')
+
+    response = client.post('/reset')
+    assert response.status_code == 409
+    assert job.cancel_event.is_set()
+
+    blocked_chat.set()
+    wait_for(job, CANCELLED)
+    assert client.post('/reset').status_code == 200
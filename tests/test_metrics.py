@@ -0,0 +1,40 @@
+import metrics
+from conftest import tool_use
+from metrics import MetricsRegistry
+
+
+def test_render_counter_gauge_and_histogram():
+    registry = MetricsRegistry()
+    calls = registry.counter('calls_total', 'Calls.', ('outcome',))
+    calls.inc(outcome='ok')
+    calls.inc(2, outcome='error')
+    registry.gauge('depth', 'Queue depth.', callback=lambda: 3)
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+    latency.observe(0.05)
+    latency.observe(5)
+    text = registry.render()
+    assert '# TYPE calls_total counter' in text
+    assert 'calls_total{outcome="error"} 2' in text
+    assert 'depth 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'latency_seconds_count 2' in text
+
+
+def test_same_name_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter('x_total', 'X.') is registry.counter('x_total', 'X.')
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter('c_total', 'C.', ('name',)).inc(name='a"b\nc')
+    assert 'c_total{name="a\\"b\\nc"} 1' in registry.render()
+
+
+def test_unknown_tool_names_share_one_label(assistant):
+    before = metrics.TOOL_CALLS.value(tool='unknown', outcome='not_found')
+    for name in ('made_up_1', 'made_up_2'):
+        assistant._execute_tool(tool_use(name))
+    assert metrics.TOOL_CALLS.value(tool='unknown', outcome='not_found') == before + 2
+    assert 'made_up_1' not in metrics.REGISTRY.render()
@@ -0,0 +1,33 @@
+import threading
+
+from conftest import tool_use
+from tools.base import BaseTool
+
+
+class ThreadTool(BaseTool):
+    name = 'threadtool'
+    description = 'Note the thread the call runs on'
+    input_schema = {'type': 'object', 'properties': {}}
+
+    def __init__(self):
+        self.threads = set()
+
+    def execute(self):
+        self.threads.add(threading.current_thread().name)
+        return 'done'
+
+
+def test_sessions_share_one_tool_pool(assistant):
+    first, second = assistant.new_session(), assistant.new_session()
+    assert first._get_tool_executor() is assistant._get_tool_executor()
+    assert second._get_tool_executor() is assistant._get_tool_executor()
+
+
+def test_independent_calls_run_on_the_pool_in_order(assistant, config, monkeypatch):
+    monkeypatch.setattr(config, 'PARALLEL_TOOL_EXECUTION', True)
+    tool = ThreadTool()
+    assistant.tool_registry.register(tool, 'tools.threadtool')
+    calls = [tool_use('threadtool', id=f'toolu_{i}') for i in range(3)]
+    results = assistant._execute_tool_calls(calls)
+    assert [block['tool_use_id'] for block in results] == ['toolu_0', 'toolu_1', 'toolu_2']
+    assert all(name.startswith('tool-call') for name in tool.threads)
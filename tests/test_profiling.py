@@ -0,0 +1,76 @@
+import tracemalloc
+
+import pytest
+from rich.console import Console
+
+from profiling import TurnProfiler, render_profile
+
+
+def busy_turn():
+    return [str(number) * 10 for number in range(20000)]
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = TurnProfiler(tmp_path / 'profiles', top=5)
+    yield profiler
+    profiler.disable()
+
+
+def test_disabled_profiler_records_nothing(profiler):
+    with profiler.profile() as results:
+        busy_turn()
+    assert results == []
+    assert not profiler.output_dir.exists()
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiled_turn_is_saved_and_reported(profiler):
+    profiler.enable()
+    assert tracemalloc.is_tracing()
+    with profiler.profile('echo hi') as results:
+        kept = busy_turn()
+
+    result = results[0]
+    assert result.label == 'echo hi' and result.seconds > 0
+    assert result.stats_path.exists() and result.report_path.exists()
+    assert result.allocated_bytes > 0
+    assert any(diff.traceback[0].filename == __file__ for diff in result.top_allocations(5))
+    assert 'busy_turn' in result.top_functions(20)
+
+    report = result.report_path.read_text(encoding='utf-8')
+    assert report.startswith('Profile of echo hi:') and 'allocation sites' in report
+    assert profiler.turns == 1
+    del kept
+
+
+def test_disable_stops_only_its_own_tracemalloc(profiler):
+    profiler.enable()
+    profiler.disable()
+    assert not tracemalloc.is_tracing() and not profiler.enabled
+
+    tracemalloc.start()
+    try:
+        profiler.enable()
+        profiler.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_profile_is_kept_when_the_turn_fails(profiler):
+    profiler.enable()
+    with pytest.raises(RuntimeError):
+        with profiler.profile() as results:
+            raise RuntimeError('model error')
+    assert len(results) == 1 and results[0].stats_path.exists()
+
+
+def test_render_profile(profiler):
+    profiler.enable()
+    with profiler.profile() as results:
+        busy_turn()
+    console = Console(record=True, width=160)
+    render_profile(console, results[0], top=5)
+    output = console.export_text()
+    assert 'Profile:' in output and 'Allocations:' in output and 'Saved' in output
@@ -0,0 +1,43 @@
+from conftest import ScriptedClient
+from test_tool_registry import EchoTool
+
+EPHEMERAL = {'type': 'ephemeral'}
+
+
+def cached_blocks(message):
+    content = message['content']
+    return [block for block in content if isinstance(block, dict) and 'cache_control' in block] \
+        if isinstance(content, list) else []
+
+
+def run_tool_chain(assistant):
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.tools = [{'name': 'echotool', 'description': 'Echo the input', 'input_schema': {'type': 'object'}}]
+    assistant.client = ScriptedClient([{'tool': 'echotool', 'input': {'text': 'hi'}}, {'text': 'Done.'}])
+    assert assistant.chat('echo hi') == 'Done.'
+    return assistant.client.requests
+
+
+def test_breakpoints_on_tools_system_and_latest_user_messages(assistant, config, monkeypatch):
+    monkeypatch.setattr(config, 'ENABLE_PROMPT_CACHING', True)
+    second = run_tool_chain(assistant)[1]
+
+    assert second['tools'][-1]['cache_control'] == EPHEMERAL
+    assert second['system'][0]['cache_control'] == EPHEMERAL
+    user_messages = [message for message in second['messages'] if message['role'] == 'user']
+    assert [len(cached_blocks(message)) for message in user_messages] == [1, 1]
+    assert cached_blocks(user_messages[0])[0]['text'] == 'echo hi'
+
+
+def test_history_is_never_modified(assistant, config, monkeypatch):
+    monkeypatch.setattr(config, 'ENABLE_PROMPT_CACHING', True)
+    run_tool_chain(assistant)
+    assert not any(cached_blocks(message) for message in assistant.conversation_history)
+    assert 'cache_control' not in assistant.tools[-1]
+
+
+def test_caching_disabled_sends_plain_prompt(assistant, config, monkeypatch):
+    monkeypatch.setattr(config, 'ENABLE_PROMPT_CACHING', False)
+    second = run_tool_chain(assistant)[1]
+    assert isinstance(second['system'], str)
+    assert not any(cached_blocks(message) for message in second['messages'])
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+from session_manager import Session, SessionManager
+
+
+def make_manager(**kwargs):
+    return SessionManager(lambda: SimpleNamespace(conversation_history=[]), **kwargs)
+
+
+def test_unknown_cookie_never_becomes_a_session_id():
+    sessions = make_manager()
+    planted = 'attacker-chosen-id'
+    session = sessions.get(planted)
+    assert session.session_id != planted
+    # Presenting the planted id again still doesn't reach any session under it
+    assert sessions.get(planted).session_id not in (planted, session.session_id)
+    assert planted not in sessions._sessions
+
+
+def test_known_id_returns_the_same_session():
+    sessions = make_manager()
+    session = sessions.get(None)
+    assert sessions.get(session.session_id) is session
+
+
+def test_evicted_id_gets_a_fresh_session():
+    sessions = make_manager(max_sessions=1)
+    first = sessions.get(None)
+    sessions.get(None)
+    assert len(sessions) == 1
+    assert sessions.get(first.session_id).session_id != first.session_id
+
+
+def test_idle_sessions_are_evicted_but_busy_ones_are_kept():
+    sessions = make_manager(idle_timeout=60)
+    idle, busy = sessions.get(None), sessions.get(None)
+    idle.last_used -= 120
+    busy.last_used -= 120
+    busy.lock.acquire()
+    try:
+        sessions.evict()
+        assert busy.session_id in sessions._sessions
+        assert idle.session_id not in sessions._sessions
+    finally:
+        busy.lock.release()
+
+
+def test_web_app_replaces_a_planted_cookie(webapp):
+    client = webapp.app.test_client()
+    client.set_cookie(webapp.SESSION_COOKIE, 'planted')
+    response = client.get('/')
+    issued = client.get_cookie(webapp.SESSION_COOKIE).value
+    assert 'Set-Cookie' in response.headers
+    assert issued != 'planted'
+    assert webapp.sessions.get(issued).session_id == issued
+
+
+def test_importing_the_web_app_restores_config(app_module):
+    from config import Config
+
+    assert Config.TOOL_MANIFEST_FILE == Config.TOOLS_DIR / '.tool_manifest.json'
+    assert Config.SPILL_DIR != app_module.assistant.spill_store.directory
+
+
+def test_memory_limit_measures_each_history_once(monkeypatch):
+    sessions = make_manager(idle_timeout=None, max_memory_bytes=10_000)
+    for session in [sessions.get(None) for _ in range(5)]:
+        session.assistant.conversation_history = [{'role': 'user', 'content': 'x' * 4000}]
+    measured = []
+    history_bytes = Session.history_bytes
+
+    def counting_history_bytes(session):
+        measured.append(session.session_id)
+        return history_bytes(session)
+
+    monkeypatch.setattr(Session, 'history_bytes', counting_history_bytes)
+    assert sessions.evict() == 3
+    assert len(sessions) == 2
+    assert len(measured) == 5
@@ -0,0 +1,76 @@
+import json
+import os
+import time
+
+import pytest
+
+from spill_store import SpillStore, is_content_blocks, json_keys
+from tools.resultpagertool import ResultPagerTool
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SpillStore(tmp_path / 'spill', threshold_chars=100, preview_chars=20)
+
+
+def handle_of(replacement):
+    return replacement.split('handle=')[1].split()[0]
+
+
+def test_small_results_stay_inline(store):
+    assert store.spill('short') is None
+    assert store.spill([{'type': 'image', 'source': {'data': 'x' * 1000}}]) is None
+
+
+def test_large_text_is_stored_once(store):
+    text = '\n'.join(f'line {i}' for i in range(100))
+    replacement = store.spill(text)
+    assert 'lines' in replacement and 'resultpagertool' in replacement
+    assert replacement.count('line 0') == 1
+    handle = handle_of(replacement)
+    assert store.get(handle) == text
+    assert store.spill(text) == replacement
+    assert len(list(store.directory.glob('*.txt'))) == 1
+
+
+def test_json_results_list_their_keys(store):
+    replacement = store.spill({'alpha': 'a' * 100, 'beta': [1, 2, 3]})
+    assert 'Top-level JSON keys: alpha, beta' in replacement
+    assert json_keys('not json') == []
+
+
+def test_get_rejects_bad_handles(store):
+    with pytest.raises(KeyError):
+        store.get('../../etc/passwd')
+    with pytest.raises(KeyError):
+        store.get('0' * 64)
+
+
+def test_prune_removes_old_results(store):
+    old = store.put('old result')
+    new = store.put('new result')
+    stale = time.time() - 3600
+    os.utime(store.directory / f'{old}.txt', (stale, stale))
+    assert store.prune(max_age_seconds=60) == 1
+    assert store.get(new) == 'new result'
+
+
+def test_is_content_blocks():
+    assert is_content_blocks([{'type': 'text', 'text': 'hi'}])
+    assert not is_content_blocks([])
+    assert not is_content_blocks([{'name': 'row'}])
+
+
+def test_pager_reads_ranges(config, monkeypatch):
+    monkeypatch.setattr(config, 'SPILL_PAGE_CHARS', 50)
+    store = SpillStore.from_config(config)
+    text_handle = store.put('\n'.join(f'line {i}' for i in range(1, 11)))
+    json_handle = store.put(json.dumps({'files': [{'name': 'a.py'}], 'total': 1}))
+    pager = ResultPagerTool()
+
+    assert pager.execute(handle=text_handle, start_line=2, end_line=3) == '[Lines 2-3 of 10]\nline 2\nline 3'
+    assert pager.execute(handle=text_handle, offset=0, length=6) == '[Chars 0-6 of 70 in result]\nline 1'
+    assert pager.execute(handle=json_handle, json_key='files.0.name').endswith('a.py')
+    assert pager.execute(handle=json_handle, list_keys=True).startswith('files (')
+    assert pager.execute(handle=json_handle, json_key='missing') == "Error: Key 'missing' not found"
+    assert pager.execute(handle='nope').startswith('Error: Invalid result handle')
@@ -0,0 +1,72 @@
+from conftest import ScriptedClient
+from test_tool_registry import EchoTool
+
+
+def test_chat_streams_text_and_tool_events(assistant):
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.client = ScriptedClient([{'tool': 'echotool', 'input': {'text': 'hi'}}, {'text': 'All done here.'}])
+    events = []
+
+    assert assistant.chat('echo hi', on_event=events.append) == 'All done here.'
+
+    assert [event['type'] for event in events] == ['tool_start', 'tool_end', 'text', 'text', 'text']
+    assert events[0]['name'] == 'echotool' and events[0]['id'] == events[1]['id']
+    assert ''.join(event['text'] for event in events if event['type'] == 'text') == 'All done here.'
+
+
+def test_failing_event_handler_does_not_break_the_turn(assistant):
+    assistant.client = ScriptedClient([{'text': 'Hello there'}])
+
+    def handler(event):
+        raise RuntimeError('socket closed')
+
+    assert assistant.chat('hi', on_event=handler) == 'Hello there'
+
+
+def test_without_a_handler_the_turn_is_not_streamed(assistant):
+    assistant.client = ScriptedClient([{'text': 'Hello'}])
+    assistant.client.stream = None
+    assert assistant.chat('hi') == 'Hello'
+
+
+class PartialStreamAssistant:
+    """Streams part of an answer, then fails the way chat reports API errors."""
+
+    def display_available_tools(self):
+        pass
+
+    def chat(self, user_input, on_event=None):
+        on_event({'type': 'text', 'text': 'Half an ans'})
+        return 'Error: Connection reset by peer'
+
+
+def run_cli(monkeypatch, config, assistant, inputs):
+    import ce3
+    from rich.console import Console
+
+    console = Console(record=True, width=120)
+    inputs = list(inputs)
+
+    def prompt(*args, **kwargs):
+        if not inputs:
+            raise EOFError
+        return inputs.pop(0)
+
+    monkeypatch.setattr(config, 'ENABLE_STREAMING', True)
+    monkeypatch.setattr(ce3, 'Console', lambda: console)
+    monkeypatch.setattr(ce3, 'Assistant', lambda: assistant)
+    monkeypatch.setattr(ce3, 'prompt', prompt)
+    ce3.main()
+    return console.export_text()
+
+
+def test_cli_shows_an_error_after_partial_streamed_output(monkeypatch, config):
+    output = run_cli(monkeypatch, config, PartialStreamAssistant(), ['hello'])
+    assert 'Half an ans' in output
+    assert 'Error: Connection reset by peer' in output
+
+
+def test_cli_does_not_repeat_a_streamed_response(monkeypatch, config, assistant):
+    assistant.client = ScriptedClient([{'text': 'Hello there'}])
+    output = run_cli(monkeypatch, config, assistant, ['hi'])
+    assert output.count('Hello there') == 1
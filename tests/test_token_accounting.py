@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from token_accounting import RequestUsage, TokenAccounting
+
+
+def usage(input_tokens, output_tokens, cache_read=None, cache_write=None):
+    """A response usage object; the SDK reports missing cache figures as None."""
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                           cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write)
+
+
+def test_request_usage_includes_cached_prompt_tokens():
+    request = RequestUsage.from_usage(usage(100, 20, cache_read=900, cache_write=None))
+    assert request.prompt_tokens == 1000
+    assert request.total_tokens == 1020
+
+
+def test_context_is_the_latest_request_not_a_running_total():
+    accounting = TokenAccounting(context_limit=10_000, max_output_tokens=2_000)
+    accounting.record(usage(1000, 100))
+    accounting.record(usage(200, 50, cache_read=1100))
+
+    assert accounting.context_tokens == 1350
+    assert accounting.remaining_tokens == 8650
+    assert accounting.requests == 2
+    assert accounting.billed_tokens == 2450
+    assert accounting.cache_hit_ratio == 1100 / 2300
+
+
+def test_side_requests_are_billed_but_not_in_context():
+    accounting = TokenAccounting(context_limit=10_000, max_output_tokens=2_000)
+    accounting.record(usage(1000, 100))
+    accounting.record_billed(usage(5000, 500))
+    assert accounting.context_tokens == 1100
+    assert accounting.input_tokens == 6000
+
+
+def test_forecast_is_calibrated_and_clamped():
+    accounting = TokenAccounting(context_limit=10_000, max_output_tokens=2_000)
+    accounting.record(usage(1500, 10), estimated_prompt_tokens=1000)
+    assert accounting.project(2000) == 3000
+
+    accounting.record(usage(100_000, 10), estimated_prompt_tokens=1000)
+    assert accounting.ratio == 4.0
+
+
+def test_output_budget_shrinks_near_the_limit():
+    accounting = TokenAccounting(context_limit=10_000, max_output_tokens=2_000)
+    assert accounting.output_budget(1_000) == 2_000
+    accounting.forecast(9_500)
+    assert accounting.output_budget() == 500
+    assert accounting.output_budget(12_000) == 0
+
+
+def test_reset():
+    accounting = TokenAccounting(context_limit=10_000, max_output_tokens=2_000)
+    accounting.record(usage(1500, 10), estimated_prompt_tokens=1000)
+    accounting.reset()
+    assert accounting.as_dict()['billed_tokens'] == 0
+    assert accounting.ratio == 1.0
+
+
+def test_discarded_hedged_responses_are_billed(assistant):
+    assistant.token_accounting.record(usage(1000, 100))
+    assistant._record_discarded(SimpleNamespace(usage=usage(1000, 80)))
+    assert assistant.token_accounting.billed_tokens == 2180
+    assert assistant.token_accounting.context_tokens == 1100
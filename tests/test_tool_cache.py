@@ -0,0 +1,137 @@
+import pytest
+
+from conftest import tool_use
+from tool_cache import ToolCache, looks_like_error, paths_overlap
+from tools.base import BaseTool
+from tools.filecontentreadertool import FileContentReaderTool
+
+
+class ReaderTool(BaseTool):
+    name = 'readertool'
+    description = 'Read a file'
+    input_schema = {'type': 'object', 'properties': {'path': {'type': 'string'}}}
+    cache_policy = 'stat'
+
+    def __init__(self):
+        self.calls = 0
+
+    def execute(self, path):
+        self.calls += 1
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def affected_paths(self, path):
+        return [path]
+
+
+class WriterTool(BaseTool):
+    name = 'writertool'
+    description = 'Write a file'
+    input_schema = {'type': 'object', 'properties': {'path': {'type': 'string'}, 'content': {'type': 'string'}}}
+    mutates_files = True
+
+    def execute(self, path, content):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return f'Wrote {path}'
+
+    def affected_paths(self, path, content=''):
+        return [path]
+
+
+class LookupTool(BaseTool):
+    name = 'lookuptool'
+    description = 'Look something up'
+    input_schema = {'type': 'object', 'properties': {'query': {'type': 'string'}}}
+    cache_policy = 'ttl'
+    cache_ttl = 0
+
+    def execute(self, query):
+        return query
+
+
+@pytest.fixture
+def notes(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text('first', encoding='utf-8')
+    return str(path)
+
+
+def test_stat_entries_follow_the_file(notes):
+    cache, tool = ToolCache(), ReaderTool()
+    assert cache.lookup(tool, {'path': notes}) == (False, None)
+    cache.store(tool, {'path': notes}, 'first', 0.5)
+    assert cache.lookup(tool, {'path': notes}) == (True, 'first')
+
+    with open(notes, 'a', encoding='utf-8') as f:
+        f.write(' and more')
+    assert cache.lookup(tool, {'path': notes}) == (False, None)
+
+    stats = cache.stats()['readertool']
+    assert (stats.hits, stats.misses, stats.saved_seconds) == (1, 2, 0.5)
+
+
+def test_ttl_entries_expire():
+    cache, tool = ToolCache(), LookupTool()
+    cache.store(tool, {'query': 'x'}, 'x', 0.1)
+    assert cache.lookup(tool, {'query': 'x'}) == (False, None)
+
+
+def test_uncached_tools_and_errors_are_never_stored(notes):
+    cache = ToolCache()
+    cache.store(WriterTool(), {'path': notes, 'content': 'x'}, 'Wrote it', 0.1)
+    cache.store(ReaderTool(), {'path': notes}, 'Error: permission denied', 0.1)
+    assert cache.lookup(ReaderTool(), {'path': notes}) == (False, None)
+    assert looks_like_error('  An unexpected error occurred')
+
+
+def test_invalidate_by_overlapping_path(tmp_path, notes):
+    cache, tool = ToolCache(), ReaderTool()
+    cache.store(tool, {'path': notes}, 'first', 0.1)
+    assert cache.invalidate([str(tmp_path / 'other.txt')]) == 0
+    assert cache.invalidate([str(tmp_path)]) == 1
+    assert cache.stats()['readertool'].invalidations == 1
+    assert paths_overlap('/a/b', '/a/b/c') and not paths_overlap('/a/b', '/a/bc')
+
+
+def test_lru_eviction():
+    cache, tool = ToolCache(max_entries=2), LookupTool()
+    tool.cache_ttl = 60
+    for query in ('a', 'b', 'c'):
+        cache.store(tool, {'query': query}, query, 0.1)
+    assert cache.lookup(tool, {'query': 'a'}) == (False, None)
+    assert cache.lookup(tool, {'query': 'c'}) == (True, 'c')
+
+
+def test_assistant_serves_repeat_reads_and_drops_them_on_write(assistant, config, monkeypatch, notes):
+    monkeypatch.setattr(config, 'ENABLE_TOOL_CACHE', True)
+    reader = ReaderTool()
+    assistant.tool_registry.register(reader, 'tools.readertool')
+    assistant.tool_registry.register(WriterTool(), 'tools.writertool')
+
+    assistant._execute_tool(tool_use('readertool', {'path': notes}))
+    assistant._execute_tool(tool_use('readertool', {'path': notes}))
+    assert reader.calls == 1
+
+    assistant._execute_tool(tool_use('writertool', {'path': notes, 'content': 'second'}))
+    assert assistant._execute_tool(tool_use('readertool', {'path': notes})) == 'second'
+    assert reader.calls == 2
+
+
+def test_directory_entries_ignore_what_the_reader_skips(tmp_path):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'main.py').write_text('print(1)', encoding='utf-8')
+    (tmp_path / '.git').mkdir()
+    (tmp_path / '.git' / 'index').write_text('v1', encoding='utf-8')
+    (tmp_path / '__pycache__').mkdir()
+    cache, tool = ToolCache(), FileContentReaderTool()
+    tool_input = {'file_paths': [str(tmp_path)]}
+    cache.store(tool, tool_input, tool.execute(**tool_input), 0.1)
+
+    (tmp_path / '.git' / 'index').write_text('v2 after a commit', encoding='utf-8')
+    (tmp_path / '__pycache__' / 'main.cpython-311.pyc').write_bytes(b'\0' * 64)
+    (tmp_path / 'debug.log').write_text('noise', encoding='utf-8')
+    assert cache.lookup(tool, tool_input)[0]
+
+    (tmp_path / 'src' / 'main.py').write_text('print(2)', encoding='utf-8')
+    assert cache.lookup(tool, tool_input) == (False, None)
@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+
+from conftest import tool_use
+from tool_registry import ToolChangeDetector, ToolManifest, ToolRegistry
+from tools.base import BaseTool
+
+
+class EchoTool(BaseTool):
+    name = 'echotool'
+    description = 'Echo the input'
+    input_schema = {'type': 'object', 'properties': {'text': {'type': 'string'}}}
+
+    def execute(self, text=''):
+        return text
+
+
+def test_dispatch_reuses_registered_instance():
+    registry = ToolRegistry()
+    entry = registry.register(EchoTool(), 'tools.echotool')
+    assert registry.execute('echotool', {'text': 'hi'}) == 'hi'
+    assert registry.get('echotool') is entry
+    assert registry.call_counts() == {'echotool': 1}
+
+
+def test_concurrent_dispatch_counts_every_call():
+    registry = ToolRegistry()
+    registry.register(EchoTool(), 'tools.echotool')
+
+    def dispatch():
+        for _ in range(500):
+            registry.execute('echotool', {'text': 'hi'})
+
+    threads = [threading.Thread(target=dispatch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.call_counts() == {'echotool': 4000}
+
+
+def test_unknown_tool_is_not_imported(assistant):
+    sys.modules.pop('tools.filecreatortool', None)
+    result = assistant._execute_tool(tool_use('filecreatortool', {'path': 'x', 'content': 'y'}))
+    assert result == 'Tool not found: filecreatortool'
+    assert 'tools.filecreatortool' not in sys.modules
+    assert 'filecreatortool' not in assistant.tool_registry
+
+
+LAZY_TOOL_SOURCE = '''
+from tools.base import BaseTool
+
+
+class LazyTool(BaseTool):
+    name = 'lazytool'
+    description = 'Loaded on first use'
+    input_schema = {'type': 'object', 'properties': {}}
+
+    def execute(self):
+        return 'loaded'
+'''
+
+
+def test_lazy_entry_imports_its_module_on_first_dispatch(tmp_path, monkeypatch):
+    (tmp_path / 'lazy_tool_module.py').write_text(LAZY_TOOL_SOURCE, encoding='utf-8')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'lazy_tool_module', raising=False)
+
+    registry = ToolRegistry()
+    registry.register_lazy({'name': 'lazytool', 'description': 'Loaded on first use',
+                            'input_schema': {'type': 'object', 'properties': {}}}, 'lazy_tool_module')
+    assert not registry.get('lazytool').loaded
+    assert 'lazy_tool_module' not in sys.modules
+
+    assert registry.execute('lazytool', {}) == 'loaded'
+    assert registry.get('lazytool').loaded
+    assert registry.call_counts() == {'lazytool': 1}
+
+
+def test_manifest_is_keyed_by_file_hash(tmp_path):
+    path = tmp_path / 'tool_manifest.json'
+    manifest = ToolManifest(path)
+    schema = {'name': 'echotool', 'description': 'Echo the input', 'input_schema': {}}
+    manifest.update('tools.echotool', 'abc', [schema])
+    manifest.save()
+
+    reloaded = ToolManifest(path)
+    assert reloaded.lookup('tools.echotool', 'abc') == [schema]
+    assert reloaded.lookup('tools.echotool', 'def') is None
+    reloaded.prune([])
+    assert reloaded.lookup('tools.echotool', 'abc') is None
+
+
+def test_corrupt_manifest_starts_empty(tmp_path):
+    path = tmp_path / 'tool_manifest.json'
+    path.write_text('{not json', encoding='utf-8')
+    assert ToolManifest(path).lookup('tools.echotool', 'abc') is None
+
+
+def test_change_detector_ignores_touched_files(tmp_path):
+    path = tmp_path / 'echotool.py'
+    path.write_text('v1', encoding='utf-8')
+    detector = ToolChangeDetector()
+    assert detector.detect({'tools.echotool': path}) == (['tools.echotool'], [], [])
+    detector.record('tools.echotool', path)
+
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+    assert detector.detect({'tools.echotool': path}) == ([], [], [])
+
+    path.write_text('v2 with more', encoding='utf-8')
+    assert detector.detect({'tools.echotool': path}) == ([], ['tools.echotool'], [])
+    assert detector.detect({}) == ([], [], ['tools.echotool'])
+
+
+def test_refresh_holds_the_registry_lock(assistant, monkeypatch):
+    acquired_elsewhere = []
+
+    def scan(tools_path):
+        worker = threading.Thread(target=lambda: acquired_elsewhere.append(
+            assistant.tool_registry.lock.acquire(blocking=False)))
+        worker.start()
+        worker.join()
+        return {}
+
+    monkeypatch.setattr(assistant, '_scan_tool_modules', scan)
+    assistant.refresh_tools()
+    assert acquired_elsewhere == [False]
+
+
+def test_commands_return_their_output(assistant, monkeypatch):
+    monkeypatch.setattr(assistant, '_scan_tool_modules', lambda tools_path: {})
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.tool_registry.execute('echotool', {'text': 'hi'})
+    console = assistant.console
+
+    assert 'echotool: 1' in assistant.chat('stats')
+    assert 'No tool changes found' in assistant.chat('refresh')
+    assert 'No trace recorded yet' in assistant.chat('trace')
+    assert assistant.console is console
+
+
+BROKEN_TOOL_SOURCES = {
+    'goodtool': LAZY_TOOL_SOURCE.replace('LazyTool', 'GoodTool').replace("'lazytool'", "'goodtool'"),
+    'brokentool': "raise RuntimeError('broken at import time')\n",
+    'needsdeptool': "import notinstalledpackage\n",
+}
+
+
+def test_import_report_lists_each_module_when_one_fails(assistant, config, tmp_path, monkeypatch):
+    import tools
+
+    for module_name, source in BROKEN_TOOL_SOURCES.items():
+        (tmp_path / f'{module_name}.py').write_text(source, encoding='utf-8')
+    monkeypatch.setattr(tools, '__path__', [str(tmp_path)] + list(tools.__path__))
+    monkeypatch.setattr(config, 'TOOLS_DIR', tmp_path)
+    monkeypatch.setattr(config, 'PARALLEL_TOOL_IMPORT', True)
+    monkeypatch.setattr(config, 'LAZY_TOOL_LOADING', False)
+    monkeypatch.setattr(config, 'DEPENDENCY_INSTALL_POLICY', 'never')
+    # _load_tools drops every tools.* module; put the real ones back afterwards
+    for module_name in [name for name in sys.modules if name.startswith('tools.')]:
+        monkeypatch.setitem(sys.modules, module_name, sys.modules[module_name])
+
+    loaded = assistant._load_tools()
+    for module_name in BROKEN_TOOL_SOURCES:
+        sys.modules.pop(f'tools.{module_name}', None)
+
+    assert [tool['name'] for tool in loaded] == ['goodtool']
+    assert 'goodtool' in assistant.tool_registry
+    assert {module: status for module, _, status in assistant.tool_import_report} == {
+        'goodtool': 'imported', 'brokentool': 'error', 'needsdeptool': 'missing dependency'}
+    assert all(seconds >= 0 for _, seconds, _ in assistant.tool_import_report)
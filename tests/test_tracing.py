@@ -0,0 +1,126 @@
+import json
+import threading
+
+import pytest
+from rich.console import Console
+
+from conftest import ScriptedClient
+from test_tool_registry import EchoTool
+from tracing import Tracer, render_timeline, self_times, slowest_phases, span_depths
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_spans_nest_into_one_trace(tmp_path):
+    tracer = Tracer(tmp_path / 'trace.jsonl')
+    with tracer.span('turn') as turn:
+        with tracer.span('model', step=1) as model:
+            model.set(tokens=42)
+        with tracer.span('tool_call', tool='echotool'):
+            pass
+
+    spans = tracer.last_trace()
+    assert [span.name for span in spans] == ['turn', 'model', 'tool_call']
+    assert {span.trace_id for span in spans} == {turn.trace_id}
+    assert span_depths(spans) == {turn.span_id: 0, spans[1].span_id: 1, spans[2].span_id: 1}
+    assert tracer.current() is None
+
+    written = read_spans(tmp_path / 'trace.jsonl')
+    assert [span['name'] for span in written] == ['turn', 'model', 'tool_call']
+    assert written[1]['parent_id'] == turn.span_id
+    assert written[1]['attributes'] == {'step': 1, 'tokens': 42}
+
+
+def test_each_root_span_starts_a_new_trace():
+    tracer = Tracer(keep_traces=2)
+    for name in ('first', 'second', 'third'):
+        with tracer.span(name):
+            pass
+    assert [trace[0].name for trace in tracer.traces] == ['second', 'third']
+    assert tracer.traces[0][0].trace_id != tracer.traces[1][0].trace_id
+
+
+def test_errors_are_recorded_and_reraised():
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span('turn'):
+            raise ValueError('bad input')
+    assert tracer.last_trace()[0].attributes == {'error': 'bad input'}
+    assert tracer.last_trace()[0].duration is not None
+
+
+def test_attach_joins_a_worker_thread_to_the_trace():
+    tracer = Tracer()
+    with tracer.span('turn') as turn:
+        def work():
+            with tracer.attach(turn), tracer.span('tool_call'):
+                pass
+        worker = threading.Thread(target=work, name='tool-worker')
+        worker.start()
+        worker.join()
+
+    tool_call = tracer.last_trace()[1]
+    assert tool_call.parent_id == turn.span_id
+    assert tool_call.thread == 'tool-worker'
+
+
+def test_disabled_tracer_yields_none(tmp_path):
+    tracer = Tracer(tmp_path / 'trace.jsonl', enabled=False)
+    with tracer.span('turn') as span:
+        assert span is None
+    assert tracer.last_trace() == []
+    assert not (tmp_path / 'trace.jsonl').exists()
+
+
+def test_trace_file_is_rotated(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    path.write_text('x' * 2048, encoding='utf-8')
+    tracer = Tracer(path, max_bytes=1024)
+    with tracer.span('turn'):
+        pass
+    assert (tmp_path / 'trace.jsonl.1').stat().st_size == 2048
+    assert [span['name'] for span in read_spans(path)] == ['turn']
+
+
+def test_self_time_excludes_children():
+    tracer = Tracer()
+    with tracer.span('turn'):
+        for _ in range(2):
+            with tracer.span('model'):
+                pass
+    spans = tracer.last_trace()
+    spans[0].duration, spans[1].duration, spans[2].duration = 1.0, 0.5, 0.25
+
+    assert self_times(spans)[spans[0].span_id] == 0.25
+    assert slowest_phases(spans) == [{'name': 'model', 'count': 2, 'seconds': 0.75},
+                                     {'name': 'turn', 'count': 1, 'seconds': 0.25}]
+
+
+def test_render_timeline():
+    console = Console(record=True, width=160)
+    render_timeline(console, [])
+    tracer = Tracer()
+    with tracer.span('turn'), tracer.span('model', step=1):
+        pass
+    render_timeline(console, tracer.last_trace())
+    output = console.export_text()
+    assert 'No trace recorded yet' in output
+    assert 'Slowest phases' in output and 'step=1' in output
+
+
+def test_chat_traces_the_turn(assistant, config):
+    assistant.tracer = Tracer.from_config(config)
+    assistant.tool_registry.register(EchoTool(), 'tools.echotool')
+    assistant.client = ScriptedClient([{'tool': 'echotool', 'input': {'text': 'hi'}}, {'text': 'Done.'}])
+
+    assert assistant.chat('echo hi') == 'Done.'
+
+    spans = assistant.tracer.last_trace()
+    by_name = {span.name: span for span in spans}
+    assert spans[0].name == 'turn'
+    assert [span.name for span in spans].count('model') == 2
+    assert by_name['tool_call'].attributes['tool'] == 'echotool'
+    assert by_name['model'].attributes['stop_reason'] == 'end_turn'
+    assert len(read_spans(config.TRACE_FILE)) == len(spans)
@@ -0,0 +1,49 @@
+import time
+from types import SimpleNamespace
+
+import turn_records
+from conftest import ScriptedClient
+from tools.base import BaseTool
+from turn_records import PhaseTimer, normalize_content
+
+
+class SleepTool(BaseTool):
+    name = 'sleeptool'
+    description = 'Sleep briefly'
+    input_schema = {'type': 'object', 'properties': {}}
+
+    def execute(self):
+        time.sleep(0.05)
+        return 'rested'
+
+
+def test_nested_phases_are_timed_exclusively(monkeypatch):
+    clock = iter([0.0, 1.0, 3.0, 4.0])
+    monkeypatch.setattr(turn_records, 'time', SimpleNamespace(perf_counter=lambda: next(clock)))
+    timer = PhaseTimer()
+    with timer.phase('outer'):
+        with timer.phase('inner'):
+            pass
+    assert timer.as_dict() == {'outer': 2.0, 'inner': 2.0}
+
+
+def test_scripted_turn_is_recorded_per_phase(assistant):
+    assistant.tool_registry.register(SleepTool(), 'tools.sleeptool')
+    assistant.client = ScriptedClient([{'tool': 'sleeptool'}, {'text': 'Done.'}])
+    assert assistant.chat('rest a moment') == 'Done.'
+
+    turn = assistant.last_turn
+    assert (turn.model_calls, turn.tools_used, turn.stop_reason) == (2, ['sleeptool'], 'end_turn')
+    assert (turn.input_tokens, turn.output_tokens) == (200, 20)
+    assert turn.tool_seconds >= 0.05
+    assert turn.seconds >= turn.model_seconds + turn.tool_seconds
+
+    phases = assistant.phase_timer.as_dict()
+    assert {'serialize', 'model', 'tool'} <= set(phases)
+    assert phases['tool'] >= 0.05
+    assert all(seconds >= 0 for seconds in phases.values())
+
+    # History holds plain dicts, not SDK objects
+    assert normalize_content(assistant.conversation_history[1]['content']) == \
+        assistant.conversation_history[1]['content']
+    assert isinstance(assistant.conversation_history[1]['content'][0], dict)
@@ -0,0 +1,138 @@
+import threading
+from typing import Any, Dict, Optional
+
+
+class RequestUsage:
+    """Token figures of a single API request."""
+
+    __slots__ = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+    def __init__(self, input_tokens: int = 0, output_tokens: int = 0,
+                 cache_read_tokens: int = 0, cache_write_tokens: int = 0):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cache_read_tokens = cache_read_tokens
+        self.cache_write_tokens = cache_write_tokens
+
+    @classmethod
+    def from_usage(cls, usage: Any) -> "RequestUsage":
+        """Build from the usage object of an API response."""
+        return cls(
+            input_tokens=getattr(usage, 'input_tokens', None) or 0,
+            output_tokens=getattr(usage, 'output_tokens', None) or 0,
+            cache_read_tokens=getattr(usage, 'cache_read_input_tokens', None) or 0,
+            cache_write_tokens=getattr(usage, 'cache_creation_input_tokens', None) or 0
+        )
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Size of the prompt that was sent; input_tokens excludes cached tokens."""
+        return self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+class TokenAccounting:
+    """
+    Keeps the figures that the old running total mixed together:
+
+    - context_tokens: how much of the context window the conversation occupies,
+      i.e. the prompt plus output of the latest request. This is what
+      MAX_CONVERSATION_TOKENS limits.
+    - billed input, output and cache tokens summed over every request
+      (including side requests such as history summaries), which is what
+      the conversation costs.
+
+    It also forecasts the prompt size of the next request from a character
+    estimate, scaled by how far the estimate was off for the last request.
+    """
+
+    def __init__(self, context_limit: int, max_output_tokens: int):
+        self.context_limit = context_limit
+        self.max_output_tokens = max_output_tokens
+        # Discarded hedged requests are billed from the hedge pool's threads
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_config(cls, config) -> "TokenAccounting":
+        return cls(config.MAX_CONVERSATION_TOKENS, config.MAX_TOKENS)
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.context_tokens = 0
+        self.last_request: Optional[RequestUsage] = None
+        self.forecast_tokens = 0
+        self.ratio = 1.0
+
+    def record(self, usage: Any, estimated_prompt_tokens: Optional[int] = None) -> RequestUsage:
+        """
+        Record a conversation request. estimated_prompt_tokens is the character
+        estimate of the prompt that was sent, used to calibrate forecasts.
+        """
+        request = self.record_billed(usage)
+        self.context_tokens = request.total_tokens
+        self.last_request = request
+        if estimated_prompt_tokens and request.prompt_tokens:
+            self.ratio = min(4.0, max(0.5, request.prompt_tokens / estimated_prompt_tokens))
+        return request
+
+    def record_billed(self, usage: Any) -> RequestUsage:
+        """Record a request that is billed but not part of the conversation context."""
+        request = usage if isinstance(usage, RequestUsage) else RequestUsage.from_usage(usage)
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += request.input_tokens
+            self.output_tokens += request.output_tokens
+            self.cache_read_tokens += request.cache_read_tokens
+            self.cache_write_tokens += request.cache_write_tokens
+        return request
+
+    def project(self, estimated_prompt_tokens: int) -> int:
+        """Scale a character estimate of a prompt by the last measured error."""
+        return int(estimated_prompt_tokens * self.ratio)
+
+    def forecast(self, estimated_prompt_tokens: int) -> int:
+        """Forecast and remember the prompt tokens of the request about to be sent."""
+        self.forecast_tokens = self.project(estimated_prompt_tokens)
+        return self.forecast_tokens
+
+    def output_budget(self, forecast_tokens: Optional[int] = None) -> int:
+        """max_tokens for the next request: what is left of the context window, up to MAX_TOKENS."""
+        if forecast_tokens is None:
+            forecast_tokens = self.forecast_tokens
+        return max(0, min(self.max_output_tokens, self.context_limit - forecast_tokens))
+
+    @property
+    def remaining_tokens(self) -> int:
+        return max(0, self.context_limit - self.context_tokens)
+
+    @property
+    def billed_tokens(self) -> int:
+        """All tokens processed across requests, cached or not."""
+        return self.input_tokens + self.cache_read_tokens + self.cache_write_tokens + self.output_tokens
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        """Share of prompt tokens that were read from the cache."""
+        prompt = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+        return self.cache_read_tokens / prompt if prompt else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'context_tokens': self.context_tokens,
+            'context_limit': self.context_limit,
+            'forecast_tokens': self.forecast_tokens,
+            'requests': self.requests,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cache_read_tokens': self.cache_read_tokens,
+            'cache_write_tokens': self.cache_write_tokens,
+            'billed_tokens': self.billed_tokens
+        }
@@ -0,0 +1,169 @@
+import collections
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+POLICIES = ('stat', 'ttl')
+
+
+class CacheEntry:
+    __slots__ = ("result", "seconds", "created", "paths", "fingerprint")
+
+    def __init__(self, result: Any, seconds: float, paths: List[str], fingerprint: Optional[tuple]):
+        self.result = result
+        self.seconds = seconds
+        self.created = time.monotonic()
+        self.paths = paths
+        self.fingerprint = fingerprint
+
+
+class ToolCacheStats:
+    __slots__ = ("hits", "misses", "saved_seconds", "invalidations")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.invalidations = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ToolCache:
+    """
+    Memoizes results of idempotent tool calls, keyed by tool name and input.
+
+    Tools opt in through BaseTool.cache_policy:
+    - 'stat': valid while the (mtime, size) of every file under the call's
+      affected_paths is unchanged, for tools that read files. Files and
+      directories the tool's ignores_path skips are not fingerprinted
+    - 'ttl': valid for the tool's cache_ttl seconds, for web lookups
+    Tools without a policy, including every file-mutating tool, are never cached.
+    When a mutating tool runs, entries whose paths overlap its affected_paths
+    are dropped.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "collections.OrderedDict[Tuple[str, str], CacheEntry]" = collections.OrderedDict()
+        self._stats: Dict[str, ToolCacheStats] = collections.defaultdict(ToolCacheStats)
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, tool, tool_input: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Return (True, result) for a valid cached result, otherwise (False, None)."""
+        policy = getattr(tool, 'cache_policy', None)
+        if policy not in POLICIES:
+            return False, None
+        key = cache_key(tool.name, tool_input)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and self._is_valid(tool, entry):
+            with self._lock:
+                self._entries.move_to_end(key)
+                stats = self._stats[tool.name]
+                stats.hits += 1
+                stats.saved_seconds += entry.seconds
+            return True, entry.result
+
+        with self._lock:
+            if entry is not None:
+                self._entries.pop(key, None)
+            self._stats[tool.name].misses += 1
+        return False, None
+
+    def store(self, tool, tool_input: Dict[str, Any], result: Any, seconds: float) -> None:
+        """Cache a successful result of a tool with a cache policy."""
+        policy = getattr(tool, 'cache_policy', None)
+        if policy not in POLICIES or looks_like_error(result):
+            return
+        paths = absolute_paths(tool, tool_input)
+        fingerprint = fingerprint_paths(paths, tool.ignores_path) if policy == 'stat' else None
+        with self._lock:
+            self._entries[cache_key(tool.name, tool_input)] = CacheEntry(result, seconds, paths, fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, paths: List[str]) -> int:
+        """Drop entries whose paths overlap any of the given paths; returns how many were dropped."""
+        if not paths:
+            return 0
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if any(paths_overlap(cached, changed) for cached in entry.paths for changed in paths)]
+            for key in stale:
+                del self._entries[key]
+                self._stats[key[0]].invalidations += 1
+        return len(stale)
+
+    def stats(self) -> Dict[str, ToolCacheStats]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _is_valid(self, tool, entry: CacheEntry) -> bool:
+        if tool.cache_policy == 'ttl':
+            return time.monotonic() - entry.created < getattr(tool, 'cache_ttl', 0)
+        return fingerprint_paths(entry.paths, tool.ignores_path) == entry.fingerprint
+
+
+def cache_key(tool_name: str, tool_input: Dict[str, Any]) -> Tuple[str, str]:
+    return tool_name, json.dumps(tool_input, sort_keys=True, default=str)
+
+
+def absolute_paths(tool, tool_input: Dict[str, Any]) -> List[str]:
+    try:
+        return [os.path.abspath(path) for path in tool.affected_paths(**tool_input)]
+    except Exception:
+        return []
+
+
+def fingerprint_paths(paths: List[str], ignores: Optional[Callable[[str], bool]] = None) -> tuple:
+    """
+    (path, mtime, size) of every file under paths; missing paths are recorded as such.
+    Entries below a directory for which ignores(path) is true are skipped, the way
+    the tool skips them when it reads the directory.
+    """
+    fingerprint = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                if ignores is not None:
+                    dirs[:] = [name for name in dirs if not ignores(os.path.join(root, name))]
+                    files = [name for name in files if not ignores(os.path.join(root, name))]
+                dirs.sort()
+                for name in sorted(files):
+                    fingerprint.append(_stat(os.path.join(root, name)))
+        else:
+            fingerprint.append(_stat(path))
+    return tuple(fingerprint)
+
+
+def _stat(path: str) -> tuple:
+    try:
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return path, None, None
+
+
+def paths_overlap(first: str, second: str) -> bool:
+    """True if the paths are equal or one contains the other."""
+    if first == second:
+        return True
+    return first.startswith(second.rstrip(os.sep) + os.sep) or second.startswith(first.rstrip(os.sep) + os.sep)
+
+
+def looks_like_error(result: Any) -> bool:
+    """Tools report failures as text; those results are never cached."""
+    if not isinstance(result, str):
+        return False
+    lowered = result.lstrip().lower()
+    return lowered.startswith(('error', 'an unexpected error', '{"error"'))
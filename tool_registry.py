@@ -0,0 +1,240 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tools.base import BaseTool
+
+
+class ToolEntry:
+    """
+    A tool schema together with its live instance, bound execute callable and
+    the number of times it has been dispatched. Entries restored from the
+    manifest have no instance until their module is imported on first use.
+    """
+
+    __slots__ = ("name", "module_name", "schema_data", "instance", "execute", "calls")
+
+    def __init__(self, schema: Dict[str, Any], module_name: str, instance: Optional[BaseTool] = None):
+        self.name = schema["name"]
+        self.module_name = module_name
+        self.schema_data = schema
+        self.instance = instance
+        self.execute: Optional[Callable[..., Any]] = instance.execute if instance else None
+        self.calls = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.instance is not None
+
+    def schema(self) -> Dict[str, Any]:
+        return self.schema_data
+
+
+class ToolRegistry:
+    """
+    Maps tool names to live tool instances so dispatch is a dict lookup
+    instead of a module import plus instantiation of every tool class.
+    The registry is only rebuilt when the assistant refreshes its tools.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, ToolEntry] = {}
+        # Sessions share the registry: lazy loads, lookups and a refresh
+        # (Assistant.refresh_tools holds it while it swaps entries) must not interleave
+        self.lock = threading.RLock()
+
+    def __contains__(self, tool_name: str) -> bool:
+        return tool_name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._entries.clear()
+
+    def register(self, instance: BaseTool, module_name: str) -> ToolEntry:
+        """Register a live tool instance, replacing any entry with the same name."""
+        schema = {
+            "name": instance.name,
+            "description": instance.description,
+            "input_schema": instance.input_schema
+        }
+        entry = ToolEntry(schema, module_name, instance)
+        with self.lock:
+            previous = self._entries.get(entry.name)
+            if previous is not None:
+                entry.calls = previous.calls
+            self._entries[entry.name] = entry
+        return entry
+
+    def register_lazy(self, schema: Dict[str, Any], module_name: str) -> ToolEntry:
+        """Register a tool by schema only; its module is imported on first dispatch."""
+        entry = ToolEntry(schema, module_name)
+        with self.lock:
+            self._entries[entry.name] = entry
+        return entry
+
+    def unregister_module(self, module_name: str) -> List[str]:
+        """Remove every tool registered from a module and return their names."""
+        with self.lock:
+            names = [name for name, entry in self._entries.items() if entry.module_name == module_name]
+            for name in names:
+                del self._entries[name]
+        return names
+
+    def get(self, tool_name: str) -> Optional[ToolEntry]:
+        with self.lock:
+            return self._entries.get(tool_name)
+
+    def execute(self, tool_name: str, tool_input: Dict[str, Any]) -> Any:
+        """
+        Dispatch a call to a registered tool, importing its module first if the
+        entry came from the manifest. Raises KeyError if the tool is unknown.
+        """
+        with self.lock:
+            entry = self._entries[tool_name]
+        if not entry.loaded:
+            entry = self.load(tool_name)
+        # Parallel tool calls dispatch from several threads
+        with self.lock:
+            entry.calls += 1
+        return entry.execute(**tool_input)
+
+    def load(self, tool_name: str) -> ToolEntry:
+        """
+        Import the module behind a lazy entry and register live instances for
+        every tool class it defines. Raises KeyError if the module no longer
+        provides the tool.
+        """
+        with self.lock:
+            entry = self._entries[tool_name]
+            if entry.loaded:
+                return entry
+            module = importlib.import_module(entry.module_name)
+            for obj in find_tool_classes(module):
+                self.register(obj(), entry.module_name)
+            entry = self._entries[tool_name]
+        if not entry.loaded:
+            raise KeyError(f"{entry.module_name} does not define tool '{tool_name}'")
+        return entry
+
+    def call_counts(self) -> Dict[str, int]:
+        """Return the number of dispatches per tool name."""
+        with self.lock:
+            return {name: entry.calls for name, entry in self._entries.items()}
+
+
+class ToolManifest:
+    """
+    On-disk cache of tool schemas keyed by each tool file's content hash.
+    A tool whose file hash matches its manifest entry can be advertised to
+    the model without importing its module.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._modules: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._modules = data.get("modules", {})
+        except (OSError, ValueError):
+            self._modules = {}
+
+    def lookup(self, module_name: str, file_hash: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached schemas for a module, or None if missing or stale."""
+        record = self._modules.get(module_name)
+        if record and record.get("hash") == file_hash:
+            return record.get("tools", [])
+        return None
+
+    def update(self, module_name: str, file_hash: str, schemas: List[Dict[str, Any]]) -> None:
+        self._modules[module_name] = {"hash": file_hash, "tools": schemas}
+        self._dirty = True
+
+    def prune(self, module_names) -> None:
+        """Drop records for modules that no longer exist."""
+        for name in set(self._modules) - set(module_names):
+            del self._modules[name]
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.VERSION, "modules": self._modules}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+class ToolChangeDetector:
+    """
+    Tracks an (mtime, size, hash) fingerprint per tool file. Files whose mtime
+    and size are unchanged are skipped without reading them; touched files are
+    only reported as modified if their content hash differs.
+    """
+
+    def __init__(self):
+        self._fingerprints: Dict[str, Tuple[int, int, str]] = {}
+
+    def reset(self) -> None:
+        self._fingerprints.clear()
+
+    def record(self, module_name: str, path) -> str:
+        """Fingerprint a tool file and return its content hash."""
+        stat = os.stat(path)
+        file_hash = hash_file(path)
+        self._fingerprints[module_name] = (stat.st_mtime_ns, stat.st_size, file_hash)
+        return file_hash
+
+    def forget(self, module_name: str) -> None:
+        self._fingerprints.pop(module_name, None)
+
+    def detect(self, module_paths: Dict[str, Path]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compare the current tool files against the recorded fingerprints.
+        Returns (added, modified, removed) module names; fingerprints of
+        modified files are left for the caller to record after reloading.
+        """
+        added, modified = [], []
+        for module_name, path in module_paths.items():
+            previous = self._fingerprints.get(module_name)
+            if previous is None:
+                added.append(module_name)
+                continue
+            stat = os.stat(path)
+            if (stat.st_mtime_ns, stat.st_size) == previous[:2]:
+                continue
+            file_hash = hash_file(path)
+            if file_hash == previous[2]:
+                # Touched but not changed
+                self._fingerprints[module_name] = (stat.st_mtime_ns, stat.st_size, file_hash)
+            else:
+                modified.append(module_name)
+        removed = [name for name in self._fingerprints if name not in module_paths]
+        return added, modified, removed
+
+
+def hash_file(path) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def find_tool_classes(module) -> List[type]:
+    """Return the BaseTool subclasses defined or imported in a module."""
+    return [
+        obj for _, obj in inspect.getmembers(module)
+        if inspect.isclass(obj) and issubclass(obj, BaseTool) and obj != BaseTool
+    ]
@@ -1,7 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Dict, List
 
 class BaseTool(ABC):
+    # Tools that create, modify or delete files set this to True
+    mutates_files = False
+    # Opt in to result caching: 'stat' (valid while files under affected_paths are
+    # unchanged) or 'ttl' (valid for cache_ttl seconds); None disables caching
+    cache_policy = None
+    cache_ttl = 300
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -24,3 +31,13 @@ class BaseTool(ABC):
     def execute(self, **kwargs) -> str:
         """Execute the tool with given parameters"""
         pass
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        """Filesystem paths a call reads or writes; calls that share a path with a
+        file-mutating call are run serially"""
+        return []
+
+    def ignores_path(self, path: str) -> bool:
+        """True for files and directories under affected_paths that the tool never
+        reads, so the 'stat' cache policy doesn't fingerprint them"""
+        return False
@@ -24,6 +24,10 @@ class CreateFoldersTool(BaseTool):
         },
         "required": ["folder_paths"]
     }
+    mutates_files = True
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        return list(kwargs.get("folder_paths", []))
 
     def execute(self, **kwargs) -> str:
         folder_paths: List[str] = kwargs.get("folder_paths", [])
@@ -1,6 +1,6 @@
 from tools.base import BaseTool
 import os
-from typing import Dict
+from typing import Dict, List
 
 class DiffEditorTool(BaseTool):
     name = "diffeditortool"
@@ -37,6 +37,10 @@ class DiffEditorTool(BaseTool):
         },
         "required": ["path", "old_text", "new_text"]
     }
+    mutates_files = True
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        return [kwargs["path"]] if kwargs.get("path") else []
 
     def execute(self, **kwargs) -> str:
         path = kwargs.get("path")
@@ -25,6 +25,8 @@ class DuckduckgoTool(BaseTool):
         },
         "required": ["query"]
     }
+    cache_policy = 'ttl'
+    cache_ttl = 600
 
     def execute(self, **kwargs) -> str:
         query = kwargs.get("query")
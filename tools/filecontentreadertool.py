@@ -2,6 +2,7 @@ from tools.base import BaseTool
 import os
 import json
 import mimetypes
+from typing import List
 
 class FileContentReaderTool(BaseTool):
     name = "filecontentreadertool"
@@ -39,6 +40,8 @@ class FileContentReaderTool(BaseTool):
         '.log', '.tmp', '.temp', '.swp', '.bak', '.old', '.orig', '.pid'
     }
 
+    cache_policy = 'stat'
+
     input_schema = {
         "type": "object",
         "properties": {
@@ -53,6 +56,12 @@ class FileContentReaderTool(BaseTool):
         "required": ["file_paths"]
     }
 
+    def affected_paths(self, **kwargs) -> List[str]:
+        return list(kwargs.get('file_paths', []))
+
+    def ignores_path(self, path: str) -> bool:
+        return self._should_skip(path)
+
     def _should_skip(self, path: str) -> bool:
         """Determine if a file or directory should be skipped."""
         name = os.path.basename(path)
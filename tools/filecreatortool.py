@@ -98,6 +98,13 @@ class FileCreatorTool(BaseTool):
         },
         "required": ["files"]
     }
+    mutates_files = True
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        files = kwargs.get('files', [])
+        if isinstance(files, dict):
+            files = [files]
+        return [f['path'] for f in files if isinstance(f, dict) and f.get('path')]
 
     def execute(self, **kwargs) -> str:
         """
@@ -1,6 +1,7 @@
 from tools.base import BaseTool
 import os
 import re
+from typing import List
 
 class FileEditTool(BaseTool):
     name = "fileedittool"
@@ -25,6 +26,10 @@ class FileEditTool(BaseTool):
         },
         "required": ["file_path", "edit_type", "new_content"]
     }
+    mutates_files = True
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        return [kwargs['file_path']] if kwargs.get('file_path') else []
 
     def execute(self, **kwargs) -> str:
         file_path = kwargs.get('file_path')
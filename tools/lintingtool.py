@@ -62,6 +62,10 @@ class LintingTool(BaseTool):
         },
         "required": []
     }
+    mutates_files = True  # --fix and --add-noqa rewrite files
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        return list(kwargs.get("paths") or ["."])
 
     def execute(self, **kwargs) -> str:
         paths = kwargs.get("paths", [])
@@ -0,0 +1,114 @@
+from tools.base import BaseTool
+import json
+from config import Config
+from spill_store import SpillStore
+
+class ResultPagerTool(BaseTool):
+    name = "resultpagertool"
+    description = '''
+    Reads part of a large tool result that was stored out of band.
+    When a tool result is too large for the conversation, it is replaced with a handle and a preview.
+    Pass that handle with one of:
+    - offset/length: read a character range
+    - start_line/end_line: read a 1-based, inclusive line range
+    - json_key: read one entry of a JSON result (a top-level key such as a file path,
+      or a dotted path like "results.0.name")
+    - list_keys: list the top-level JSON keys with the size of each value
+    Output is limited to a single page; request further ranges to continue.
+    '''
+    input_schema = {
+        "type": "object",
+        "properties": {
+            "handle": {
+                "type": "string",
+                "description": "Handle of the stored result"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Character offset to start reading from"
+            },
+            "length": {
+                "type": "integer",
+                "description": "Number of characters to read"
+            },
+            "start_line": {
+                "type": "integer",
+                "description": "First line to read (1-based)"
+            },
+            "end_line": {
+                "type": "integer",
+                "description": "Last line to read (inclusive)"
+            },
+            "json_key": {
+                "type": "string",
+                "description": "Top-level key or dotted path of a JSON value to read"
+            },
+            "list_keys": {
+                "type": "boolean",
+                "description": "List the top-level JSON keys and their sizes"
+            }
+        },
+        "required": ["handle"]
+    }
+
+    def execute(self, **kwargs) -> str:
+        store = SpillStore.from_config(Config)
+        page_chars = getattr(Config, 'SPILL_PAGE_CHARS', 8000)
+
+        try:
+            text = store.get(kwargs.get("handle", ""))
+        except KeyError as e:
+            return f"Error: {e.args[0]}"
+
+        if kwargs.get("list_keys") or kwargs.get("json_key") is not None:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                return "Error: Stored result is not JSON"
+            if kwargs.get("list_keys"):
+                return self._list_keys(data, page_chars)
+            try:
+                value = self._lookup(data, kwargs["json_key"])
+            except (KeyError, IndexError, TypeError):
+                return f"Error: Key '{kwargs['json_key']}' not found"
+            page = value if isinstance(value, str) else json.dumps(value, indent=2)
+            return self._page(page, 0, page_chars, f"key '{kwargs['json_key']}'")
+
+        if kwargs.get("start_line") is not None or kwargs.get("end_line") is not None:
+            lines = text.splitlines()
+            start = max(1, kwargs.get("start_line") or 1)
+            end = min(len(lines), kwargs.get("end_line") or len(lines))
+            if start > len(lines):
+                return f"Error: Result has only {len(lines)} lines"
+            page = "\n".join(lines[start - 1:end])
+            if len(page) > page_chars:
+                page = page[:page_chars]
+                end = start + page.count("\n")
+                return f"[Lines {start}-{end} of {len(lines)}, truncated to {page_chars} chars]\n{page}"
+            return f"[Lines {start}-{end} of {len(lines)}]\n{page}"
+
+        offset = max(0, kwargs.get("offset") or 0)
+        length = min(page_chars, kwargs.get("length") or page_chars)
+        return self._page(text, offset, length, "result")
+
+    def _page(self, text: str, offset: int, length: int, label: str) -> str:
+        end = min(len(text), offset + length)
+        if offset >= len(text):
+            return f"Error: Offset {offset} is past the end of the {label} ({len(text)} chars)"
+        return f"[Chars {offset}-{end} of {len(text)} in {label}]\n{text[offset:end]}"
+
+    def _lookup(self, data, key: str):
+        if isinstance(data, dict) and key in data:
+            return data[key]
+        for part in key.split("."):
+            data = data[int(part)] if isinstance(data, list) else data[part]
+        return data
+
+    def _list_keys(self, data, page_chars: int) -> str:
+        if not isinstance(data, dict):
+            return f"Stored result is a JSON {type(data).__name__}, not an object"
+        lines = []
+        for key, value in data.items():
+            size = len(value) if isinstance(value, str) else len(json.dumps(value))
+            lines.append(f"{key} ({size:,} chars)")
+        return "\n".join(lines)[:page_chars]
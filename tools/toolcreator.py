@@ -6,6 +6,7 @@ import os
 from dotenv import load_dotenv
 import re
 import anthropic
+from typing import List
 
 load_dotenv()
 
@@ -27,12 +28,16 @@ class ToolCreatorTool(BaseTool):
         },
         "required": ["description"]
     }
+    mutates_files = True
 
     def __init__(self):
         self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
         self.console = Console()
         self.tools_dir = Path(__file__).parent.parent / "tools"  # Fixed path
 
+    def affected_paths(self, **kwargs) -> List[str]:
+        return [str(self.tools_dir)]
+
     def _sanitize_filename(self, name: str) -> str:
         """Convert tool name to valid Python filename"""
         return name + '.py'  # Keep exact name, just add .py
@@ -1,5 +1,6 @@
 import logging
 import subprocess
+import sys
 from typing import List, Optional
 
 from tools.base import BaseTool
@@ -43,6 +44,11 @@ class UVPackageManager(BaseTool):
         },
         "required": ["command"]
     }
+    mutates_files = True
+
+    def affected_paths(self, **kwargs) -> List[str]:
+        # Package operations modify the active environment
+        return [sys.prefix]
 
     def execute(self, **kwargs) -> str:
         command = kwargs.get("command")
@@ -22,6 +22,8 @@ class WebScraperTool(BaseTool):
         },
         "required": ["url"]
     }
+    cache_policy = 'ttl'
+    cache_ttl = 300
 
     def execute(self, **kwargs) -> str:
         url = kwargs.get("url")
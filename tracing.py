@@ -0,0 +1,208 @@
+import collections
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# One lock per trace file, shared by every Tracer (e.g. all web sessions) writing to it
+_file_locks: Dict[str, threading.Lock] = collections.defaultdict(threading.Lock)
+
+
+class Span:
+    """One timed operation in a trace; spans nest through parent_id."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "duration", "attributes", "thread")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(6)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.thread = threading.current_thread().name
+
+    def set(self, **attributes) -> None:
+        """Add attributes known only once the operation has run (tokens, stop reason, ...)."""
+        self.attributes.update(attributes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Tracer:
+    """
+    Collects nested spans per user turn. A span opened with no open parent
+    starts a new trace; when it closes, the trace's spans are kept in memory
+    (the last keep_traces) and appended to path as JSON lines. Nesting is
+    tracked per thread; work handed to another thread joins the trace with
+    attach(parent).
+    """
+
+    def __init__(self, path: Optional[Path] = None, keep_traces: int = 20, max_bytes: Optional[int] = None,
+                 enabled: bool = True):
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.traces: "collections.deque[List[Span]]" = collections.deque(maxlen=keep_traces)
+        self._open: Dict[str, List[Span]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "Tracer":
+        max_mb = getattr(config, 'TRACE_MAX_MB', None)
+        return cls(
+            path=getattr(config, 'TRACE_FILE', None),
+            keep_traces=getattr(config, 'TRACE_KEEP_TURNS', 20),
+            max_bytes=max_mb * 1024 * 1024 if max_mb else None,
+            enabled=getattr(config, 'ENABLE_TRACING', False)
+        )
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Time the block as a span under the current one; yields the Span, or None when disabled."""
+        if not self.enabled:
+            yield None
+            return
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(parent.trace_id if parent else secrets.token_hex(8), parent.span_id if parent else None,
+                    name, attributes)
+        with self._lock:
+            self._open.setdefault(span.trace_id, []).append(span)
+        stack.append(span)
+        start_time = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=str(e))
+            raise
+        finally:
+            span.duration = time.perf_counter() - start_time
+            stack.pop()
+            if parent is None:
+                self._finish(span.trace_id)
+
+    @contextmanager
+    def attach(self, parent: Optional[Span]) -> Iterator[None]:
+        """Make parent the current span on this thread, e.g. in a tool worker."""
+        if parent is None:
+            yield
+            return
+        stack = self._stack()
+        stack.append(parent)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def last_trace(self) -> List[Span]:
+        return list(self.traces[-1]) if self.traces else []
+
+    def _finish(self, trace_id: str) -> None:
+        with self._lock:
+            spans = self._open.pop(trace_id, [])
+        spans.sort(key=lambda span: span.start)
+        self.traces.append(spans)
+        if self.path is not None:
+            self._write(spans)
+
+    def _write(self, spans: List[Span]) -> None:
+        lines = ''.join(json.dumps(span.as_dict(), default=str) + '\n' for span in spans)
+        try:
+            with _file_locks[str(self.path)]:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                if self.max_bytes and self.path.exists() and self.path.stat().st_size > self.max_bytes:
+                    os.replace(self.path, self.path.with_name(self.path.name + '.1'))
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+        except OSError as e:
+            logging.error(f"Could not write trace to {self.path}: {str(e)}")
+
+
+def span_depths(spans: List[Span]) -> Dict[str, int]:
+    by_id = {span.span_id: span for span in spans}
+    depths = {}
+    for span in spans:
+        depth, parent = 0, by_id.get(span.parent_id)
+        while parent is not None:
+            depth += 1
+            parent = by_id.get(parent.parent_id)
+        depths[span.span_id] = depth
+    return depths
+
+
+def self_times(spans: List[Span]) -> Dict[str, float]:
+    """Span duration minus its children's; children running in parallel can't take it below 0."""
+    child_time: Dict[str, float] = collections.defaultdict(float)
+    for span in spans:
+        if span.parent_id:
+            child_time[span.parent_id] += span.duration or 0.0
+    return {span.span_id: max(0.0, (span.duration or 0.0) - child_time[span.span_id]) for span in spans}
+
+
+def slowest_phases(spans: List[Span], top: int = 5) -> List[Dict[str, Any]]:
+    """Self time summed per span name, slowest first."""
+    own = self_times(spans)
+    totals: Dict[str, Dict[str, Any]] = {}
+    for span in spans:
+        entry = totals.setdefault(span.name, {'name': span.name, 'count': 0, 'seconds': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += own[span.span_id]
+    return sorted(totals.values(), key=lambda entry: entry['seconds'], reverse=True)[:top]
+
+
+def render_timeline(console, spans: List[Span], width: int = 24, top: int = 5) -> None:
+    """Print a trace as an indented timeline with bars, followed by its slowest phases."""
+    from rich.table import Table
+
+    if not spans:
+        console.print("[yellow]No trace recorded yet.[/yellow]")
+        return
+    root = spans[0]
+    total = root.duration or max((span.start - root.start) + (span.duration or 0.0) for span in spans) or 1e-9
+    depths = span_depths(spans)
+
+    table = Table(title=f"Turn timeline ({total * 1000:.0f} ms)", title_justify="left")
+    table.add_column("Start ms", justify="right")
+    table.add_column("ms", justify="right")
+    table.add_column("Span", no_wrap=True)
+    table.add_column("Timeline", no_wrap=True)
+    table.add_column("Details", overflow="fold")
+    for span in spans:
+        offset = span.start - root.start
+        duration = span.duration or 0.0
+        begin = min(width - 1, int(offset / total * width))
+        length = max(1, min(width - begin, round(duration / total * width)))
+        bar = ' ' * begin + '█' * length + ' ' * (width - begin - length)
+        details = ', '.join(f"{key}={value}" for key, value in span.attributes.items())
+        table.add_row(f"{offset * 1000:.1f}", f"{duration * 1000:.1f}",
+                      '  ' * depths[span.span_id] + span.name, f"[cyan]{bar}[/cyan]", details)
+    console.print(table)
+
+    summary = Table(title="Slowest phases (self time)", title_justify="left")
+    summary.add_column("Phase")
+    summary.add_column("Calls", justify="right")
+    summary.add_column("ms", justify="right")
+    summary.add_column("Share", justify="right")
+    for entry in slowest_phases(spans, top):
+        summary.add_row(entry['name'], str(entry['count']), f"{entry['seconds'] * 1000:.1f}",
+                        f"{entry['seconds'] / total:.0%}")
+    console.print(summary)
@@ -0,0 +1,128 @@
+import collections
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Fields the Messages API accepts back for each assistant block type
+BLOCK_FIELDS = {
+    "text": ("type", "text"),
+    "tool_use": ("type", "id", "name", "input"),
+    "thinking": ("type", "thinking", "signature"),
+    "redacted_thinking": ("type", "data"),
+}
+
+
+def normalize_block(block: Any) -> Dict[str, Any]:
+    """Convert a response content block (SDK object or dict) into a plain dict."""
+    if not isinstance(block, dict):
+        if hasattr(block, 'model_dump'):
+            block = block.model_dump(exclude_none=True)
+        else:
+            block = {key: getattr(block, key) for key in ("type", "text", "id", "name", "input") if hasattr(block, key)}
+    fields = BLOCK_FIELDS.get(block.get("type"))
+    if fields is None:
+        return block
+    return {key: block[key] for key in fields if key in block}
+
+
+def normalize_content(content: Any) -> Any:
+    """Convert the content of a response into plain dicts, once, before it enters history."""
+    if not isinstance(content, list):
+        return content
+    return [normalize_block(block) for block in content]
+
+
+class TurnRecord:
+    """
+    Summary of one user turn: every model call and tool round it took, how
+    long they took and the tokens they used. Built while the turn runs, so
+    callers read the latest turn directly instead of scanning history.
+    """
+
+    __slots__ = ("turn", "started_at", "seconds", "model_calls", "model_seconds", "tool_seconds",
+                 "tools_used", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+                 "stop_reason")
+
+    def __init__(self, turn: int):
+        self.turn = turn
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+        self.tool_seconds = 0.0
+        self.tools_used: List[str] = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.stop_reason: Optional[str] = None
+
+    def add_step(self, event) -> None:
+        """Fold in a StepEvent from the agent loop."""
+        if event.kind == 'model':
+            self.model_calls += 1
+            self.model_seconds += event.seconds
+            self.stop_reason = event.detail.get('stop_reason', self.stop_reason)
+        else:
+            self.tool_seconds += event.seconds
+            self.tools_used.extend(event.detail.get('tools', []))
+
+    def add_usage(self, usage) -> None:
+        """Fold in the RequestUsage of one model call."""
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.cache_read_tokens += usage.cache_read_tokens
+        self.cache_write_tokens += usage.cache_write_tokens
+
+    def finish(self) -> None:
+        self.seconds = time.time() - self.started_at
+
+    @property
+    def last_tool(self) -> Optional[str]:
+        return self.tools_used[-1] if self.tools_used else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PhaseTimer:
+    """
+    Exclusive wall time per named phase of the assistant ('serialize',
+    'model', 'tool', 'display', ...). Time spent in a nested phase is
+    subtracted from the enclosing one, so the totals add up to the time
+    covered by the outermost phases. Nesting is tracked per thread.
+    """
+
+    def __init__(self):
+        self._totals: Dict[str, float] = collections.defaultdict(float)
+        self._counts: Dict[str, int] = collections.Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # Time of nested phases
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self._totals[name] += elapsed - nested
+                self._counts[name] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self._counts.clear()
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._totals)